@@ -0,0 +1,158 @@
+import os
+import sys
+import csv
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "databases"))
+from criacao_bases import construir_bases
+
+DEFAULT_COMPETENCIA = "202411"
+
+# Header of the professional histories downloaded from the CNES website.
+HISTORY_HEADER = ["COMP.", "CNES", "IBGE", "ESTABELECIMENTO", "CHS AMB.", "CHS OUTRAS", "CHS HOSP.", "DESCRICAO CBO"]
+
+# Municipalities (IBGE codes) of the establishments.
+IBGE_CODES = ["355030", "330455", "310620", "530010", "292740", "410690", "431490", "261160"]
+
+# DESCRICAO CBO values, with their relative frequency. Accents and plural forms appear in the real files.
+CBO_DESCRIPTIONS = [
+    ("MEDICO DA ESTRATEGIA DE SAUDE DA FAMILIA", 4),
+    ("MEDICO CLINICO", 4),
+    ("Médico clínico", 1),
+    ("MEDICOS CLINICOS", 1),
+    ("MEDICO GENERALISTA", 2),
+    ("MEDICO PEDIATRA", 2),
+    ("ENFERMEIRO", 1),
+]
+
+# CHS AMB. values, with their relative frequency. Some lines have an invalid value.
+CHS_VALUES = [("40", 5), ("44", 1), ("30", 2), ("32", 1), ("20", 2), ("24", 1), ("10", 1), ("", 1)]
+
+MONTH_ABBREVIATIONS = ["jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"]
+
+def weighted_choices(pairs):
+    """
+    Expand (value, weight) pairs into a list for random.choice.
+    """
+    return [value for value, weight in pairs for _ in range(weight)]
+
+def format_comp(year, month, style):
+    """
+    Format a COMP. value as "MM/YYYY" (style 0) or "mon/YY" (style 1).
+    """
+    if style == 0:
+        return f"{month:02d}/{year}"
+    return f"{MONTH_ABBREVIATIONS[month - 1]}/{year % 100:02d}"
+
+def generate_establishments(count, rng):
+    """
+    Create the IBGE+CNES keys of the establishments and their services.
+
+    Returns:
+        establishments (list): (ibge, cnes) of each establishment.
+        services (dict): Services (CO_SERVICO) of each IBGE+CNES key listed in the CNES services table.
+            About 10% of the establishments are left out, so they need to be checked online.
+    """
+    establishments = []
+    services = {}
+    for position in range(count):
+        ibge = rng.choice(IBGE_CODES)
+        cnes = str(2000000 + position)
+        establishments.append((ibge, cnes))
+        draw = rng.random()
+        if draw < 0.10:
+            continue
+        unit_services = [rng.randint(100, 158) for _ in range(rng.randint(1, 4))]
+        if draw < 0.50:
+            unit_services.append(159)
+        elif draw < 0.65:
+            unit_services.append(152)
+        elif draw < 0.70:
+            unit_services += [159, 152]
+        services[ibge + cnes] = unit_services
+    return establishments, services
+
+def write_services_csv(path, services):
+    """
+    Write a CNES services CSV (rlEstabServClassAAAAMM.csv) with the services of each establishment.
+    """
+    with open(path, mode="w", encoding="ISO-8859-1", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(["CO_UNIDADE", "CO_SERVICO", "CO_CLASSIFICACAO"])
+        for unit, unit_services in services.items():
+            for service in unit_services:
+                writer.writerow([unit, f"{service:03d}", "001"])
+
+def write_history(path, establishments, years, end_year, rng):
+    """
+    Write the professional history of one person: a few establishments over the years, with 0 to 3 lines
+    per month and both COMP. formats.
+    """
+    cbo_values = weighted_choices(CBO_DESCRIPTIONS)
+    chs_values = weighted_choices(CHS_VALUES)
+    workplaces = rng.sample(establishments, k=min(len(establishments), rng.randint(2, 6)))
+    with open(path, mode="w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(HISTORY_HEADER)
+        for year in range(end_year, end_year - years, -1):
+            for month in range(12, 0, -1):
+                for _ in range(rng.choice((0, 1, 1, 1, 2, 2, 3))):
+                    ibge, cnes = rng.choice(workplaces)
+                    writer.writerow([format_comp(year, month, rng.randint(0, 1)), cnes, ibge, f"UBS {cnes}",
+                                     rng.choice(chs_values), "0", "0", rng.choice(cbo_values)])
+
+def generate_dataset(output_dir, professionals=200, establishments=5000, years=10,
+                     competencia=DEFAULT_COMPETENCIA, seed=42):
+    """
+    Generate a synthetic dataset: the professional histories in output_dir/assets and the establishment
+    databases of the competência in output_dir/databases, built by databases/criacao_bases.py.
+    The same arguments always give the same dataset.
+
+    Args:
+        output_dir (str): Folder of the dataset.
+        professionals (int): Number of professional histories.
+        establishments (int): Number of establishments.
+        years (int): Years covered by each history.
+        competencia (str): Competência (YYYYMM) of the databases.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: Parameters of the dataset.
+    """
+    rng = random.Random(seed)
+    assets_dir = os.path.join(output_dir, "assets")
+    databases_dir = os.path.join(output_dir, "databases")
+    os.makedirs(assets_dir, exist_ok=True)
+    os.makedirs(databases_dir, exist_ok=True)
+
+    establishment_keys, services = generate_establishments(establishments, rng)
+    services_path = os.path.join(databases_dir, f"rlEstabServClass{competencia}.csv")
+    write_services_csv(services_path, services)
+    construir_bases(competencia, services_path, databases_dir)
+
+    end_year = int(competencia[:4])
+    for position in range(professionals):
+        write_history(os.path.join(assets_dir, f"prof{position:06d}.csv"), establishment_keys, years, end_year, rng)
+    logging.info(f"Synthetic dataset written to {output_dir}: {professionals} histories, {establishments} establishments.")
+    return {"professionals": professionals, "establishments": establishments, "years": years,
+            "competencia": competencia, "seed": seed}
+
+def main():
+    """
+    Command line interface of the generator.
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic CNES histories and establishment databases.")
+    parser.add_argument("output_dir", help="Folder of the dataset (assets/ and databases/ are created inside it).")
+    parser.add_argument("--professionals", type=int, default=200, help="Number of professional histories.")
+    parser.add_argument("--establishments", type=int, default=5000, help="Number of establishments.")
+    parser.add_argument("--years", type=int, default=10, help="Years covered by each history.")
+    parser.add_argument("--competencia", default=DEFAULT_COMPETENCIA, help="Competência (YYYYMM) of the databases.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    generate_dataset(args.output_dir, args.professionals, args.establishments, args.years, args.competencia, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import platform
+import importlib.util
+import tempfile
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+from generate_data import generate_dataset, DEFAULT_COMPETENCIA
+import utils
+import main as cli
+import async_verifier
+import establishment_validator
+from processing import process_csv, read_history
+from lookup_cache import configure_lookup_cache, VERDICT_NOT_LISTED
+from establishment_index import (load_establishment_index, read_establishment_index, set_establishment_index,
+                                 configure_competencia, database_paths)
+from establishment_snapshot import snapshot_path, masks_from_index, write_snapshot
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# A benchmark more than this much slower than the baseline is reported as a regression.
+REGRESSION_THRESHOLD = 1.10
+
+def stub_online_checks(latency=0.0):
+    """
+    Replace the checks on the CNES website with a stub that answers "not listed" after `latency` seconds,
+    and disable the cache of verdicts, so every run does the same work without network access.
+    """
+    def fetch_verdict(cnes, establishment_name):
+        if latency:
+            time.sleep(latency)
+        return VERDICT_NOT_LISTED
+    establishment_validator.fetch_verdict = fetch_verdict
+    async_verifier.fetch_verdict = fetch_verdict
+    configure_lookup_cache(enabled=False)
+
+def measure(function, repeat, setup=None):
+    """
+    Run a function `repeat` times and return its wall times, in seconds.
+    The optional setup function runs before each run and is not timed.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def summarize(times, items):
+    """
+    Summarize the wall times of a benchmark that handles `items` items per run.
+    """
+    best = min(times)
+    return {
+        "runs": len(times),
+        "items": items,
+        "min": best,
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "per_item_us": best / items * 1e6 if items else None,
+        "times": times
+    }
+
+def read_comp_values(file_paths):
+    """
+    Return the COMP. values of the histories, in file order.
+    """
+    values = []
+    for file_path in file_paths:
+        with open(file_path, mode="r", encoding="utf-8", newline="") as file:
+            values.extend(row["COMP."] for row in csv.DictReader(file, delimiter=";"))
+    return values
+
+def read_unit_keys(databases_dir, competencia):
+    """
+    Return the IBGE+CNES keys of the CNES services table.
+    """
+    _, services_db = database_paths(competencia, databases_dir)
+    with sqlite3.connect(services_db) as connection:
+        return [row[0] for row in connection.execute("SELECT DISTINCT CO_UNIDADE FROM tabela_dados")]
+
+def sqlite_lookups(databases_dir, competencia, keys):
+    """
+    Classify each key with one query per database, as check_establishment_SQL did before the in-memory index.
+    """
+    valid_db, services_db = database_paths(competencia, databases_dir)
+    with sqlite3.connect(valid_db) as valid_connection, sqlite3.connect(services_db) as services_connection:
+        for key in keys:
+            if valid_connection.execute("SELECT 1 FROM serv159152 WHERE valor = ?", (key,)).fetchone() is None:
+                services_connection.execute("SELECT 1 FROM tabela_dados WHERE CO_UNIDADE = ? LIMIT 1", (key,)).fetchone()
+
+def check_files(file_paths):
+    """
+    Run check_establishment on each history.
+    """
+    for file_path in file_paths:
+        with open(file_path, mode="r", encoding="utf-8", newline="") as file:
+            establishment_validator.check_establishment(csv.DictReader(file, delimiter=";"))
+
+def process_files(file_paths, output_dir):
+    """
+    Run process_csv on each history, writing the filtered files to output_dir.
+    """
+    overall_result = {}
+    for file_path in file_paths:
+        process_csv(file_path, overall_result, os.path.join(output_dir, os.path.basename(file_path)))
+
+def numpy_available():
+    """
+    Return True if NumPy, needed by the batch engine, is installed.
+    """
+    return importlib.util.find_spec("numpy") is not None
+
+def run_benchmarks(data_dir, competencia, repeat, workers):
+    """
+    Run every benchmark on a dataset.
+
+    Returns:
+        dict: Summary of each benchmark.
+    """
+    assets_dir = os.path.join(data_dir, "assets")
+    databases_dir = os.path.join(data_dir, "databases")
+    output_dir = tempfile.mkdtemp(prefix="bench_output_")
+    file_paths = sorted(cli.list_csv_files(assets_dir))
+    configure_competencia(competencia)
+    results = {}
+
+    try:
+        comp_values = [value for value in read_comp_values(file_paths) if utils.parse_month(value) is not None]
+        results["parse_date_cold"] = summarize(
+            measure(lambda: [utils.parse_date(value) for value in comp_values], repeat,
+                    setup=utils._month_keys.clear), len(comp_values))
+        results["parse_date_warm"] = summarize(
+            measure(lambda: [utils.parse_date(value) for value in comp_values], repeat), len(comp_values))
+
+        keys = read_unit_keys(databases_dir, competencia)
+        results["sqlite_lookup"] = summarize(
+            measure(lambda: sqlite_lookups(databases_dir, competencia, keys), repeat), len(keys))
+
+        results["index_load_sqlite"] = summarize(
+            measure(lambda: read_establishment_index(databases_dir, competencia, use_snapshot=False), repeat), 1)
+        # The mapped load uses a snapshot written from the databases. The snapshot of the dataset, if any,
+        # is moved aside meanwhile and put back afterwards.
+        index = read_establishment_index(databases_dir, competencia, use_snapshot=False)
+        snapshot = snapshot_path(competencia, databases_dir)
+        backup = snapshot + ".bench"
+        had_snapshot = os.path.exists(snapshot)
+        if had_snapshot:
+            os.replace(snapshot, backup)
+        try:
+            write_snapshot(snapshot, masks_from_index(index), competencia)
+            results["index_load_snapshot"] = summarize(
+                measure(lambda: load_establishment_index(databases_dir, competencia), repeat), 1)
+        finally:
+            if had_snapshot:
+                os.replace(backup, snapshot)
+            elif os.path.exists(snapshot):
+                os.remove(snapshot)
+        # The other benchmarks use the index read from SQLite, whether or not the dataset has a snapshot.
+        set_establishment_index(index)
+
+        results["index_classify"] = summarize(
+            measure(lambda: [establishment_validator.check_establishment_SQL(key) for key in keys], repeat), len(keys))
+        results["read_history"] = summarize(
+            measure(lambda: [read_history(file_path) for file_path in file_paths], repeat), len(file_paths))
+        results["check_establishment"] = summarize(measure(lambda: check_files(file_paths), repeat), len(file_paths))
+        results["process_csv"] = summarize(measure(lambda: process_files(file_paths, output_dir), repeat), len(file_paths))
+
+        results["end_to_end_serial"] = summarize(
+            measure(lambda: cli.process_files(assets_dir, {}, output_dir), repeat), len(file_paths))
+        verify_options = {"concurrency": async_verifier.DEFAULT_CONCURRENCY, "rate": 0}
+        results["end_to_end_parallel"] = summarize(
+            measure(lambda: cli.process_files_parallel(assets_dir, {}, workers, verify_options, output_dir), repeat),
+            len(file_paths))
+        if numpy_available():
+            results["end_to_end_batch"] = summarize(
+                measure(lambda: cli.process_files_batch(assets_dir, {}, verify_options, output_dir), repeat),
+                len(file_paths))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+def current_commit():
+    """
+    Return the git commit of the working tree, or None if it is not available.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(baseline_path, results):
+    """
+    Print the ratio between the best time of each benchmark and the best time in a baseline results file.
+
+    Returns:
+        list: Names of the benchmarks slower than the baseline by more than REGRESSION_THRESHOLD.
+    """
+    with open(baseline_path, mode="r", encoding="utf-8") as file:
+        baseline = json.load(file)["benchmarks"]
+    regressions = []
+    print(f"{'benchmark':<24}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        ratio = summary["min"] / baseline[name]["min"] if baseline[name]["min"] else float("inf")
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            regressions.append(name)
+            flag = "  slower"
+        print(f"{name:<24}{baseline[name]['min']:>12.4f}{summary['min']:>12.4f}{ratio:>8.2f}{flag}")
+    return regressions
+
+def main():
+    """
+    Command line interface of the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the eligibility pipeline on synthetic data.")
+    parser.add_argument("--data", default=None,
+                        help="Folder of a dataset made by generate_data.py. By default, a temporary one is generated.")
+    parser.add_argument("--professionals", type=int, default=200, help="Number of histories of the generated dataset.")
+    parser.add_argument("--establishments", type=int, default=5000,
+                        help="Number of establishments of the generated dataset.")
+    parser.add_argument("--years", type=int, default=10, help="Years covered by each generated history.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated dataset.")
+    parser.add_argument("--competencia", default=DEFAULT_COMPETENCIA, help="Competência (YYYYMM) of the databases.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark.")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes of the parallel end-to-end run.")
+    parser.add_argument("--online-latency", type=float, default=0.0,
+                        help="Seconds taken by each stubbed check on the CNES website.")
+    parser.add_argument("--output", default=None,
+                        help="Results file (default: benchmarks/results/bench_YYYYMMDD_HHMMSS.json).")
+    parser.add_argument("--compare", default=None, help="Results file of a previous run to compare with.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    stub_online_checks(args.online_latency)
+
+    temporary_dir = None
+    data_dir = args.data
+    if data_dir is None:
+        temporary_dir = data_dir = tempfile.mkdtemp(prefix="bench_data_")
+        scale = generate_dataset(data_dir, args.professionals, args.establishments, args.years,
+                                 args.competencia, args.seed)
+    else:
+        scale = {"data": os.path.abspath(data_dir), "competencia": args.competencia}
+
+    try:
+        results = run_benchmarks(data_dir, args.competencia, max(1, args.repeat), args.workers)
+    finally:
+        if temporary_dir is not None:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "online_latency": args.online_latency,
+        "benchmarks": results
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, time.strftime("bench_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, mode="w", encoding="utf-8") as file:
+        json.dump(report, file, indent=1)
+
+    for name, summary in results.items():
+        print(f"{name:<24}{summary['min']:>10.4f} s  ({summary['items']} items)")
+    print(f"Results written to {output_path}")
+    if args.compare:
+        regressions = compare_results(args.compare, results)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main()
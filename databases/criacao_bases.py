@@ -0,0 +1,131 @@
+import os
+import csv
+import sqlite3
+import argparse
+import time
+
+# Pasta dos bancos de dados (a mesma deste script)
+pasta_bancos = os.path.dirname(os.path.abspath(__file__))
+
+# Colunas do CSV de serviços do CNES usadas pelo validador
+COLUNA_UNIDADE = "CO_UNIDADE"
+COLUNA_SERVICO = "CO_SERVICO"
+
+# Serviços que tornam o estabelecimento válido
+SERVICOS_VALIDOS = (159, 152)
+
+# Quantidade de linhas inseridas por executemany
+TAMANHO_LOTE = 50000
+
+def nomes_bancos(competencia):
+    """
+    Retorna os nomes dos bancos de dados de uma competência (AAAAMM).
+    """
+    return f"estabelecimentos_{competencia}.db", f"estab_{competencia}_159_152.db"
+
+def abrir_banco_construcao(caminho):
+    """
+    Cria um banco de dados vazio configurado para uma carga rápida.
+    O banco só é usado depois de completo, então o journal e a sincronização podem ser desligados.
+    """
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    conexao = sqlite3.connect(caminho, isolation_level=None)
+    conexao.execute("PRAGMA journal_mode = OFF")
+    conexao.execute("PRAGMA synchronous = OFF")
+    conexao.execute("PRAGMA temp_store = MEMORY")
+    conexao.execute("PRAGMA cache_size = -200000")
+    return conexao
+
+def ler_servicos(caminho_csv):
+    """
+    Lê o CSV de serviços do CNES em streaming, gerando apenas os pares (CO_UNIDADE, CO_SERVICO).
+    """
+    with open(caminho_csv, mode="r", encoding="ISO-8859-1", newline="") as arquivo:
+        leitor = csv.reader(arquivo, delimiter=";")
+        cabecalho = [coluna.strip() for coluna in next(leitor)]
+        try:
+            indice_unidade = cabecalho.index(COLUNA_UNIDADE)
+            indice_servico = cabecalho.index(COLUNA_SERVICO)
+        except ValueError:
+            raise ValueError(f"O arquivo {caminho_csv} não tem as colunas {COLUNA_UNIDADE} e {COLUNA_SERVICO}.")
+        for linha in leitor:
+            if len(linha) <= max(indice_unidade, indice_servico):
+                continue
+            unidade = linha[indice_unidade].strip()
+            servico = linha[indice_servico].strip()
+            if unidade and servico.isdigit():
+                yield unidade, int(servico)
+
+def construir_bases(competencia, caminho_csv=None, pasta_saida=pasta_bancos):
+    """
+    Constrói, em uma única passagem pelo CSV, os dois bancos usados pelo validador:
+    - estabelecimentos_AAAAMM.db: tabela_dados com os pares (CO_UNIDADE, CO_SERVICO), indexada por CO_UNIDADE.
+    - estab_AAAAMM_159_152.db: serv159152 com os estabelecimentos que oferecem os serviços 159 ou 152.
+    Os bancos são escritos em arquivos temporários e só substituem os anteriores no final.
+    """
+    if caminho_csv is None:
+        caminho_csv = os.path.join(pasta_bancos, f"rlEstabServClass{competencia}.csv")
+    nome_estabelecimentos, nome_159_152 = nomes_bancos(competencia)
+    caminho_estabelecimentos = os.path.join(pasta_saida, nome_estabelecimentos)
+    caminho_159_152 = os.path.join(pasta_saida, nome_159_152)
+    inicio = time.time()
+
+    # Carregar os pares (CO_UNIDADE, CO_SERVICO) em lotes, dentro de uma única transação.
+    # A chave primária descarta as repetições e serve de índice para as consultas por CO_UNIDADE.
+    conexao = abrir_banco_construcao(caminho_estabelecimentos + ".tmp")
+    conexao.execute("""
+    CREATE TABLE tabela_dados (
+        CO_UNIDADE TEXT NOT NULL,
+        CO_SERVICO INTEGER NOT NULL,
+        PRIMARY KEY (CO_UNIDADE, CO_SERVICO)
+    ) WITHOUT ROWID
+    """)
+    unidades_validas = set()
+    total_linhas = 0
+    lote = []
+    conexao.execute("BEGIN")
+    for unidade, servico in ler_servicos(caminho_csv):
+        lote.append((unidade, servico))
+        if servico in SERVICOS_VALIDOS:
+            unidades_validas.add(unidade)
+        if len(lote) >= TAMANHO_LOTE:
+            conexao.executemany("INSERT OR IGNORE INTO tabela_dados VALUES (?, ?)", lote)
+            total_linhas += len(lote)
+            lote = []
+    conexao.executemany("INSERT OR IGNORE INTO tabela_dados VALUES (?, ?)", lote)
+    total_linhas += len(lote)
+    conexao.execute("COMMIT")
+    conexao.execute("CREATE INDEX idx_tabela_dados_servico ON tabela_dados (CO_SERVICO)")
+    conexao.execute("ANALYZE")
+    conexao.close()
+
+    # Salvar os estabelecimentos com os serviços 159 ou 152.
+    conexao = abrir_banco_construcao(caminho_159_152 + ".tmp")
+    conexao.execute("""
+    CREATE TABLE serv159152 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        valor TEXT UNIQUE
+    )
+    """)
+    conexao.execute("BEGIN")
+    conexao.executemany("INSERT OR IGNORE INTO serv159152 (valor) VALUES (?)",
+                        ((unidade,) for unidade in sorted(unidades_validas)))
+    conexao.execute("COMMIT")
+    conexao.close()
+
+    # Substituir os bancos anteriores apenas depois que os dois estão completos.
+    os.replace(caminho_estabelecimentos + ".tmp", caminho_estabelecimentos)
+    os.replace(caminho_159_152 + ".tmp", caminho_159_152)
+
+    print(f"{total_linhas} linhas lidas de {caminho_csv} em {time.time() - inicio:.1f} segundos.")
+    print(f"{len(unidades_validas)} estabelecimentos com os serviços 159 ou 152.")
+    print(f"Bancos salvos: '{caminho_estabelecimentos}' e '{caminho_159_152}'")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Constrói os bancos de estabelecimentos a partir do CSV de serviços do CNES.")
+    parser.add_argument("competencia", help="Competência do CSV, no formato AAAAMM (ex.: 202411).")
+    parser.add_argument("--csv", default=None, help="Caminho do CSV rlEstabServClassAAAAMM.csv (padrão: nesta pasta).")
+    parser.add_argument("--saida", default=pasta_bancos, help="Pasta onde os bancos são salvos (padrão: nesta pasta).")
+    args = parser.parse_args()
+    construir_bases(args.competencia, args.csv, args.saida)
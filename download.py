@@ -0,0 +1,57 @@
+import os
+import sys
+import argparse
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from main import setup_logging, get_assets_path
+from downloader import (download_histories, HISTORY_URL_TEMPLATE, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT,
+                        DEFAULT_RETRIES)
+
+def parse_arguments():
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Download the professional histories listed in hist_to_download.csv.")
+    parser.add_argument("--list", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "hist_to_download.csv"),
+                        help="CSV file with the CPF and the name of each professional (default: hist_to_download.csv).")
+    parser.add_argument("--url-template", default=HISTORY_URL_TEMPLATE,
+                        help="Address of a history, with the placeholders {cpf} and {name} "
+                             "(default: the CNES_HISTORY_URL environment variable).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of downloads running at the same time.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds allowed for each download.")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help="Retries of a download after a connection or server error.")
+    parser.add_argument("--journal", default=None,
+                        help="Journal of the finished downloads (default: assets/download_journal.jsonl).")
+    parser.add_argument("--process", action="store_true",
+                        help="Process each history as soon as it is downloaded and write overall_result.csv at the end.")
+    parser.add_argument("--output-dir", default=None,
+                        help="Folder of the filtered files when --process is used. By default, the files are rewritten in place.")
+    parser.add_argument("--reprocess", action="store_true",
+                        help="With --process, process again the histories already rewritten in place by a previous run.")
+    args = parser.parse_args()
+    if not args.url_template:
+        parser.error("the address of the histories is not configured: set CNES_HISTORY_URL or use --url-template.")
+    try:
+        url = args.url_template.format(cpf="00000000000", name="")
+    except (KeyError, IndexError, ValueError) as e:
+        parser.error(f"invalid address of the histories {args.url_template!r}: only {{cpf}} and {{name}} can be used ({e}).")
+    if "{cpf}" not in args.url_template or urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+        parser.error(f"invalid address of the histories {args.url_template!r}: an http(s) address with {{cpf}} is expected.")
+    return args
+
+def main():
+    """
+    Download the histories, resuming from the journal of a previous run.
+    """
+    args = parse_arguments()
+    setup_logging()
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    download_histories(args.list, get_assets_path(), args.url_template, args.concurrency, args.timeout,
+                       max(0, args.retries), args.journal, args.process, args.output_dir, args.reprocess)
+
+if __name__ == "__main__":
+    main()
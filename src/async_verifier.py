@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from establishment_validator import cached_verdict, fetch_verdict
+from lookup_cache import verdict_services
+
+# Default limits of the concurrent checks on the CNES website.
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 2.0  # Checks started per second.
+DEFAULT_TIMEOUT = 60.0  # Seconds.
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0  # Seconds, doubled at each retry.
+
+class TokenBucket:
+    """
+    Token bucket limiting how many checks are started per second, with bursts of up to `capacity` checks.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+async def _verify(establishment, semaphore, bucket, timeout, retries, backoff):
+    """
+    Check one establishment, retrying with exponential backoff.
+
+    Returns:
+        int: Services mask (SERVICE_159 and SERVICE_152 bits) of the establishment, 0 if it offers neither,
+            or None if every attempt failed, so that its verdict is unknown.
+    """
+    _, cnes, establishment_name = establishment
+    verdict = cached_verdict(cnes, establishment_name)
+    if verdict is not None:
+        return verdict_services(verdict)
+
+    for attempt in range(retries + 1):
+        await semaphore.acquire()
+        await bucket.acquire()
+        # The checks are blocking, so each one runs in a thread of the default executor. The thread of
+        # an attempt that timed out cannot be interrupted, so its slot is released only when it finishes.
+        check = asyncio.ensure_future(asyncio.to_thread(fetch_verdict, cnes, establishment_name))
+        check.add_done_callback(lambda task: _release(task, semaphore))
+        try:
+            verdict = await asyncio.wait_for(asyncio.shield(check), timeout)
+            return verdict_services(verdict)
+        except asyncio.TimeoutError:
+            logging.warning(f"Check of the establishment {cnes} timed out (attempt {attempt + 1}).")
+        except Exception as e:
+            logging.warning(f"Error checking establishment {cnes} (attempt {attempt + 1}): {e}")
+        if attempt < retries:
+            await asyncio.sleep(backoff * 2 ** attempt)
+    return None
+
+def _release(check, semaphore):
+    # The error of a check that timed out is retrieved here, as nothing awaits it anymore.
+    semaphore.release()
+    if not check.cancelled():
+        check.exception()
+
+async def verify_establishments_async(establishments, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE,
+                                      timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    Check establishments on the CNES website concurrently.
+
+    Args:
+        establishments (iterable): (ibge_cnes, cnes, establishment_name) tuples, possibly repeated across files.
+        concurrency (int): Maximum number of checks running at the same time, including the attempts that
+            timed out and whose thread has not finished yet.
+        rate (float): Maximum number of checks started per second. 0 disables the limit.
+        timeout (float): Seconds allowed for each attempt.
+        retries (int): Attempts repeated after a failure or a timeout.
+        backoff (float): Seconds waited before the first retry, doubled at each retry.
+
+    Returns:
+        verdicts (dict): Services mask (SERVICE_159 and SERVICE_152 bits) of the establishment of each IBGE+CNES,
+            or None if it could not be checked.
+    """
+    unique = {}
+    for establishment in establishments:
+        unique.setdefault(establishment[0], establishment)
+    if not unique:
+        return {}
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    bucket = TokenBucket(rate)
+    # The default executor has a thread for each concurrent check.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(1, concurrency)))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_verify(establishment, semaphore, bucket, timeout, retries, backoff)
+                                     for establishment in unique.values()))
+    logging.info(f"Checked {len(unique)} establishments on the CNES website in {time.perf_counter() - start:.2f} seconds.")
+    return dict(zip(unique.keys(), results))
+
+def verify_establishments(establishments, **options):
+    """
+    Synchronous entry point of verify_establishments_async.
+    """
+    return asyncio.run(verify_establishments_async(establishments, **options))
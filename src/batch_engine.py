@@ -0,0 +1,265 @@
+import logging
+import numpy as np
+from processing import (HistoryColumns, CSV_ERRORS, log_csv_error, read_history, evaluate_history, mark_establishments,
+                        write_valid_lines)
+from rulesets import get_rulesets
+from establishment_validator import classify_establishments, add_online_services
+from establishment_history import get_establishment_history
+from establishment_index import APS_SERVICES
+from async_verifier import verify_establishments
+from instrumentation import file_scope, timer
+
+# Stride between the month keys of two professionals in the group keys.
+MONTH_STRIDE = 1 << 20
+
+class HistoryTable:
+    """
+    Columnar view of the lines that may be valid across many professional histories.
+    Row i is records[i]; profs[i] is the position of its file in file_paths. The rows of each file are
+    contiguous, from offsets[position] to offsets[position + 1].
+    """
+
+    def __init__(self, file_paths, fieldnames, records, offsets, profs, months, chs_amb, roles, cnes):
+        self.file_paths = file_paths
+        self.fieldnames = fieldnames
+        self.records = records
+        self.offsets = offsets
+        self.profs = profs
+        self.months = months  # -1 where COMP. is unknown.
+        self.chs_amb = chs_amb
+        self.roles = roles
+        self.cnes = cnes
+
+    def __len__(self):
+        return len(self.records)
+
+    def file_records(self, position):
+        """
+        Return the HistoryRecord of the lines of a file.
+        """
+        return self.records[self.offsets[position]:self.offsets[position + 1]]
+
+def load_table(file_paths, file_records):
+    """
+    Concatenate the parsed histories into one HistoryTable.
+
+    Args:
+        file_paths (list): Paths of the files, in order.
+        file_records (dict): (fieldnames, records, columns) of each file path, the HistoryColumns filled
+            while parsing.
+    """
+    records = []
+    lengths = []
+    months = []
+    chs_amb = []
+    roles = []
+    cnes = []
+    for file_path in file_paths:
+        _, file_lines, columns = file_records[file_path]
+        records.extend(file_lines)
+        lengths.append(len(file_lines))
+        months.extend(columns.months)
+        chs_amb.extend(columns.chs_amb)
+        roles.extend(columns.roles)
+        cnes.extend(columns.cnes)
+    profs = np.repeat(np.arange(len(file_paths), dtype=np.int64), lengths)
+    fieldnames = [file_records[file_path][0] for file_path in file_paths]
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    return HistoryTable(file_paths, fieldnames, records, offsets, profs, np.array(months, dtype=np.int64),
+                        np.array(chs_amb, dtype=np.float64), np.array(roles, dtype=np.int8), np.array(cnes, dtype=str))
+
+def establishment_mask(table, valid_cnes, services=APS_SERVICES):
+    """
+    Return True for each row whose establishment is valid for its file.
+
+    Args:
+        table (HistoryTable): Lines of all files.
+        valid_cnes (list): CNES accepted by the primary rule set for each file, in the order of table.file_paths.
+        services (int): Services mask of the services accepted by the rule set.
+    """
+    history = get_establishment_history()
+    if history is not None:
+        # The history judges each line by its month, so it is applied line by line.
+        for position, file_cnes in enumerate(valid_cnes):
+            mark_establishments(table.file_records(position), set(file_cnes), services)
+        return np.fromiter((record.aps for record in table.records), dtype=bool, count=len(table))
+
+    if not len(table):
+        return np.zeros(0, dtype=bool)
+    # Encode each CNES as an integer, and each (file, CNES) pair as file * codes + CNES.
+    unique_cnes, codes = np.unique(table.cnes, return_inverse=True)
+    valid_pairs = []
+    for position, file_cnes in enumerate(valid_cnes):
+        file_cnes = np.array(sorted(set(file_cnes)), dtype=str)
+        places = np.searchsorted(unique_cnes, file_cnes)
+        found = places < len(unique_cnes)
+        found[found] = unique_cnes[places[found]] == file_cnes[found]
+        valid_pairs.append(position * len(unique_cnes) + places[found])
+    valid_pairs = np.concatenate(valid_pairs) if valid_pairs else np.zeros(0, dtype=np.int64)
+    return np.isin(table.profs * len(unique_cnes) + codes, valid_pairs)
+
+def first_per_group(rows, groups, limit):
+    """
+    Keep, in row order, the first `limit` rows of each group.
+
+    Args:
+        rows (ndarray): Row positions, in increasing order.
+        groups (ndarray): Group key of each row of `rows`.
+        limit (int): Maximum number of rows kept per group.
+    """
+    if not len(rows):
+        return rows
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    positions = np.arange(len(rows))
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    rank = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    return np.sort(rows[order[rank < limit]])
+
+def select_lines(table, aps, ruleset):
+    """
+    Apply a rule set to every row at once, as RuleSet.count does line by line.
+
+    Args:
+        table (HistoryTable): Lines of all files.
+        aps (ndarray): True for each row whose establishment is valid for the rule set.
+        ruleset (RuleSet): Rule set applied.
+
+    Returns:
+        list: Rows counted in each band, in the order of ruleset.bands: one per professional and month
+            for an exclusive band, at most monthly_cap per professional and month for the others.
+    """
+    accepted = np.isin(table.roles, [int(role) for role in ruleset.any_roles])
+    accepted |= np.isin(table.roles, [int(role) for role in ruleset.establishment_roles]) & aps
+    groups = table.profs * MONTH_STRIDE + (table.months + 1)
+    # Position of the band of each row, the first one whose min_hours is reached, or -1 below every band.
+    band_of = np.full(len(table), -1, dtype=np.int64)
+    for position in reversed(range(len(ruleset.bands))):
+        band_of[table.chs_amb >= ruleset.bands[position].min_hours] = position
+
+    selected = [None] * len(ruleset.bands)
+    # Months counted in an exclusive band do not count the lines of the bands below.
+    blocked = np.zeros(0, dtype=np.int64)
+    for position, band in enumerate(ruleset.bands):
+        if band.exclusive:
+            rows = np.flatnonzero(accepted & (band_of == position) & ~np.isin(groups, blocked))
+            _, first = np.unique(groups[rows], return_index=True)
+            selected[position] = np.sort(rows[first])
+            blocked = np.concatenate((blocked, groups[selected[position]]))
+    for position, band in enumerate(ruleset.bands):
+        if not band.exclusive:
+            rows = np.flatnonzero(accepted & (band_of == position) & ~np.isin(groups, blocked))
+            selected[position] = first_per_group(rows, groups[rows], band.monthly_cap)
+    return selected
+
+def score_table(table, valid_cnes, overall_result, output_paths=None):
+    """
+    Score every file of a HistoryTable, write their valid lines and store their results.
+
+    Args:
+        table (HistoryTable): Lines of all files.
+        valid_cnes (list): Services mask of each valid CNES of each file, in the order of table.file_paths.
+        overall_result (dict): Dictionary to store the results of all files.
+        output_paths (dict): Path of the filtered copy of each file. By default, the files are rewritten in place.
+
+    Returns:
+        valid_months (dict): Number of valid months of each file.
+    """
+    output_paths = output_paths or {}
+    rulesets = get_rulesets()
+    ruleset = rulesets[0]
+    # The arrays give the results of the primary rule set; with other rule sets, the files are scored line by line.
+    several = len(rulesets) > 1
+    accepted_cnes = [{cnes for cnes, services in file_cnes.items() if ruleset.accepts_services(services)}
+                     for file_cnes in valid_cnes]
+    aps = establishment_mask(table, accepted_cnes, ruleset.services) if not several else np.zeros(len(table), dtype=bool)
+    selected_bands = select_lines(table, aps, ruleset)
+    files = len(table.file_paths)
+    counts = [np.bincount(table.profs[rows], minlength=files) for rows in selected_bands]
+
+    # Valid lines of each file, sorted by date in descending order and then in file order.
+    selected = np.concatenate(selected_bands)
+    selected = selected[np.lexsort((selected, -table.months[selected], table.profs[selected]))]
+    bounds = np.searchsorted(table.profs[selected], np.arange(files + 1))
+    unknown_month = np.bincount(table.profs[selected[table.months[selected] < 0]], minlength=files)
+
+    valid_months = {}
+    for position, file_path in enumerate(table.file_paths):
+        output_path = output_paths.get(file_path)
+        fieldnames = table.fieldnames[position]
+        try:
+            if unknown_month[position] or fieldnames is None or several:
+                # Let the line by line rules raise the same error as a serial run.
+                valid_months[file_path] = evaluate_history(file_path, fieldnames, table.file_records(position),
+                                                           valid_cnes[position], overall_result, output_path)
+                continue
+            valid_lines = [table.records[row] for row in selected[bounds[position]:bounds[position + 1]]]
+            write_valid_lines(file_path, fieldnames, valid_lines, output_path)
+            valid_months[file_path], overall_result[file_path] = ruleset.result(
+                [int(band_counts[position]) for band_counts in counts])
+        except CSV_ERRORS as e:
+            log_csv_error(file_path, e)
+            valid_months[file_path] = 0
+        except Exception as e:
+            # As in process_files, an unexpected error only skips its own file.
+            logging.error(f"Error processing file {file_path}: {e}")
+    return valid_months
+
+def score_batch(file_paths, overall_result, output_paths=None, verify_options=None, unresolved=None):
+    """
+    Score many professional histories at once: the files are parsed into one HistoryTable, the establishments
+    missing from the databases are checked once for the whole batch, and the eligibility rules are applied
+    to all lines with array operations.
+
+    Args:
+        file_paths (list): Paths of the CSV files.
+        overall_result (dict): Dictionary to store the results of all files.
+        output_paths (dict): Path of the filtered copy of each file. By default, the files are rewritten in place.
+        verify_options (dict): Options of async_verifier.verify_establishments.
+        unresolved (dict): Dictionary to store, for the files with some, the establishments whose check on the
+            CNES website failed, which are counted as not valid. None to skip it.
+
+    Returns:
+        valid_months (dict): Number of valid months of each file, 0 for the files that could not be read.
+            The files that failed with an unexpected error are left out, as in process_files.
+    """
+    file_records = {}
+    file_establishments = {}
+    valid_months = {}
+    for file_path in file_paths:
+        columns = HistoryColumns()
+        try:
+            with file_scope(file_path):
+                with timer("parse"):
+                    fieldnames, records, establishments = read_history(file_path, columns)
+                with timer("resolve"):
+                    file_establishments[file_path] = classify_establishments(establishments)
+        except CSV_ERRORS as e:
+            log_csv_error(file_path, e)
+            valid_months[file_path] = 0
+            continue
+        except Exception as e:
+            logging.error(f"Error processing file {file_path}: {e}")
+            continue
+        file_records[file_path] = (fieldnames, records, columns)
+    loaded_paths = [file_path for file_path in file_paths if file_path in file_records]
+
+    # Check each establishment that is not in the databases only once for the whole batch.
+    online_verdicts = verify_establishments(
+        (establishment for _, pending in file_establishments.values() for establishment in pending),
+        **(verify_options or {}))
+    valid_cnes = []
+    for file_path in loaded_paths:
+        file_cnes, pending = file_establishments[file_path]
+        valid_cnes.append(add_online_services(file_cnes, pending, online_verdicts))
+        failed = [establishment for establishment in pending if online_verdicts.get(establishment[0]) is None]
+        if failed and unresolved is not None:
+            unresolved[file_path] = failed
+
+    with timer("batch_load"):
+        table = load_table(loaded_paths, file_records)
+    logging.info(f"Batch of {len(loaded_paths)} files loaded with {len(table)} lines.")
+    with timer("batch_score"):
+        valid_months.update(score_table(table, valid_cnes, overall_result, output_paths))
+    return valid_months
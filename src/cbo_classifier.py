@@ -0,0 +1,117 @@
+import json
+import enum
+import logging
+import threading
+import unicodedata
+from instrumentation import count
+
+class CboRole(enum.IntEnum):
+    """
+    Roles of the DESCRICAO CBO values that matter for the eligibility rules.
+    """
+    OTHER = 0
+    FAMILY_DOCTOR = 1  # Valid in any establishment.
+    CLINICIAN = 2  # Valid only in APS establishments.
+    GENERALIST = 3  # Valid only in APS establishments.
+
+# Roles whose lines are valid only in the establishments that offer the service 159 or 152.
+ESTABLISHMENT_ROLES = frozenset((CboRole.CLINICIAN, CboRole.GENERALIST))
+
+# Default rules, checked in order: the first rule whose terms are all in the description gives the role.
+DEFAULT_RULES = [
+    {"role": "FAMILY_DOCTOR", "terms": ["MEDICO", "FAMILIA"]},
+    {"role": "CLINICIAN", "terms": ["MEDICO", "CLINICO"]},
+    {"role": "CLINICIAN", "terms": ["MEDICOS", "CLINICO"]},
+    {"role": "GENERALIST", "terms": ["MEDICO", "GENERALISTA"]}
+]
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def normalize_description(description):
+    """
+    Convert a description to uppercase without accents (e.g. "Médico" becomes "MEDICO").
+    """
+    decomposed = unicodedata.normalize("NFKD", description.upper())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+class CboClassifier:
+    """
+    Maps a raw DESCRICAO CBO value to a CboRole. Each distinct description is classified only once.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = [(CboRole[rule["role"]], tuple(normalize_description(term) for term in rule["terms"]))
+                      for rule in rules]
+        self._cache = {}
+
+    def classify(self, description):
+        """
+        Args:
+            description (str): Value of the column DESCRICAO CBO.
+
+        Returns:
+            CboRole: Role of the description.
+        """
+        role = self._cache.get(description)
+        if role is None:
+            normalized = normalize_description(description)
+            role = CboRole.OTHER
+            for rule_role, terms in self.rules:
+                if all(term in normalized for term in terms):
+                    role = rule_role
+                    break
+            self._cache[description] = role
+            count("cbo_descriptions_classified")
+        return role
+
+def load_cbo_rules(path):
+    """
+    Load the classification rules from a JSON file with the format of DEFAULT_RULES,
+    either as a list or as {"rules": [...]}.
+
+    Raises:
+        ValueError: If the file is not valid.
+    """
+    with open(path, mode='r', encoding='utf-8') as file:
+        data = json.load(file)
+    rules = data.get("rules") if isinstance(data, dict) else data
+    if not isinstance(rules, list):
+        raise ValueError(f"The CBO rules file {path} must contain a list of rules.")
+    for rule in rules:
+        if not isinstance(rule, dict) or rule.get("role") not in CboRole.__members__ or not rule.get("terms"):
+            raise ValueError(f"Invalid CBO rule in {path}: {rule}")
+    return rules
+
+def configure_cbo_classifier(rules_path=None):
+    """
+    Replace the process-wide classifier, using the rules of a JSON file or the default rules.
+    """
+    rules = load_cbo_rules(rules_path) if rules_path else DEFAULT_RULES
+    set_cbo_classifier(CboClassifier(rules))
+    if rules_path:
+        logging.info(f"CBO rules loaded from {rules_path}.")
+
+def set_cbo_classifier(classifier):
+    """
+    Make a classifier the process-wide one.
+    """
+    global _classifier
+    with _classifier_lock:
+        _classifier = classifier
+
+def classify_cbo(description):
+    """
+    Classify a DESCRICAO CBO value with the process-wide classifier.
+
+    Returns:
+        CboRole: Role of the description.
+    """
+    global _classifier
+    classifier = _classifier
+    if classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = CboClassifier()
+            classifier = _classifier
+    return classifier.classify(description)
@@ -0,0 +1,126 @@
+import os
+import urllib.parse
+import logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from driver_pool import get_driver_pool
+from establishment_index import SERVICE_159
+from lookup_cache import VERDICT_NOT_LISTED, SERVICE_BITS, services_verdict
+from instrumentation import count, timer
+
+# Address of the establishment search page. It can point to a local copy of the page for testing.
+CNES_SEARCH_URL = os.environ.get("CNES_SEARCH_URL", "https://cnes.datasus.gov.br/pages/estabelecimentos/consulta.jsp")
+
+def check_establishment_browser(cnes, establishment_name, valid_cnes):
+    """
+    Check the establishment on the CNES website, browsing the consulta page with a session of the driver pool.
+
+    Args:
+        cnes (str): CNES value.
+        establishment_name (str): Establishment name.
+        valid_cnes (list): List of valid CNES.
+
+    Returns:
+        verdict (str): One of the lookup_cache.VERDICT_* values.
+        by_name (bool): True if the establishment was searched by name.
+    """
+    # Borrow a warm browser session; it is recycled by the pool if the check fails.
+    with get_driver_pool().session() as driver:
+        # Attempt to find the establishment by CNES value
+        by_name = False
+        if not open_cnes_page(driver, cnes):
+            # If not found, attempt to find by establishment name
+            by_name = True
+            cnes_encoded = urllib.parse.quote_plus(establishment_name)
+            if not open_cnes_page(driver, cnes_encoded):
+                logging.warning(f"The establishment {cnes} is not listed in CNES.")
+                return VERDICT_NOT_LISTED, by_name
+        
+        # Navigate through the website to find the required information
+        navigate_to_establishment_details(driver)
+        return check_services(driver, cnes, valid_cnes), by_name
+
+def open_cnes_page(driver, search_value):
+    """
+    Open the CNES page for the given search value.
+
+    Args:
+        driver (webdriver): Selenium WebDriver instance.
+        search_value (str): Search value (CNES or establishment name).
+
+    Returns:
+        bool: True if the page is opened successfully, False otherwise.
+    """
+    driver.get(f"{CNES_SEARCH_URL}?search={search_value}")
+    return wait_for_element(driver, "body > div.layout > main > div > div.col-md-12.ng-scope > div > div:nth-child(9) > table > tbody > tr > td:nth-child(8) > a > span", By.CSS_SELECTOR, 5)
+
+def navigate_to_establishment_details(driver):
+    """
+    Navigate to the establishment details page.
+
+    Args:
+        driver (webdriver): Selenium WebDriver instance.
+    """
+    click_element(driver, "body > div.layout > main > div > div.col-md-12.ng-scope > div > div:nth-child(9) > table > tbody > tr > td:nth-child(8) > a > span")
+    wait_for_element(driver, "Conjunto", By.LINK_TEXT, 5)
+    click_element(driver, "Conjunto", by=By.LINK_TEXT)
+    wait_for_element(driver, "#estabContent > aside > section > ul > li.treeview.active > ul > li:nth-child(1)", By.CSS_SELECTOR, 5)
+    click_element(driver, "#estabContent > aside > section > ul > li.treeview.active > ul > li:nth-child(1)")
+    wait_for_element(driver, "//table[@ng-table='tableParamsServicosEspecializados']", By.XPATH, 5)
+
+def check_services(driver, cnes, valid_cnes):
+    """
+    Check the services provided by the establishment.
+
+    Args:
+        driver (webdriver): Selenium WebDriver instance.
+        cnes (str): CNES value.
+        valid_cnes (list): List of valid CNES.
+
+    Returns:
+        verdict (str): VERDICT_159, VERDICT_152, VERDICT_159_152 or VERDICT_NO_SERVICE, according to the services listed.
+    """
+    services = 0
+    rows = driver.find_elements(By.XPATH, "//table[@ng-table='tableParamsServicosEspecializados']//tbody//tr")
+    for table_row in rows:
+        code = table_row.find_element(By.XPATH, ".//td[@data-title-text='Código']").text
+        services |= SERVICE_BITS.get(code.strip(), 0)
+    if services & SERVICE_159:
+        valid_cnes.append(cnes)
+    return services_verdict(services)
+
+def wait_for_element(driver, selector, by, timeout):
+    """
+    Wait for an element to be present on the page.
+
+    Args:
+        driver (webdriver): Selenium WebDriver instance.
+        selector (str): CSS selector or other selector.
+        by (By): Type of selector.
+        timeout (int): Timeout in seconds.
+
+    Returns:
+        bool: True if the element is found, False otherwise.
+    """
+    with timer("wait_for_element"):
+        try:
+            WebDriverWait(driver, timeout).until(EC.presence_of_element_located((by, selector)))
+            return True
+        except:
+            count("wait_timeouts")
+            return False
+
+def click_element(driver, selector, by=By.CSS_SELECTOR):
+    """
+    Click on an element on the page.
+
+    Args:
+        driver (webdriver): Selenium WebDriver instance.
+        selector (str): CSS selector or other selector.
+        by (By): Type of selector.
+    """
+    element = driver.find_element(by, selector)
+    element.click()
+
+
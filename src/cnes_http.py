@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import html
+import logging
+import threading
+import urllib.parse
+from lookup_cache import VERDICT_NOT_LISTED, SERVICE_BITS, services_verdict
+
+# Address of the services behind the CNES consulta page. It can point to a local server for testing.
+CNES_API_URL = os.environ.get("CNES_API_URL", "https://cnes.datasus.gov.br/services")
+# Search of an establishment by CNES and by name. The response is a JSON list of establishments.
+SEARCH_BY_CNES_URL = os.environ.get("CNES_API_SEARCH_BY_CNES_URL", CNES_API_URL + "/estabelecimentos?cnes={search}")
+SEARCH_BY_NAME_URL = os.environ.get("CNES_API_SEARCH_BY_NAME_URL", CNES_API_URL + "/estabelecimentos?nome={search}")
+# Specialised services of an establishment, as JSON or as the HTML of the "Conjunto" tab.
+SERVICES_URL = os.environ.get("CNES_API_SERVICES_URL", CNES_API_URL + "/estabelecimentos-servicos/{id}")
+
+# Fields that may hold the establishment id and the service code in the JSON responses.
+ID_FIELDS = ("id", "coUnidade", "co_unidade")
+CODE_FIELDS = ("codigo", "cod", "coServico", "co_servico", "Código")
+# Cells of the "Código" column of the specialised services table.
+CODE_CELL_PATTERN = re.compile(r"<td[^>]*data-title-text=['\"]C(?:ó|&oacute;|&#243;)digo['\"][^>]*>(.*?)</td>", re.S | re.I)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+_client = None
+_client_lock = threading.Lock()
+
+class CnesHttpError(Exception):
+    """
+    Raised when the CNES services answer with an error or an unexpected content.
+    """
+
+class CnesHttpClient:
+    """
+    Checks the services of an establishment with plain HTTP requests, without a browser.
+    Connections are kept alive and reused by a pool shared between threads.
+    """
+
+    def __init__(self, pool_size=4, timeout=10.0, retries=2):
+        # Imported on first use, see establishment_validator.LOOKUP_BACKENDS.
+        import urllib3
+        self._http = urllib3.PoolManager(
+            maxsize=pool_size,
+            block=True,
+            timeout=urllib3.Timeout(total=timeout),
+            retries=urllib3.Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+            headers={"Accept": "application/json, text/html"}
+        )
+
+    def check_establishment(self, cnes, establishment_name):
+        """
+        Check the establishment on the CNES services, like establishment_validator.check_establishment_online.
+
+        Args:
+            cnes (str): CNES value.
+            establishment_name (str): Establishment name.
+
+        Returns:
+            verdict (str): One of the lookup_cache.VERDICT_* values.
+            by_name (bool): True if the establishment was searched by name.
+        """
+        by_name = False
+        establishment_id = self.search(SEARCH_BY_CNES_URL, cnes)
+        if establishment_id is None:
+            # If not found, attempt to find by establishment name
+            by_name = True
+            establishment_id = self.search(SEARCH_BY_NAME_URL, establishment_name)
+            if establishment_id is None:
+                logging.warning(f"The establishment {cnes} is not listed in CNES.")
+                return VERDICT_NOT_LISTED, by_name
+
+        services = 0
+        for code in self.service_codes(establishment_id):
+            services |= SERVICE_BITS.get(code, 0)
+        return services_verdict(services), by_name
+
+    def search(self, url_template, search_value):
+        """
+        Search an establishment.
+
+        Returns:
+            str: Id of the first establishment found, or None if there is none.
+        """
+        content_type, body = self._get(url_template.format(search=urllib.parse.quote_plus(search_value)))
+        data = _load_json(body)
+        if isinstance(data, dict):
+            data = data.get("content", data.get("data", [data]))
+        if not isinstance(data, list):
+            raise CnesHttpError(f"Unexpected search response: {body[:100]!r}")
+        for item in data:
+            if isinstance(item, dict):
+                for field in ID_FIELDS:
+                    if item.get(field):
+                        return str(item[field])
+        return None
+
+    def service_codes(self, establishment_id):
+        """
+        Return the codes of the specialised services of an establishment, in the order they are listed.
+        """
+        content_type, body = self._get(SERVICES_URL.format(id=urllib.parse.quote(establishment_id)))
+        if "html" in content_type:
+            return [TAG_PATTERN.sub("", html.unescape(cell)).strip() for cell in CODE_CELL_PATTERN.findall(body)]
+        data = _load_json(body)
+        if isinstance(data, dict):
+            data = data.get("content", data.get("data", []))
+        codes = []
+        for item in data if isinstance(data, list) else []:
+            if isinstance(item, dict):
+                for field in CODE_FIELDS:
+                    if item.get(field) is not None:
+                        codes.append(str(item[field]).strip())
+                        break
+        return codes
+
+    def close(self):
+        self._http.clear()
+
+    def _get(self, url):
+        response = self._http.request("GET", url)
+        if response.status >= 400:
+            raise CnesHttpError(f"HTTP {response.status} for {url}")
+        content_type = response.headers.get("Content-Type", "")
+        return content_type.lower(), response.data.decode("utf-8", errors="replace")
+
+def _load_json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise CnesHttpError(f"Response is not JSON: {body[:100]!r}")
+
+def get_http_client():
+    """
+    Return the process-wide HTTP client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CnesHttpClient()
+        return _client
+
+def close_http_client():
+    """
+    Close the connections of the process-wide HTTP client, if it was used.
+    """
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import logging
+
+DEFERRED_QUEUE_NAME = "deferred_establishments.json"
+DEFERRED_QUEUE_VERSION = 1
+
+class DeferredQueue:
+    """
+    Establishments left unresolved by an --offline run, with the files whose result depends on them.
+
+    For each file it keeps the path of its filtered copy and the (ibge_cnes, cnes, establishment_name)
+    tuples that were neither in the databases nor in the lookup cache. The files stay untouched until
+    the queue is resolved with --resolve-deferred, which checks those establishments on the CNES website
+    and scores only these files again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        try:
+            with open(path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("version") == DEFERRED_QUEUE_VERSION:
+                self.files = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable deferred queue {path}: {e}")
+
+    def __len__(self):
+        return len(self.files)
+
+    def defer(self, file_path, output_path, establishments):
+        """
+        Record the establishments that a file is waiting for, replacing those of a previous run.
+        """
+        self.files[file_path] = {
+            "output": output_path,
+            "establishments": [list(establishment) for establishment in establishments],
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+
+    def discard(self, file_path):
+        """
+        Remove a file whose result no longer depends on unresolved establishments.
+        """
+        self.files.pop(file_path, None)
+
+    def establishments(self):
+        """
+        Return the unique establishments of the queue, in the order they were deferred.
+        """
+        unique = {}
+        for entry in self.files.values():
+            for ibge_cnes, cnes, establishment_name in entry["establishments"]:
+                unique.setdefault(ibge_cnes, (ibge_cnes, cnes, establishment_name))
+        return list(unique.values())
+
+    def save(self):
+        """
+        Write the queue, or remove its file when it is empty.
+        """
+        try:
+            if not self.files:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, mode='w', encoding='utf-8') as file:
+                json.dump({"version": DEFERRED_QUEUE_VERSION, "files": self.files}, file, indent=1)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.error(f"Error writing deferred queue {self.path}: {e}")
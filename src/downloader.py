@@ -0,0 +1,257 @@
+import os
+import csv
+import json
+import time
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from processing import process_csv
+from report_generator import report_file
+from history_files import filtered_path
+
+# Address of the professional history of a CPF, with the placeholders {cpf} and {name}.
+# There is no default: it must point to the CNES export used by the team (or to a local server for testing).
+HISTORY_URL_TEMPLATE = os.environ.get("CNES_HISTORY_URL")
+
+JOURNAL_NAME = "download_journal.jsonl"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 60.0  # Seconds.
+DEFAULT_RETRIES = 3
+CHUNK_SIZE = 64 * 1024
+
+class DownloadError(Exception):
+    """
+    Raised when a history cannot be downloaded.
+    """
+
+def read_download_list(list_path):
+    """
+    Read the list of professionals in streaming, yielding (cpf, name) for each valid line.
+    The first column is the CPF (numbers only) and the second the name, separated by ';'.
+    """
+    with open(list_path, mode='r', encoding='utf-8', newline='') as file:
+        for line_number, row in enumerate(csv.reader(file, delimiter=';'), 1):
+            if not row or not row[0].strip():
+                continue
+            cpf = row[0].strip()
+            if not cpf.isdigit():
+                logging.warning(f"Ignoring line {line_number} of {list_path}: invalid CPF {cpf!r}.")
+                continue
+            yield cpf.zfill(11), row[1].strip() if len(row) > 1 else ""
+
+def history_path(assets_path, cpf):
+    """
+    Path of the downloaded history of a CPF.
+    """
+    return os.path.join(assets_path, f"{cpf}.csv")
+
+class DownloadJournal:
+    """
+    Append-only record of the finished downloads, one JSON object per line, used to resume an interrupted run.
+    A CPF is skipped when its last entry is "done" or "processed" (downloaded and then rewritten in place by
+    process_csv) and its file still exists; failed downloads are retried.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._status = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, mode='r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        self._status[entry["cpf"]] = entry["status"]
+                    except (ValueError, KeyError):
+                        # The last line may be incomplete if the previous run was killed while writing it.
+                        continue
+        except FileNotFoundError:
+            pass
+        self._file = open(path, mode='a', encoding='utf-8')
+
+    def is_done(self, cpf):
+        """
+        Return True if the history of the CPF was already downloaded.
+        """
+        return self._status.get(cpf) in ("done", "processed")
+
+    def is_processed(self, cpf):
+        """
+        Return True if the downloaded history of the CPF was already rewritten in place with its valid lines.
+        """
+        return self._status.get(cpf) == "processed"
+
+    def record(self, cpf, status, error=None):
+        """
+        Append the outcome of a download and flush it, so it survives a crash of the process.
+        """
+        entry = {"cpf": cpf, "status": status, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if error is not None:
+            entry["error"] = str(error)
+        with self._lock:
+            self._status[cpf] = status
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the journal file.
+        """
+        with self._lock:
+            self._file.close()
+
+def fetch_history(http, url, file_path):
+    """
+    Download a history to file_path. The content is written to a temporary file that replaces
+    file_path only when it is complete, so a partial download is never left in the assets folder.
+
+    Raises:
+        DownloadError: If the server answers with an error or an empty file.
+    """
+    temporary_path = file_path + ".part"
+    response = http.request("GET", url, preload_content=False)
+    try:
+        if response.status != 200:
+            raise DownloadError(f"HTTP {response.status} for {url}")
+        size = 0
+        with open(temporary_path, mode='wb') as file:
+            for chunk in response.stream(CHUNK_SIZE):
+                file.write(chunk)
+                size += len(chunk)
+        if size == 0:
+            raise DownloadError(f"Empty history for {url}")
+        os.replace(temporary_path, file_path)
+    finally:
+        response.release_conn()
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def download_histories(list_path, assets_path, url_template=HISTORY_URL_TEMPLATE, concurrency=DEFAULT_CONCURRENCY,
+                       timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, journal_path=None, process=False,
+                       output_dir=None, reprocess=False):
+    """
+    Download the history of each professional of the list into the assets folder.
+
+    The list is read in streaming and at most `concurrency` downloads run at the same time, sharing a pool
+    of HTTP connections. Each finished download is recorded in the journal, so that running again after
+    an interruption only downloads the missing histories.
+
+    Args:
+        list_path (str): CSV file with the CPF and the name of each professional (hist_to_download.csv).
+        assets_path (str): Folder of the downloaded histories.
+        url_template (str): Address of a history, with the placeholders {cpf} and {name}.
+        concurrency (int): Maximum number of downloads running at the same time.
+        timeout (float): Seconds allowed for each download.
+        retries (int): Retries of a download after a connection error or a server error.
+        journal_path (str): Path of the journal. By default, download_journal.jsonl in the assets folder.
+        process (bool): Process each history with process_csv as soon as it is available, and write
+            overall_result.csv at the end.
+        output_dir (str): Folder of the filtered files when process is True. By default, the files are rewritten in place,
+            and the histories rewritten by a previous run are not processed again.
+        reprocess (bool): Process again the histories already rewritten in place by a previous run.
+
+    Returns:
+        dict: Number of histories downloaded, skipped (already downloaded), failed (downloading or processing)
+            and already processed.
+    """
+    if not url_template:
+        raise ValueError("The address of the histories is not configured (CNES_HISTORY_URL or --url-template).")
+    import urllib3
+    os.makedirs(assets_path, exist_ok=True)
+    concurrency = max(1, concurrency)
+    journal = DownloadJournal(journal_path or os.path.join(assets_path, JOURNAL_NAME))
+    http = urllib3.PoolManager(
+        maxsize=concurrency,
+        block=True,
+        timeout=urllib3.Timeout(total=timeout),
+        retries=urllib3.Retry(total=retries, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504))
+    )
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0, "processed": 0}
+    counts_lock = threading.Lock()
+    # Bounds the histories waiting for a download thread, so the list is never fully loaded in memory.
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    overall_result = {}
+    file_paths = []
+    seen = set()
+    # The histories are processed one at a time, in a separate thread, while the downloads go on.
+    processing = ThreadPoolExecutor(max_workers=1) if process else None
+
+    def process_history(cpf, file_path):
+        output_path = filtered_path(file_path, output_dir)
+        unresolved = []
+        process_csv(file_path, overall_result, output_path, unresolved)
+        if output_path is not None or file_path not in overall_result:
+            return
+        # The download was replaced by its valid lines, which must not be filtered again by the next run.
+        if unresolved:
+            # The lines of the establishments whose check failed were dropped: download the history again.
+            journal.record(cpf, "failed", f"website checks failed for {len(unresolved)} establishments")
+        else:
+            journal.record(cpf, "processed")
+
+    def processing_done(cpf, future):
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Error processing the history of {cpf}: {error}")
+            journal.record(cpf, "failed", error)
+            with counts_lock:
+                counts["failed"] += 1
+
+    def submit_processing(cpf, file_path):
+        processing.submit(process_history, cpf, file_path).add_done_callback(
+            lambda future: processing_done(cpf, future))
+
+    def download(cpf, name, file_path):
+        url = url_template.format(cpf=cpf, name=urllib.parse.quote_plus(name))
+        try:
+            fetch_history(http, url, file_path)
+        except Exception as e:
+            logging.error(f"Error downloading the history of {cpf}: {e}")
+            journal.record(cpf, "failed", e)
+            with counts_lock:
+                counts["failed"] += 1
+            return
+        journal.record(cpf, "done")
+        with counts_lock:
+            counts["downloaded"] += 1
+        if processing is not None:
+            submit_processing(cpf, file_path)
+
+    def release(_):
+        slots.release()
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as downloads:
+            for cpf, name in read_download_list(list_path):
+                if cpf in seen:
+                    continue
+                seen.add(cpf)
+                file_path = history_path(assets_path, cpf)
+                file_paths.append(file_path)
+                if journal.is_done(cpf) and os.path.isfile(file_path):
+                    counts["skipped"] += 1
+                    if processing is not None:
+                        if journal.is_processed(cpf) and not reprocess:
+                            counts["processed"] += 1
+                        else:
+                            submit_processing(cpf, file_path)
+                    continue
+                slots.acquire()
+                downloads.submit(download, cpf, name, file_path).add_done_callback(release)
+    finally:
+        if processing is not None:
+            processing.shutdown(wait=True)
+        journal.close()
+        http.clear()
+
+    logging.info(f"Histories downloaded: {counts['downloaded']}, already downloaded: {counts['skipped']}, "
+                 f"failed: {counts['failed']} ({time.time() - start:.1f} seconds).")
+    if counts["processed"]:
+        logging.info(f"{counts['processed']} histories were already processed by a previous run and are not "
+                     f"in the report (use --reprocess to process them again).")
+    if process:
+        # Report the histories in the order of the list.
+        report_file({file_path: overall_result[file_path] for file_path in file_paths if file_path in overall_result})
+    return counts
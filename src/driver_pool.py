@@ -0,0 +1,170 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from instrumentation import timer
+
+# Default pool configuration, overridden by configure_driver_pool.
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_USES = 50
+
+_pool = None
+_pool_size = DEFAULT_POOL_SIZE
+_pool_max_uses = DEFAULT_MAX_USES
+_pool_lock = threading.Lock()
+
+def create_chrome_driver():
+    """
+    Start a headless Chrome session.
+
+    Returns:
+        webdriver.Chrome: New Selenium WebDriver instance.
+    """
+    # Imported on first use, see establishment_validator.LOOKUP_BACKENDS.
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    return webdriver.Chrome(options=chrome_options)
+
+class DriverPool:
+    """
+    Pool of warm browser sessions shared by the establishment checks.
+
+    At most `size` sessions exist at the same time. A session is recycled (quit and replaced
+    on the next request) after `max_uses` checks or as soon as a check raises an error.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_uses=DEFAULT_MAX_USES, factory=create_chrome_driver):
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.sessions_created = 0
+        self.recycles = 0
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextmanager
+    def session(self):
+        """
+        Lend a browser session for the duration of the with block.
+
+        Yields:
+            webdriver: Selenium WebDriver instance.
+        """
+        start = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - start
+        try:
+            try:
+                driver, uses = self._idle.get_nowait()
+            except queue.Empty:
+                with timer("browser_startup"):
+                    driver = self.factory()
+                uses = 0
+                with self._lock:
+                    self.sessions_created += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        failed = False
+        try:
+            yield driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            uses += 1
+            if failed or uses >= self.max_uses or self._closed:
+                self._quit(driver)
+                if not self._closed:
+                    with self._lock:
+                        self.recycles += 1
+            else:
+                self._idle.put((driver, uses))
+            self._slots.release()
+
+    def close(self):
+        """
+        Quit every idle session. Sessions in use are quit when they are returned.
+        """
+        self._closed = True
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+    def metrics(self):
+        """
+        Return the pool metrics as a dictionary.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "sessions_created": self.sessions_created,
+                "recycles": self.recycles,
+                "acquisitions": self.acquisitions,
+                "total_wait": self.total_wait,
+                "average_wait": self.total_wait / self.acquisitions if self.acquisitions else 0.0,
+                "max_wait": self.max_wait
+            }
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Error closing browser session: {e}")
+
+def configure_driver_pool(size=DEFAULT_POOL_SIZE, max_uses=DEFAULT_MAX_USES):
+    """
+    Set the size and the number of uses per session of the process-wide pool.
+    Must be called before the first establishment is checked online.
+    """
+    global _pool_size, _pool_max_uses
+    _pool_size = size
+    _pool_max_uses = max_uses
+
+def get_driver_pool():
+    """
+    Return the process-wide driver pool, creating it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(_pool_size, _pool_max_uses)
+        return _pool
+
+def close_driver_pool():
+    """
+    Log the metrics of the process-wide pool, if it was used, and quit its sessions.
+
+    Returns:
+        dict: Metrics of the pool, or None if it was not used.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    pool.close()
+    metrics = pool.metrics()
+    logging.info(f"Browser pool: {metrics['sessions_created']} sessions created, {metrics['recycles']} recycled, "
+                 f"{metrics['acquisitions']} acquisitions, average wait {metrics['average_wait']:.2f}s, "
+                 f"max wait {metrics['max_wait']:.2f}s")
+    return metrics
@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import logging
+import argparse
+import threading
+from bisect import bisect_right
+from establishment_index import DATABASES_DIR, VALID, INVALID, NOT_FOUND, APS_SERVICES, read_establishment_index
+from establishment_snapshot import masks_from_index, masks_from_csv
+
+DEFAULT_HISTORY_PATH = os.path.join(DATABASES_DIR, "estab_history.db")
+
+# Mask stored when an establishment disappears from the CNES services table.
+REMOVED = 0
+
+_history = None
+_history_lock = threading.Lock()
+
+def competencia_month(competencia):
+    """
+    Convert a competência (YYYYMM) to the integer month key used by utils.parse_month.
+    """
+    if len(competencia) != 6 or not competencia.isdigit() or not 1 <= int(competencia[4:]) <= 12:
+        raise ValueError(f"Invalid competência: {competencia}")
+    return int(competencia[:4]) * 12 + int(competencia[4:])
+
+def open_history_store(path=DEFAULT_HISTORY_PATH):
+    """
+    Open (creating it if needed) the store of the establishment history.
+
+    The first competência holds the services mask of every establishment. Each following competência
+    only holds the establishments whose mask changed, with REMOVED for the ones that disappeared.
+    """
+    connection = sqlite3.connect(path)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS competencias (
+        competencia TEXT PRIMARY KEY,
+        establishments INTEGER NOT NULL,
+        changes INTEGER NOT NULL
+    )
+    """)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS changes (
+        unit TEXT NOT NULL,
+        competencia TEXT NOT NULL,
+        mask INTEGER NOT NULL,
+        PRIMARY KEY (unit, competencia)
+    ) WITHOUT ROWID
+    """)
+    return connection
+
+def latest_masks(connection):
+    """
+    Rebuild the services mask of each establishment at the latest competência of the store.
+    """
+    masks = {}
+    for unit, mask in connection.execute("SELECT unit, mask FROM changes ORDER BY competencia"):
+        if mask == REMOVED:
+            masks.pop(unit, None)
+        else:
+            masks[unit] = mask
+    return masks
+
+def add_competencia(connection, competencia, masks):
+    """
+    Append a competência to the store, saving only its differences from the previous one.
+
+    Args:
+        connection (sqlite3.Connection): Store opened by open_history_store.
+        competencia (str): Competência (YYYYMM) of the data.
+        masks (dict): Services mask of each IBGE+CNES key at that competência.
+
+    Returns:
+        changes (int): Number of establishments saved for the competência.
+
+    Raises:
+        ValueError: If the competência is not after the latest one of the store.
+    """
+    competencia_month(competencia)
+    latest = connection.execute("SELECT MAX(competencia) FROM competencias").fetchone()[0]
+    if latest is not None and competencia <= latest:
+        raise ValueError(f"The competência {competencia} must be after the latest one of the store ({latest}).")
+
+    previous = latest_masks(connection)
+    rows = [(unit, competencia, mask) for unit, mask in masks.items() if previous.get(unit) != mask]
+    rows += [(unit, competencia, REMOVED) for unit in previous if unit not in masks]
+    with connection:
+        connection.executemany("INSERT INTO changes VALUES (?, ?, ?)", rows)
+        connection.execute("INSERT INTO competencias VALUES (?, ?, ?)", (competencia, len(masks), len(rows)))
+    logging.info(f"Competência {competencia} added to the history: {len(masks)} establishments, {len(rows)} changes.")
+    return len(rows)
+
+class EstablishmentHistory:
+    """
+    Services of each establishment over time, used to judge each line by the competência of its COMP. value.
+
+    Each IBGE+CNES key has a timeline with the months where its mask changed. A month is resolved with
+    the latest competência up to it; months before the first competência use the first one.
+    """
+
+    def __init__(self, timelines, months):
+        self._timelines = timelines
+        self.months = months
+        self._cache = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_HISTORY_PATH):
+        """
+        Load the whole store in memory.
+        """
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            months = [competencia_month(competencia) for (competencia,)
+                      in connection.execute("SELECT competencia FROM competencias ORDER BY competencia")]
+            timelines = {}
+            for unit, competencia, mask in connection.execute(
+                    "SELECT unit, competencia, mask FROM changes ORDER BY unit, competencia"):
+                timeline = timelines.get(unit)
+                if timeline is None:
+                    timeline = timelines[unit] = ([], [])
+                timeline[0].append(competencia_month(competencia))
+                timeline[1].append(mask)
+        finally:
+            connection.close()
+        if not months:
+            raise ValueError(f"The establishment history {path} is empty.")
+        return cls(timelines, months)
+
+    def services(self, key, month):
+        """
+        Return the services mask of an IBGE+CNES key at a month, or None if it is not listed at that month.
+
+        Args:
+            key (str): Concatenated values of IBGE+CNES.
+            month (int): Month key of the line (utils.parse_month).
+        """
+        cache_key = (key, month)
+        mask = self._cache.get(cache_key, REMOVED)
+        if mask == REMOVED and cache_key not in self._cache:
+            timeline = self._timelines.get(key)
+            if timeline is not None:
+                position = bisect_right(timeline[0], max(month, self.months[0])) - 1
+                if position >= 0:
+                    mask = timeline[1][position]
+            self._cache[cache_key] = mask
+        return mask if mask != REMOVED else None
+
+    def classify(self, key, month, accepted=APS_SERVICES):
+        """
+        Classify an IBGE+CNES key at a month, with the same statuses as EstablishmentIndex.classify.
+
+        Args:
+            key (str): Concatenated values of IBGE+CNES.
+            month (int): Month key of the line (utils.parse_month).
+            accepted (int): Services mask of the services that make the establishment valid.
+        """
+        mask = self.services(key, month)
+        if mask is None:
+            return NOT_FOUND
+        return VALID if mask & accepted else INVALID
+
+    def mark(self, records, valid_cnes, accepted=APS_SERVICES):
+        """
+        Set record.aps for each line of a history, judging the establishment by the competência of the line.
+        Lines whose establishment is not in the history at that month, or whose COMP. is unknown,
+        keep the verdict of the current databases and of the CNES website.
+
+        Args:
+            records (list): HistoryRecord of the lines, with their IBGE+CNES key.
+            valid_cnes (set): CNES valid today.
+            accepted (int): Services mask of the services that make the establishment valid.
+        """
+        for record in records:
+            status = NOT_FOUND
+            if record.key is not None and record.month is not None:
+                status = self.classify(record.key, record.month, accepted)
+            record.aps = status == VALID if status != NOT_FOUND else record.cnes in valid_cnes
+
+def configure_establishment_history(path=None):
+    """
+    Enable the time-accurate validation with the history store at path, or disable it if path is None.
+    """
+    history = EstablishmentHistory.load(path) if path else None
+    set_establishment_history(history)
+    if path:
+        logging.info(f"Establishment history loaded from {path}: {len(history.months)} competências.")
+
+def set_establishment_history(history):
+    """
+    Make an EstablishmentHistory the process-wide one, or disable the time-accurate validation with None.
+    """
+    global _history
+    with _history_lock:
+        _history = history
+
+def get_establishment_history():
+    """
+    Return the process-wide establishment history, or None if the time-accurate validation is disabled.
+    """
+    return _history
+
+def main(argv=None):
+    """
+    Command line interface to add competências to the history store and to list them.
+    """
+    parser = argparse.ArgumentParser(description="Manage the per-competência history of the establishments.")
+    parser.add_argument("--store", default=DEFAULT_HISTORY_PATH, help="Path of the history store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="Add a competência, after the latest one of the store.")
+    add_parser.add_argument("competencia", help="Competência (YYYYMM) of the data.")
+    add_parser.add_argument("--csv", default=None,
+                            help="CNES services CSV (rlEstabServClassAAAAMM.csv). By default, the databases of the "
+                                 "competência are used.")
+    add_parser.add_argument("--databases-dir", default=DATABASES_DIR, help="Folder of the databases (default: databases).")
+    subparsers.add_parser("list", help="List the competências of the store.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    connection = open_history_store(args.store)
+    try:
+        if args.command == "add":
+            if args.csv:
+                masks = masks_from_csv(args.csv)
+            else:
+                # The databases are read even when a snapshot of the competência exists.
+                masks = masks_from_index(read_establishment_index(args.databases_dir, args.competencia,
+                                                                  use_snapshot=False))
+            add_competencia(connection, args.competencia, masks)
+        else:
+            for competencia, establishments, changes in connection.execute(
+                    "SELECT competencia, establishments, changes FROM competencias ORDER BY competencia"):
+                print(f"{competencia}\t{establishments} establishments\t{changes} changes")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import logging
+import threading
+from instrumentation import timer
+
+# Default location and competência (YYYYMM) of the reference databases, built by databases/criacao_bases.py.
+DATABASES_DIR = os.path.join(os.path.dirname(__file__), "..", "databases")
+DEFAULT_COMPETENCIA = "202411"
+
+# Status codes returned by the index, kept identical to check_establishment_SQL.
+VALID = 1
+INVALID = 0
+NOT_FOUND = -1
+
+# Bits of the services mask of an establishment.
+SERVICE_159 = 1
+SERVICE_152 = 2
+SERVICE_OTHER = 4
+# Set on the masks found on the CNES website, which the rule sets accept with their own services.
+SERVICE_ONLINE = 8
+# Services that make an establishment valid for the default eligibility rules.
+APS_SERVICES = SERVICE_159 | SERVICE_152
+
+_index = None
+_index_lock = threading.RLock()
+_competencia = DEFAULT_COMPETENCIA
+
+class EstablishmentIndex:
+    """
+    In-memory view of the establishment databases keyed on CO_UNIDADE (IBGE+CNES).
+
+    The keys are split into three sets:
+        has_159: establishments offering the service 159.
+        has_152: establishments offering the service 152, which may also offer the 159.
+        known: every establishment present in the CNES services table.
+    """
+    __slots__ = ("has_159", "has_152", "known")
+
+    def __init__(self, has_159=(), has_152=(), known=()):
+        self.has_159 = frozenset(has_159)
+        self.has_152 = frozenset(has_152)
+        self.known = frozenset(known) | self.has_159 | self.has_152
+
+    def __len__(self):
+        return len(self.known)
+
+    def classify(self, key):
+        """
+        Classify a single IBGE+CNES key.
+
+        Arg: key (str): concatenated values of IBGE+CNES.
+
+        Return: (int):
+            1 if the establishment offers the service 159 or 152.
+            0 if it is listed without those services.
+            -1 if it is not listed, so it needs to be checked on the CNES website.
+        """
+        if key in self.has_159 or key in self.has_152:
+            return VALID
+        if key in self.known:
+            return INVALID
+        return NOT_FOUND
+
+    def classify_many(self, keys):
+        """
+        Classify several IBGE+CNES keys in one call.
+
+        Arg: keys (iterable): concatenated values of IBGE+CNES.
+
+        Return: statuses (dict): status of each key, as returned by classify.
+        """
+        return {key: self.classify(key) for key in keys}
+
+    def services(self, key):
+        """
+        Return the services mask of an IBGE+CNES key (SERVICE_OTHER if it offers neither 159 nor 152),
+        or None if it is not listed.
+        """
+        mask = (SERVICE_159 if key in self.has_159 else 0) | (SERVICE_152 if key in self.has_152 else 0)
+        if mask:
+            return mask
+        return SERVICE_OTHER if key in self.known else None
+
+def _fetch_column(db_path, query):
+    """
+    Run a single-column query against a database opened in read-only mode.
+
+    Returns:
+        set: Values of the first column, or an empty set if the database is missing or unreadable.
+    """
+    if not os.path.isfile(db_path):
+        logging.error(f"Database not found: {db_path}")
+        return set()
+    try:
+        uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+        with sqlite3.connect(uri, uri=True) as connection:
+            return {str(row[0]) for row in connection.execute(query) if row[0] is not None}
+    except sqlite3.Error as e:
+        logging.error(f"Database error reading {db_path}: {e}")
+        return set()
+
+def database_paths(competencia=None, databases_dir=DATABASES_DIR):
+    """
+    Return the paths of the reference databases of a competência.
+
+    Returns:
+        db1_path (str): Database of the establishments with the services 159 or 152.
+        db2_path (str): Database of the services of every establishment.
+    """
+    competencia = competencia or _competencia
+    return (os.path.join(databases_dir, f"estab_{competencia}_159_152.db"),
+            os.path.join(databases_dir, f"estabelecimentos_{competencia}.db"))
+
+def configure_competencia(competencia):
+    """
+    Select the competência (YYYYMM) of the reference databases. Must be called before the index is loaded.
+    """
+    global _competencia
+    _competencia = competencia
+
+def get_competencia():
+    """
+    Return the configured competência (YYYYMM) of the reference databases.
+    """
+    return _competencia
+
+def load_establishment_index(databases_dir=DATABASES_DIR, competencia=None):
+    """
+    Build the establishment index from the reference databases and make it the process-wide index.
+
+    Args:
+        databases_dir (str): Folder holding the reference databases.
+        competencia (str): Competência of the databases. Defaults to the configured one.
+
+    Returns:
+        EstablishmentIndex: The loaded index.
+    """
+    index = read_establishment_index(databases_dir, competencia)
+    set_establishment_index(index)
+    return index
+
+def read_establishment_index(databases_dir=DATABASES_DIR, competencia=None, use_snapshot=True):
+    """
+    Build the establishment index from the reference databases, without replacing the process-wide index.
+
+    Args:
+        databases_dir (str): Folder holding the reference databases.
+        competencia (str): Competência of the databases. Defaults to the configured one.
+        use_snapshot (bool): False to always read the databases, for example to build the snapshot.
+
+    Returns:
+        EstablishmentIndex: The index, or the snapshot of the databases when it is up to date.
+    """
+    db1_path, db2_path = database_paths(competencia, databases_dir)
+
+    # Prefer the memory-mapped snapshot of the databases, when it is up to date.
+    if use_snapshot:
+        index = _load_snapshot(competencia or _competencia, databases_dir, (db1_path, db2_path))
+        if index is not None:
+            logging.info(f"Establishment index mapped from {index.path}: {len(index)} known.")
+            return index
+
+    # Establishments with the service 159 or 152.
+    with_159_152 = _fetch_column(db1_path, "SELECT valor FROM serv159152")
+    # Split them by service using the full CNES services table.
+    with_159 = _fetch_column(db2_path, "SELECT DISTINCT CO_UNIDADE FROM tabela_dados WHERE CO_SERVICO = 159")
+    with_152 = _fetch_column(db2_path, "SELECT DISTINCT CO_UNIDADE FROM tabela_dados WHERE CO_SERVICO = 152")
+    known = _fetch_column(db2_path, "SELECT DISTINCT CO_UNIDADE FROM tabela_dados")
+
+    # An establishment of the first database without the service 159 in the second one offers the 152.
+    index = EstablishmentIndex(with_159 & with_159_152, (with_152 & with_159_152) | (with_159_152 - with_159), known)
+    logging.info(f"Establishment index loaded: {len(index.has_159)} with 159, "
+                 f"{len(index.has_152)} with 152, {len(index)} known.")
+    return index
+
+def set_establishment_index(index):
+    """
+    Make an index the process-wide one. Lookups already running keep the index they started with.
+    """
+    global _index
+    with _index_lock:
+        _index = index
+
+def _load_snapshot(competencia, databases_dir, db_paths):
+    """
+    Open the snapshot of the databases, or return None if it is missing, outdated, invalid or of another competência.
+    """
+    # Imported here because the snapshot module builds on this one.
+    from establishment_snapshot import SnapshotIndex, snapshot_path
+    path = snapshot_path(competencia, databases_dir)
+    if not os.path.isfile(path):
+        return None
+    snapshot_time = os.path.getmtime(path)
+    if any(os.path.isfile(db_path) and os.path.getmtime(db_path) > snapshot_time for db_path in db_paths):
+        logging.warning(f"The snapshot {path} is older than the databases and will not be used.")
+        return None
+    try:
+        index = SnapshotIndex(path)
+    except (OSError, ValueError) as e:
+        logging.error(f"Error reading snapshot {path}: {e}")
+        return None
+    # A snapshot copied or renamed from another competência must not stand for this one.
+    if index.competencia != competencia:
+        logging.warning(f"The snapshot {path} holds the competência {index.competencia} instead of {competencia} "
+                        f"and will not be used.")
+        return None
+    return index
+
+def get_establishment_index():
+    """
+    Return the process-wide establishment index, loading it on first use.
+    """
+    with _index_lock:
+        if _index is None:
+            with timer("index_load"):
+                return load_establishment_index()
+        return _index
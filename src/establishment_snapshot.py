@@ -0,0 +1,170 @@
+import os
+import csv
+import mmap
+import zlib
+import struct
+import logging
+import argparse
+from establishment_index import (DATABASES_DIR, DEFAULT_COMPETENCIA, VALID, INVALID, NOT_FOUND,
+                                 SERVICE_159, SERVICE_152, SERVICE_OTHER, APS_SERVICES,
+                                 read_establishment_index)
+
+# Snapshot layout: a header followed by `count` records sorted by key. Each record is the
+# IBGE+CNES key, padded with zeros to `key_width` bytes, and one byte with the services mask.
+MAGIC = b"ESTBSNAP"
+# Version 2: the mask of an establishment offering both 159 and 152 has both bits.
+VERSION = 2
+HEADER = struct.Struct("<8sHH6sII")  # magic, version, key_width, competência, count, CRC32 of the records.
+HEADER_SIZE = 32
+
+def snapshot_path(competencia=DEFAULT_COMPETENCIA, databases_dir=DATABASES_DIR):
+    """
+    Return the path of the snapshot of a competência.
+    """
+    return os.path.join(databases_dir, f"estab_{competencia}.snap")
+
+def masks_from_index(index):
+    """
+    Build the services mask of each establishment from an EstablishmentIndex read from the databases.
+    """
+    return {key: index.services(key) for key in index.known}
+
+def masks_from_csv(csv_path):
+    """
+    Build the services mask of each establishment from the CNES services CSV (rlEstabServClassAAAAMM.csv),
+    read in streaming. The masks have the same bits as masks_from_index: the 159 and 152 bits, or SERVICE_OTHER
+    alone for an establishment with neither, so both sources can be mixed in the history store.
+    """
+    masks = {}
+    with open(csv_path, mode="r", encoding="ISO-8859-1", newline="") as file:
+        reader = csv.reader(file, delimiter=";")
+        header = [column.strip() for column in next(reader)]
+        unit_index = header.index("CO_UNIDADE")
+        service_index = header.index("CO_SERVICO")
+        for row in reader:
+            if len(row) <= max(unit_index, service_index):
+                continue
+            unit = row[unit_index].strip()
+            service = row[service_index].strip()
+            if not unit:
+                continue
+            bit = SERVICE_159 if service == "159" else SERVICE_152 if service == "152" else SERVICE_OTHER
+            masks[unit] = masks.get(unit, 0) | bit
+    return {unit: mask & APS_SERVICES or SERVICE_OTHER for unit, mask in masks.items()}
+
+def write_snapshot(path, masks, competencia):
+    """
+    Write a snapshot file, replacing the previous one only when it is complete.
+
+    Args:
+        path (str): Path of the snapshot.
+        masks (dict): Services mask of each IBGE+CNES key.
+        competencia (str): Competência (YYYYMM) of the data.
+    """
+    keys = sorted(key.encode("ascii") for key in masks)
+    key_width = max((len(key) for key in keys), default=1)
+    records = bytearray()
+    for key in keys:
+        records += key.ljust(key_width, b"\0")
+        records.append(masks[key.decode("ascii")])
+    header = HEADER.pack(MAGIC, VERSION, key_width, competencia.encode("ascii")[:6], len(keys), zlib.crc32(records))
+    temporary_path = path + ".tmp"
+    with open(temporary_path, mode="wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        file.write(records)
+    os.replace(temporary_path, path)
+    logging.info(f"Snapshot {path} written with {len(keys)} establishments.")
+
+class SnapshotIndex:
+    """
+    Establishment index backed by a memory-mapped snapshot file, searched with binary search.
+    The pages of the file are shared by every process that maps it, including the pool workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, mode="rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.key_width, competencia, self.count, checksum = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an establishment snapshot.")
+        if version != VERSION:
+            raise ValueError(f"The snapshot {path} has the format version {version} instead of {VERSION}; build it again.")
+        self.competencia = competencia.decode("ascii")
+        self._record_size = self.key_width + 1
+        if len(self._map) != HEADER_SIZE + self.count * self._record_size:
+            raise ValueError(f"The snapshot {path} is truncated.")
+        if zlib.crc32(self._map[HEADER_SIZE:]) != checksum:
+            raise ValueError(f"The checksum of the snapshot {path} does not match.")
+
+    def __len__(self):
+        return self.count
+
+    def __reduce__(self):
+        # Sent to the worker processes by its path, which they map again.
+        return SnapshotIndex, (self.path,)
+
+    def services(self, key):
+        """
+        Return the services mask of an IBGE+CNES key, or None if it is not in the snapshot.
+        """
+        try:
+            target = key.encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        if len(target) > self.key_width:
+            return None
+        target = target.ljust(self.key_width, b"\0")
+        data = self._map
+        size = self._record_size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER_SIZE + middle * size
+            if data[offset:offset + self.key_width] < target:
+                low = middle + 1
+            else:
+                high = middle
+        offset = HEADER_SIZE + low * size
+        if low < self.count and data[offset:offset + self.key_width] == target:
+            return data[offset + self.key_width]
+        return None
+
+    def classify(self, key):
+        """
+        Classify a single IBGE+CNES key, with the same statuses as EstablishmentIndex.classify.
+        """
+        mask = self.services(key)
+        if mask is None:
+            return NOT_FOUND
+        return VALID if mask & (SERVICE_159 | SERVICE_152) else INVALID
+
+    def classify_many(self, keys):
+        """
+        Classify several IBGE+CNES keys in one call.
+        """
+        return {key: self.classify(key) for key in keys}
+
+def main(argv=None):
+    """
+    Command line interface to build a snapshot from the CNES services CSV or from the existing databases.
+    """
+    parser = argparse.ArgumentParser(description="Build the binary snapshot of the establishment databases.")
+    parser.add_argument("--competencia", default=DEFAULT_COMPETENCIA, help="Competência (YYYYMM) of the data.")
+    parser.add_argument("--csv", default=None,
+                        help="CNES services CSV (rlEstabServClassAAAAMM.csv). By default, the databases are used.")
+    parser.add_argument("--databases-dir", default=DATABASES_DIR, help="Folder of the databases (default: databases).")
+    parser.add_argument("--output", default=None,
+                        help="Path of the snapshot (default: estab_AAAAMM.snap in the folder of the databases).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.csv:
+        masks = masks_from_csv(args.csv)
+    else:
+        # The databases are read even when a snapshot exists, since it is the file being rebuilt.
+        masks = masks_from_index(read_establishment_index(args.databases_dir, args.competencia, use_snapshot=False))
+    write_snapshot(args.output or snapshot_path(args.competencia, args.databases_dir), masks, args.competencia)
+
+if __name__ == "__main__":
+    main()
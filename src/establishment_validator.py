@@ -1,17 +1,33 @@
-import os
-import sqlite3
-import urllib.parse
+import time
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from utils import check_cbo_description
+from cbo_classifier import classify_cbo, ESTABLISHMENT_ROLES
+from establishment_index import get_establishment_index, APS_SERVICES
+from cnes_http import get_http_client
+from lookup_cache import get_lookup_cache, verdict_services
+from instrumentation import count, observe
+
+# Backends used to check establishments on the CNES website. The browser is always the fallback.
+# Their libraries, Selenium and urllib3, are imported on first use, so that the runs resolved by the databases
+# and the lookup cache neither load them nor need Chrome.
+LOOKUP_BACKENDS = ("selenium", "http")
+_lookup_backend = "selenium"
+
+def configure_lookup_backend(backend):
+    """
+    Select the backend used to check establishments on the CNES website.
+
+    Args:
+        backend (str): "selenium" to browse the consulta page, or "http" to query the CNES services directly.
+    """
+    global _lookup_backend
+    if backend not in LOOKUP_BACKENDS:
+        raise ValueError(f"Unknown lookup backend: {backend}")
+    _lookup_backend = backend
 
 def check_establishment_SQL(value_to_check):
     """
     Verifies the eligibility of establishments associated to the role CLINICO and GENERALISTA.
+    The lookup is answered by the process-wide establishment index, loaded once from the databases.
     
     Arg: value_to_check (str): unique concatenated values of IBGE+CNES to verify.
     
@@ -20,36 +36,8 @@ def check_establishment_SQL(value_to_check):
         0 if it is not valid.
         -1 if it is not found in any database, so it needs to be checked on the CNES website.
     """   
-    # Calculate paths to database files relative to the script's location.
-    base_dir = os.path.dirname(__file__)
-    db1_path = os.path.join(base_dir, "..", "databases", "estab_202411_159_152.db")
-    db2_path = os.path.join(base_dir, "..", "databases", "estabelecimentos_202411.db")
-    
     try:
-        # Connect to the first database.
-        with sqlite3.connect(db1_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT COUNT(*) FROM serv159152 WHERE valor = ?", (value_to_check,))
-            result = cursor.fetchone()
-            if result[0] > 0:
-                # If the establishment is found in the first database, it is valid.
-                return 1
-        
-        # Connect to the second database.
-        with sqlite3.connect(db2_path) as connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT COUNT(*) FROM tabela_dados WHERE CO_UNIDADE = ?", (value_to_check,))
-            result = cursor.fetchone()
-            if result[0] > 0:
-                # If the establishment is found in the second database, it is invalid.
-                return 0
-        
-        # If the establishment is not found in any database, it needs to be checked on the CNES website.
-        return -1
-    
-    except sqlite3.Error as e:
-        logging.error(f"Database error: {e}")
-        return -1
+        return get_establishment_index().classify(value_to_check)
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         return -1
@@ -62,14 +50,11 @@ def check_establishment(reader_csv):
         reader_csv (csv.DictReader): CSV file reader.
 
     Returns:
-        valid_cnes (list): List of valid CNES which indicates the valid establishments.
+        valid_cnes (dict): Services mask of each valid CNES, which indicates the valid establishments.
     """
-    unique_ibge_cnes = []
-    unique_cnes = []
-    unique_establishment_name = []
-    valid_cnes = []
+    establishments = {}
     
-    # Create lists of unique establishments ibge, cnes values and names that need to be checked
+    # Create the list of unique establishments ibge+cnes, cnes values and names that need to be checked
     for line in reader_csv:
         try:
             cnes_value = line["CNES"]
@@ -78,137 +63,215 @@ def check_establishment(reader_csv):
             establishment_value = line["ESTABELECIMENTO"]
             ibge_value = line["IBGE"]
             concat_ibge_cnes = ibge_value + cnes_value
-            if concat_ibge_cnes not in unique_ibge_cnes and chs_amb_value >= 20:
-                if check_cbo_description(cbo_description, ["MEDICO", "CLINICO"]) or \
-                   check_cbo_description(cbo_description, ["MEDICOS", "CLINICO"]) or \
-                   check_cbo_description(cbo_description, ["MEDICO", "GENERALISTA"]):
-                    unique_ibge_cnes.append(concat_ibge_cnes)
-                    unique_cnes.append(cnes_value)
-                    unique_establishment_name.append(establishment_value)
+            if concat_ibge_cnes not in establishments and chs_amb_value >= 20:
+                if classify_cbo(cbo_description) in ESTABLISHMENT_ROLES:
+                    establishments[concat_ibge_cnes] = (concat_ibge_cnes, cnes_value, establishment_value)
         except:
             pass
     
-    for i in range(len(unique_ibge_cnes)):
-        try:
-            if unique_cnes[i] in valid_cnes:
-                continue
-            status = check_establishment_SQL(unique_ibge_cnes[i])
-            if status == 1:
-                valid_cnes.append(unique_cnes[i])
-            elif status == -1:
-                cnes = str(unique_cnes[i])
-                establishment_name = str(unique_establishment_name[i])
-                check_establishment_online(cnes, establishment_name, valid_cnes)
-        except Exception as e:
-            logging.warning(f"Error checking establishment: {e}")
+    return resolve_establishments(list(establishments.values()))
+
+def resolve_establishments(establishments, unresolved=None):
+    """
+    Resolve, in bulk, the establishments collected from a professional history.
+
+    Args:
+        establishments (list): Unique (ibge_cnes, cnes, establishment_name) tuples, in the order they were found.
+        unresolved (list): List extended with the establishments whose check on the CNES website failed,
+            which are counted as not valid, or None.
+
+    Returns:
+        valid_cnes (dict): Services mask of each valid CNES, which indicates the valid establishments.
+    """
+    valid_cnes, pending = classify_establishments(establishments)
+    
+    # Check on the CNES website (or in its cache) the establishments that are not in the databases.
+    for establishment in pending:
+        ibge_cnes, cnes, establishment_name = establishment
+        if cnes in valid_cnes:
             continue
+        services = verify_establishment_online(cnes, establishment_name)
+        if services:
+            valid_cnes[cnes] = services
+        elif services is None and unresolved is not None:
+            unresolved.append(establishment)
     return valid_cnes
 
-def check_establishment_online(cnes, establishment_name, valid_cnes):
+def classify_establishments(establishments):
     """
-    Check the establishment on the CNES website.
+    Classify the establishments collected from a professional history using only the databases.
 
     Args:
-        cnes (str): CNES value.
-        establishment_name (str): Establishment name.
-        valid_cnes (list): List of valid CNES.
+        establishments (list): Unique (ibge_cnes, cnes, establishment_name) tuples, in the order they were found.
+
+    Returns:
+        valid_cnes (dict): Services mask (SERVICE_159 and SERVICE_152 bits) of each valid CNES found in the databases.
+        pending (list): Establishments not found in any database, which need to be checked on the CNES website.
     """
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(options=chrome_options)
+    valid_cnes = {}
+    pending = []
     
+    # Look up the services of every unique establishment in the in-memory index.
     try:
-        # Attempt to find the establishment by CNES value
-        if not open_cnes_page(driver, cnes):
-            # If not found, attempt to find by establishment name
-            cnes_encoded = urllib.parse.quote_plus(establishment_name)
-            if not open_cnes_page(driver, cnes_encoded):
-                logging.warning(f"The establishment {cnes} is not listed in CNES.")
-                return
-        
-        # Navigate through the website to find the required information
-        navigate_to_establishment_details(driver)
-        check_services(driver, cnes, valid_cnes)
-    finally:
-        driver.quit()
+        index = get_establishment_index()
+        masks = {key: index.services(key) for key, _, _ in establishments}
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        masks = {}
+    
+    count("unique_establishments", len(establishments))
+    for establishment in establishments:
+        ibge_cnes, cnes, _ = establishment
+        mask = masks.get(ibge_cnes)
+        if mask is not None and mask & APS_SERVICES:
+            count("db_hits_serv159152")
+            # A CNES listed under several IBGE codes offers the services of all of them.
+            valid_cnes[cnes] = valid_cnes.get(cnes, 0) | (mask & APS_SERVICES)
+        elif mask is None:
+            count("db_misses")
+            pending.append(establishment)
+        else:
+            count("db_hits_tabela_dados")
+    # An establishment whose CNES is already valid does not need to be checked again.
+    pending = [establishment for establishment in pending if establishment[1] not in valid_cnes]
+    return valid_cnes, pending
 
-def open_cnes_page(driver, search_value):
+def add_online_services(valid_cnes, pending, online_verdicts):
     """
-    Open the CNES page for the given search value.
+    Add to valid_cnes the services found on the CNES website for the establishments that were not in the databases.
 
     Args:
-        driver (webdriver): Selenium WebDriver instance.
-        search_value (str): Search value (CNES or establishment name).
+        valid_cnes (dict): Services mask of each valid CNES, updated in place.
+        pending (list): (ibge_cnes, cnes, establishment_name) tuples checked on the CNES website.
+        online_verdicts (dict): Services mask found for each IBGE+CNES, or None if its check failed.
 
     Returns:
-        bool: True if the page is opened successfully, False otherwise.
+        dict: valid_cnes.
     """
-    driver.get(f"https://cnes.datasus.gov.br/pages/estabelecimentos/consulta.jsp?search={search_value}")
-    return wait_for_element(driver, "body > div.layout > main > div > div.col-md-12.ng-scope > div > div:nth-child(9) > table > tbody > tr > td:nth-child(8) > a > span", By.CSS_SELECTOR, 5)
+    for ibge_cnes, cnes, _ in pending:
+        services = online_verdicts.get(ibge_cnes)
+        if services:
+            valid_cnes[cnes] = valid_cnes.get(cnes, 0) | services
+    return valid_cnes
 
-def navigate_to_establishment_details(driver):
+def resolve_offline(establishments, online_verdicts=None):
     """
-    Navigate to the establishment details page.
+    Resolve the establishments of a history without contacting the CNES website: by the databases,
+    then by the given verdicts and by the lookup cache.
 
     Args:
-        driver (webdriver): Selenium WebDriver instance.
+        establishments (list): Unique (ibge_cnes, cnes, establishment_name) tuples, in the order they were found.
+        online_verdicts (dict): Services mask found on the CNES website for some IBGE+CNES, checked before the cache.
+            None marks a check that failed, which leaves the establishment deferred unless the cache has a verdict.
+
+    Returns:
+        valid_cnes (dict): Services mask of each valid CNES.
+        deferred (list): Establishments without any verdict, which must be checked on the CNES website later.
     """
-    click_element(driver, "body > div.layout > main > div > div.col-md-12.ng-scope > div > div:nth-child(9) > table > tbody > tr > td:nth-child(8) > a > span")
-    wait_for_element(driver, "Conjunto", By.LINK_TEXT, 5)
-    click_element(driver, "Conjunto", by=By.LINK_TEXT)
-    wait_for_element(driver, "#estabContent > aside > section > ul > li.treeview.active > ul > li:nth-child(1)", By.CSS_SELECTOR, 5)
-    click_element(driver, "#estabContent > aside > section > ul > li.treeview.active > ul > li:nth-child(1)")
-    wait_for_element(driver, "//table[@ng-table='tableParamsServicosEspecializados']", By.XPATH, 5)
+    valid_cnes, pending = classify_establishments(establishments)
+    deferred = []
+    for establishment in pending:
+        ibge_cnes, cnes, establishment_name = establishment
+        if cnes in valid_cnes:
+            continue
+        if online_verdicts is not None and online_verdicts.get(ibge_cnes) is not None:
+            services = online_verdicts[ibge_cnes]
+        else:
+            verdict = cached_verdict(cnes, establishment_name)
+            if verdict is None:
+                deferred.append(establishment)
+                continue
+            services = verdict_services(verdict)
+        if services:
+            valid_cnes[cnes] = services
+    count("deferred_establishments", len(deferred))
+    return valid_cnes, deferred
 
-def check_services(driver, cnes, valid_cnes):
+def verify_establishment_online(cnes, establishment_name):
     """
-    Check the services provided by the establishment.
+    Check a single establishment on the CNES website, consulting the lookup cache first.
 
     Args:
-        driver (webdriver): Selenium WebDriver instance.
         cnes (str): CNES value.
-        valid_cnes (list): List of valid CNES.
+        establishment_name (str): Establishment name.
+
+    Returns:
+        int: Services mask (SERVICE_159 and SERVICE_152 bits) of the establishment, 0 if it offers neither,
+            or None if the check failed.
     """
-    rows = driver.find_elements(By.XPATH, "//table[@ng-table='tableParamsServicosEspecializados']//tbody//tr")
-    for table_row in rows:
-        code = table_row.find_element(By.XPATH, ".//td[@data-title-text='Código']").text
-        if code == "159":
-            valid_cnes.append(cnes)
-            break
-        elif code == "152":
-            break
+    verdict = cached_verdict(cnes, establishment_name)
+    if verdict is None:
+        try:
+            verdict = fetch_verdict(cnes, establishment_name)
+        except Exception as e:
+            # Failed checks are not cached, so they are retried on the next run.
+            logging.warning(f"Error checking establishment: {e}")
+            return None
+    return verdict_services(verdict)
 
-def wait_for_element(driver, selector, by, timeout):
+def cached_verdict(cnes, establishment_name):
+    """
+    Return the cached verdict of the CNES website for an establishment, or None if there is none.
     """
-    Wait for an element to be present on the page.
+    cache = get_lookup_cache()
+    if cache is None:
+        return None
+    verdict = cache.get(str(cnes), str(establishment_name))
+    count("lookup_cache_hits" if verdict is not None else "lookup_cache_misses")
+    return verdict
 
-    Args:
-        driver (webdriver): Selenium WebDriver instance.
-        selector (str): CSS selector or other selector.
-        by (By): Type of selector.
-        timeout (int): Timeout in seconds.
+def fetch_verdict(cnes, establishment_name):
+    """
+    Check an establishment on the CNES website and store the verdict in the lookup cache.
+    Errors are raised to the caller and nothing is cached.
 
     Returns:
-        bool: True if the element is found, False otherwise.
+        verdict (str): One of the lookup_cache.VERDICT_* values.
     """
+    cnes = str(cnes)
+    establishment_name = str(establishment_name)
+    count("online_lookups")
+    start = time.perf_counter()
     try:
-        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((by, selector)))
-        return True
-    except:
-        return False
+        verdict, by_name = lookup_establishment_online(cnes, establishment_name)
+    except Exception:
+        count("online_lookup_errors")
+        raise
+    finally:
+        observe("online_lookup", time.perf_counter() - start)
+    cache = get_lookup_cache()
+    if cache is not None:
+        cache.put(cnes, establishment_name, verdict, by_name)
+    return verdict
 
-def click_element(driver, selector, by=By.CSS_SELECTOR):
+def lookup_establishment_online(cnes, establishment_name):
     """
-    Click on an element on the page.
+    Check the establishment on the CNES website with the configured backend.
+    If the HTTP backend fails, the check is repeated with the browser.
 
-    Args:
-        driver (webdriver): Selenium WebDriver instance.
-        selector (str): CSS selector or other selector.
-        by (By): Type of selector.
+    Returns:
+        verdict (str): One of the lookup_cache.VERDICT_* values.
+        by_name (bool): True if the establishment was searched by name.
     """
-    element = driver.find_element(by, selector)
-    element.click()
+    if _lookup_backend == "http":
+        try:
+            return get_http_client().check_establishment(cnes, establishment_name)
+        except Exception as e:
+            logging.warning(f"HTTP check of the establishment {cnes} failed, using the browser: {e}")
+    return check_establishment_online(cnes, establishment_name, [])
 
+def check_establishment_online(cnes, establishment_name, valid_cnes):
+    """
+    Check the establishment on the CNES website with the browser, importing cnes_browser on first use.
 
+    Args:
+        cnes (str): CNES value.
+        establishment_name (str): Establishment name.
+        valid_cnes (list): List of valid CNES.
+
+    Returns:
+        verdict (str): One of the lookup_cache.VERDICT_* values.
+        by_name (bool): True if the establishment was searched by name.
+    """
+    from cnes_browser import check_establishment_browser
+    return check_establishment_browser(cnes, establishment_name, valid_cnes)
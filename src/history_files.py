@@ -0,0 +1,253 @@
+import io
+import os
+import gzip
+import time
+import logging
+import tarfile
+import threading
+
+HISTORY_EXTENSION = ".csv"
+# Suffix of the compressed histories, after ".csv" (prof001.csv.gz, prof001.csv.zst).
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# Compressions of the filtered files: "none" writes them as plain CSV.
+OUTPUT_COMPRESSIONS = ("none",) + tuple(COMPRESSION_SUFFIXES)
+GZIP_LEVEL = 6
+
+DEFAULT_BUNDLE_COMPRESSION = "gzip"
+DEFAULT_BUNDLE_FLUSH = 200
+
+# Compression of the filtered files, or None to keep the compression of each history.
+_output_compression = None
+_bundle = None
+_bundle_lock = threading.Lock()
+
+def compression_of(path):
+    """
+    Return the compression of a history from its suffix ("gzip" or "zstd"), or None for a plain CSV file.
+    """
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(HISTORY_EXTENSION + suffix):
+            return compression
+    return None
+
+def is_history_file(name):
+    """
+    Check if a file name is a professional history, plain or compressed.
+    """
+    return name.endswith(HISTORY_EXTENSION) or compression_of(name) is not None
+
+def history_name(path):
+    """
+    Name of a history without its folder, its extension and its compression suffix (prof001).
+    """
+    name = strip_compression(os.path.basename(path))
+    return name[:-len(HISTORY_EXTENSION)] if name.endswith(HISTORY_EXTENSION) else os.path.splitext(name)[0]
+
+def strip_compression(path):
+    """
+    Remove the compression suffix of a path, if any.
+    """
+    compression = compression_of(path)
+    return path[:-len(COMPRESSION_SUFFIXES[compression])] if compression is not None else path
+
+def with_compression(path, compression):
+    """
+    Return the path with the suffix of a compression instead of its own ("none" or None for plain CSV).
+    """
+    path = strip_compression(path)
+    return path + COMPRESSION_SUFFIXES[compression] if compression in COMPRESSION_SUFFIXES else path
+
+def _zstandard():
+    # zstd is optional: the package is only needed by the runs that read or write .zst histories.
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Reading or writing zstd histories requires the zstandard package (pip install zstandard).")
+    return zstandard
+
+def compress(data, compression):
+    """
+    Compress bytes with "gzip" or "zstd"; other values return the bytes unchanged.
+    """
+    if compression == "gzip":
+        # mtime=0 keeps the output identical for identical content.
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor().compress(data)
+    return data
+
+def decompress(data, compression):
+    """
+    Decompress bytes compressed with "gzip" or "zstd"; other values return the bytes unchanged.
+    """
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        # A decompression object also reads the frames that do not record their content size.
+        return _zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+def write_atomically(path, data):
+    """
+    Write bytes to a temporary file next to path and then replace path, so that a crash never leaves
+    a truncated file behind.
+    """
+    temporary_path = path + ".tmp"
+    try:
+        with open(temporary_path, mode='wb') as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def configure_output_compression(compression=None):
+    """
+    Set the compression of the filtered files: "none", "gzip", "zstd", or None to keep that of each history.
+    """
+    global _output_compression
+    if compression is not None and compression not in OUTPUT_COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd":
+        # Fail before the first history rather than on each of them.
+        _zstandard()
+    _output_compression = compression
+
+def filtered_path(file_path, output_dir=None):
+    """
+    Path of the filtered copy of a history, or None to rewrite the history in place.
+    With an output compression, the path has its suffix, so a history rewritten in place is converted.
+    """
+    path = os.path.join(output_dir, os.path.basename(file_path)) if output_dir else file_path
+    if _output_compression is not None:
+        path = with_compression(path, _output_compression)
+    return path if output_dir or path != file_path else None
+
+def store_history(file_path, output_path, text):
+    """
+    Store the filtered content of a history: in the bundle when one is configured, otherwise at output_path
+    (by default over the history), compressed according to its suffix and written atomically.
+    When the filtered file replaces the history in its own folder with another compression, the history is removed.
+
+    Args:
+        file_path (str): Path of the history.
+        output_path (str): Path of the filtered file, or None to rewrite the history in place.
+        text (str): Filtered content.
+    """
+    data = text.encode("utf-8")
+    bundle = _bundle
+    if bundle is not None:
+        bundle.add(file_path, data)
+        return
+    target = output_path or file_path
+    write_atomically(target, compress(data, compression_of(target)))
+    if (target != file_path and strip_compression(os.path.abspath(target)) == strip_compression(os.path.abspath(file_path))
+            and os.path.exists(file_path)):
+        os.remove(file_path)
+
+class HistoryBundle:
+    """
+    Tar archive of filtered histories, each member compressed on its own (prof001.csv.gz), appended to by
+    every run. A history added again gets a new member, which is the one kept by tar extraction.
+
+    Members are buffered and appended in batches of `flush_every`. Each batch is written after the last
+    complete member and synced to disk; a member cut by a crash is dropped when the bundle is opened again,
+    so the members already written are never lost.
+    """
+
+    def __init__(self, path, compression=DEFAULT_BUNDLE_COMPRESSION, flush_every=DEFAULT_BUNDLE_FLUSH):
+        self.path = path
+        self.compression = compression
+        self.flush_every = max(1, flush_every)
+        self.members = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._end = self._find_end()
+
+    def _find_end(self):
+        """
+        Return the offset after the last complete member of the existing bundle, or 0 for a new one.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+        end = 0
+        try:
+            with tarfile.open(self.path, mode='r:') as archive:
+                for member in archive:
+                    if member.offset_data + member.size > size:
+                        break
+                    end = member.offset_data + -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        except tarfile.TarError as e:
+            logging.warning(f"Bundle {self.path} is damaged after {end} bytes, which will be overwritten: {e}")
+        return end
+
+    def add(self, file_path, data):
+        """
+        Add the filtered content of a history, written with the next batch.
+        """
+        name = with_compression(history_name(file_path) + HISTORY_EXTENSION, self.compression)
+        member = (name, compress(data, self.compression))
+        with self._lock:
+            self._pending.append(member)
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        """
+        Append the buffered members to the bundle.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with open(self.path, mode='r+b' if os.path.exists(self.path) else 'w+b') as file:
+            file.seek(self._end)
+            file.truncate()
+            # The archive starts at the current position of the file, after the existing members.
+            archive = tarfile.open(fileobj=file, mode='w')
+            modified = time.time()
+            for name, data in self._pending:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = modified
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
+            end = archive.offset
+            archive.close()
+            file.flush()
+            os.fsync(file.fileno())
+        self._end = end
+        self.members += len(self._pending)
+        self._pending = []
+
+    def close(self):
+        """
+        Append the remaining members.
+        """
+        self.flush()
+        logging.info(f"{self.members} filtered histories added to the bundle {self.path}.")
+
+def configure_bundle(path=None, compression=DEFAULT_BUNDLE_COMPRESSION, flush_every=DEFAULT_BUNDLE_FLUSH):
+    """
+    Write the filtered histories to a bundle instead of separate files, or back to separate files if path is None.
+    """
+    global _bundle
+    with _bundle_lock:
+        _bundle = HistoryBundle(path, compression, flush_every) if path else None
+
+def close_bundle():
+    """
+    Append the remaining members of the process-wide bundle, if any.
+    """
+    global _bundle
+    with _bundle_lock:
+        bundle, _bundle = _bundle, None
+    if bundle is not None:
+        try:
+            bundle.close()
+        except OSError as e:
+            logging.error(f"Error writing the bundle {bundle.path}: {e}")
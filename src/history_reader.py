@@ -0,0 +1,241 @@
+import io
+import os
+import csv
+import mmap
+import codecs
+from itertools import chain, islice
+from operator import itemgetter, methodcaller
+from cbo_classifier import normalize_description
+from history_files import compression_of, decompress
+
+# Columns read from a professional history, in the order of the projected fields of each row.
+PROJECTED_COLUMNS = ("COMP.", "CNES", "IBGE", "CHS AMB.", "DESCRICAO CBO", "ESTABELECIMENTO")
+REQUIRED_COLUMNS = ("COMP.", "CNES", "CHS AMB.", "DESCRICAO CBO")
+
+# Encoding of the CNES exports that are not UTF-8.
+FALLBACK_ENCODING = "ISO-8859-1"
+DELIMITER = ";"
+# Characters decoded and split at a time, and rows parsed at a time by the csv module.
+CHUNK_SIZE = 1 << 20
+CHUNK_ROWS = 8192
+
+class HistoryHeaderError(ValueError):
+    """
+    Raised when the header of a professional history lacks a required column.
+    """
+
+def column_key(name):
+    """
+    Comparable form of a column name, so that the variants of the CNES exports match:
+    "Descrição CBO" and "DESCRICAO CBO", "CHS AMB" and "CHS AMB.", names with a BOM or extra spaces.
+    """
+    return " ".join(normalize_description(name.lstrip("\ufeff")).replace(".", " ").split())
+
+_PROJECTED_KEYS = tuple(column_key(name) for name in PROJECTED_COLUMNS)
+
+class MappedHistory(io.RawIOBase):
+    """
+    Binary stream over a memory-mapped history, from which io.TextIOWrapper decodes the content chunk by
+    chunk. Closing the stream closes the map and the file.
+    """
+
+    def __init__(self, file, mapping, position=0):
+        self._file = file
+        self._map = mapping
+        self._position = position
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._map[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+            self._file.close()
+        super().close()
+
+def detect_encoding(data):
+    """
+    Find the encoding of a history: UTF-8 with or without BOM, UTF-16 with BOM, or else ISO-8859-1.
+    The UTF-8 content is validated chunk by chunk, without building the decoded text.
+
+    Args:
+        data (bytes-like): Raw content, for example a mapped file.
+
+    Returns:
+        encoding (str): Encoding of the content.
+        start (int): Position of the content after the BOM.
+    """
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        # The utf-16 codec reads the BOM itself.
+        return "utf-16", 0
+    start = 3 if data[:3] == codecs.BOM_UTF8 else 0
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for position in range(start, len(data), CHUNK_SIZE):
+            decoder.decode(data[position:position + CHUNK_SIZE])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING, start
+    return "utf-8", start
+
+def decode_history(data):
+    """
+    Decode the whole content of a history, for example the body of a request. See detect_encoding.
+
+    Returns:
+        str: Decoded content, without the BOM.
+    """
+    encoding, start = detect_encoding(data)
+    return str(data[start:], encoding)
+
+def open_history(file_path):
+    """
+    Open a history as a text stream with universal newlines, decoded from the mapped pages as it is read.
+    A compressed history (.csv.gz or .csv.zst) is decompressed in memory instead.
+    """
+    compression = compression_of(file_path)
+    if compression is not None:
+        with open(file_path, mode='rb') as file:
+            data = decompress(file.read(), compression)
+        encoding, start = detect_encoding(data)
+        raw = io.BytesIO(data)
+        raw.seek(start)
+        return io.TextIOWrapper(raw, encoding=encoding, newline=None)
+    file = open(file_path, mode='rb')
+    try:
+        if os.fstat(file.fileno()).st_size == 0:
+            file.close()
+            return io.StringIO("")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        file.close()
+        raise
+    encoding, start = detect_encoding(mapping)
+    return io.TextIOWrapper(io.BufferedReader(MappedHistory(file, mapping, start)), encoding=encoding, newline=None)
+
+def resolve_columns(fieldnames, source):
+    """
+    Find the position of each projected column in the header.
+
+    Returns:
+        list: Position of each column of PROJECTED_COLUMNS, or None for the optional columns that are missing.
+
+    Raises:
+        HistoryHeaderError: If a required column is missing.
+    """
+    positions = {}
+    for position, name in enumerate(fieldnames):
+        positions.setdefault(column_key(name), position)
+    indexes = [positions.get(key) for key in _PROJECTED_KEYS]
+    missing = [name for name, index in zip(PROJECTED_COLUMNS, indexes) if index is None and name in REQUIRED_COLUMNS]
+    if missing:
+        raise HistoryHeaderError(f"Missing columns in the header of {source}: {', '.join(missing)} "
+                                 f"(found: {'; '.join(fieldnames)}).")
+    return indexes
+
+def read_chunks(stream, width):
+    """
+    Split the lines of a history into their fields, a chunk of lines at a time, skipping the empty lines.
+
+    Without quotes in a chunk, its lines are split directly, which is much faster than the csv module.
+    From the first chunk with a quote on, the csv module parses the rest of the content.
+
+    Args:
+        stream (io.TextIOBase): Content after the header, with universal newlines.
+        width (int): Number of columns of the header; shorter lines are padded to it.
+
+    Yields:
+        list: Fields of each line of the chunk.
+    """
+    while True:
+        lines = stream.readlines(CHUNK_SIZE)
+        if not lines:
+            return
+        text = "".join(lines)
+        if '"' in text:
+            break
+        lines = list(filter(None, text.split("\n")))
+        if not lines:
+            continue
+        # One count over the whole chunk tells whether every line has as many fields as the header.
+        if (text.count(DELIMITER) != (width - 1) * len(lines)
+                and min(map(methodcaller("count", DELIMITER), lines)) < width - 1):
+            lines = [line + DELIMITER * max(0, width - 1 - line.count(DELIMITER)) for line in lines]
+        yield list(map(methodcaller("split", DELIMITER), lines))
+
+    # A quoted field may span lines, so the csv module reads the rest of the stream from this chunk on.
+    reader = csv.reader(chain(lines, stream), delimiter=DELIMITER)
+    while True:
+        rows = list(islice(reader, CHUNK_ROWS))
+        if not rows:
+            return
+        rows = [row for row in rows if row]
+        for row in rows:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+        yield rows
+
+def iter_history(stream, source="history"):
+    """
+    Parse a professional history, projecting each row on the columns that the rules use.
+    The content is read from the stream as the rows are consumed, one chunk at a time (see read_chunks).
+
+    Args:
+        stream (io.TextIOBase): Content of the history, starting with the header, with universal newlines.
+        source (str): Name of the history in the error messages.
+
+    Returns:
+        fieldnames (list): Header of the history, or None if it is empty.
+        rows (iterator): (fields, row) for each line, where fields holds the values of PROJECTED_COLUMNS
+            (None for a missing optional column) and row is the list of all the fields of the line, padded
+            to the header width.
+
+    Raises:
+        HistoryHeaderError: If a required column is missing.
+    """
+    for header in stream:
+        header = header.rstrip("\n")
+        if header:
+            break
+    else:
+        return None, iter(())
+    if '"' in header:
+        fieldnames = next(csv.reader([header], delimiter=DELIMITER))
+    else:
+        fieldnames = header.split(DELIMITER)
+    fieldnames[0] = fieldnames[0].lstrip("\ufeff")
+    indexes = resolve_columns(fieldnames, source)
+    if None in indexes:
+        project = lambda row: tuple(row[index] if index is not None else None for index in indexes)
+    else:
+        project = itemgetter(*indexes)
+    # The splitting and the projection of a chunk run in C, without a Python function call per line.
+    return fieldnames, chain.from_iterable(zip(map(project, rows), rows) for rows in read_chunks(stream, len(fieldnames)))
+
+def read_history_file(file_path):
+    """
+    Open and parse a professional history, see iter_history. The file is closed once its rows are consumed.
+    """
+    stream = open_history(file_path)
+    try:
+        fieldnames, rows = iter_history(stream, file_path)
+    except BaseException:
+        stream.close()
+        raise
+    if fieldnames is None:
+        stream.close()
+        return None, rows
+    return fieldnames, close_after(stream, rows)
+
+def close_after(stream, rows):
+    """
+    Yield the rows read from a stream, then close it.
+    """
+    with stream:
+        yield from rows
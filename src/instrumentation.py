@@ -0,0 +1,228 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds, in seconds, of the buckets of the latency histograms. The last bucket has no bound.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Run metrics, or None while the instrumentation is disabled.
+_run = None
+_files = {}
+_current = threading.local()
+_lock = threading.Lock()
+_disabled_timer = nullcontext()
+
+class Metrics:
+    """
+    Counters, timers and latency histograms of a run or of a single file.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}  # name: [calls, total seconds, max seconds]
+        self.histograms = {}  # name: count per bucket of LATENCY_BUCKETS, plus one for the slower values
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """
+        Increase a counter.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        """
+        Add one call of `seconds` to a timer.
+        """
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def observe(self, name, seconds):
+        """
+        Add a latency to a histogram.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [0] * (len(LATENCY_BUCKETS) + 1)
+            position = len(LATENCY_BUCKETS)
+            for bucket, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    position = bucket
+                    break
+            histogram[position] += 1
+
+    def merge(self, data):
+        """
+        Add the metrics exported by to_dict, for example by a worker process.
+        """
+        for name, value in data["counters"].items():
+            self.count(name, value)
+        with self._lock:
+            for name, timer in data["timers"].items():
+                current = self.timers.setdefault(name, [0, 0.0, 0.0])
+                current[0] += timer["calls"]
+                current[1] += timer["total"]
+                current[2] = max(current[2], timer["max"])
+            for name, histogram in data["histograms"].items():
+                current = self.histograms.setdefault(name, [0] * (len(LATENCY_BUCKETS) + 1))
+                for bucket, value in enumerate(histogram["counts"]):
+                    current[bucket] += value
+
+    def to_dict(self):
+        """
+        Export the metrics as a JSON-serializable dictionary.
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {name: {"calls": calls, "total": total, "max": longest}
+                           for name, (calls, total, longest) in self.timers.items()},
+                "histograms": {name: {"buckets": list(LATENCY_BUCKETS) + [None], "counts": list(counts)}
+                               for name, counts in self.histograms.items()}
+            }
+
+def enable_instrumentation():
+    """
+    Start collecting metrics for the run.
+    """
+    global _run
+    with _lock:
+        _run = Metrics()
+        _files.clear()
+
+def instrumentation_enabled():
+    """
+    Return True if metrics are being collected.
+    """
+    return _run is not None
+
+def _targets():
+    file_metrics = getattr(_current, "metrics", None)
+    if file_metrics is None:
+        return (_run,)
+    # An isolated file scope only records into the file, which is merged into the run afterwards.
+    return (file_metrics,) if _current.isolated else (_run, file_metrics)
+
+def count(name, value=1):
+    """
+    Increase a counter of the run and of the file being processed. Does nothing while disabled.
+    """
+    if _run is None:
+        return
+    for metrics in _targets():
+        metrics.count(name, value)
+
+def observe(name, seconds):
+    """
+    Record a latency in a histogram, as well as in the timer of the same name. Does nothing while disabled.
+    """
+    if _run is None:
+        return
+    for metrics in _targets():
+        metrics.observe(name, seconds)
+        metrics.add_time(name, seconds)
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for metrics in _targets():
+            metrics.add_time(name, elapsed)
+
+def timer(name):
+    """
+    Context manager adding the time spent in the with block to a timer. Does nothing while disabled.
+    """
+    if _run is None:
+        return _disabled_timer
+    return _timed(name)
+
+@contextmanager
+def file_scope(file_path, isolated=False):
+    """
+    Attribute the metrics recorded in the with block, in this thread, to a file.
+    With isolated=True they are not added to the run, which is left to merge_file_metrics.
+    """
+    if _run is None:
+        yield
+        return
+    metrics = Metrics()
+    _current.metrics = metrics
+    _current.isolated = isolated
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.metrics = None
+        metrics.add_time("file", elapsed)
+        if not isolated:
+            _run.add_time("file", elapsed)
+        with _lock:
+            existing = _files.get(file_path)
+            if existing is None:
+                _files[file_path] = metrics
+        # A file may go through several scopes, for example one per pipeline stage.
+        if existing is not None:
+            existing.merge(metrics.to_dict())
+
+def run_in_file_scope(function, file_path, *args):
+    """
+    Call function(file_path, *args) within an isolated file_scope and return its result with the metrics
+    of the file, so that worker processes can send them back to merge_file_metrics in the main process.
+    """
+    with file_scope(file_path, isolated=True):
+        result = function(file_path, *args)
+    with _lock:
+        metrics = _files.pop(file_path, None)
+    return result, metrics.to_dict() if metrics is not None else None
+
+def merge_file_metrics(file_path, data):
+    """
+    Add the metrics of a file processed by a worker process to the run.
+    """
+    if _run is None or data is None:
+        return
+    with _lock:
+        metrics = _files.setdefault(file_path, Metrics())
+    metrics.merge(data)
+    _run.merge(data)
+
+def summary(extra=None):
+    """
+    Return the metrics of the run and of each file.
+    """
+    if _run is None:
+        return None
+    with _lock:
+        files = {file_path: metrics.to_dict() for file_path, metrics in _files.items()}
+    data = {"run": _run.to_dict(), "files": files}
+    if extra:
+        data.update(extra)
+    return data
+
+def write_summary(path, extra=None):
+    """
+    Write the metrics of the run as JSON. Does nothing while disabled.
+    """
+    data = summary(extra)
+    if data is None:
+        return
+    try:
+        with open(path, mode="w", encoding="utf-8") as file:
+            json.dump(data, file, indent=1)
+        logging.info(f"Run metrics written to {path}.")
+    except OSError as e:
+        logging.error(f"Error writing run metrics {path}: {e}")
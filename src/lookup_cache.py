@@ -0,0 +1,247 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from establishment_index import SERVICE_159, SERVICE_152, SERVICE_ONLINE, get_competencia
+
+# Verdicts of the CNES website for an establishment.
+VERDICT_159 = "159"  # The establishment offers the service 159 but not 152.
+VERDICT_152 = "152"  # The establishment offers the service 152 but not 159.
+VERDICT_159_152 = "159+152"  # The establishment offers both services.
+VERDICT_NO_SERVICE = "none"  # The establishment is listed without those services.
+VERDICT_NOT_LISTED = "not_listed"  # The establishment was found neither by CNES nor by name.
+
+# Services mask of each verdict.
+VERDICT_SERVICES = {VERDICT_159: SERVICE_159, VERDICT_152: SERVICE_152, VERDICT_159_152: SERVICE_159 | SERVICE_152,
+                    VERDICT_NO_SERVICE: 0, VERDICT_NOT_LISTED: 0}
+
+# Bit of the services mask of each service code listed on the CNES website.
+SERVICE_BITS = {"159": SERVICE_159, "152": SERVICE_152}
+
+# Version 1: "159" and "152" no longer mean the first of those services listed, which could hide the other one.
+CACHE_VERSION = 1
+
+# Default location and lifetime of the cached verdicts.
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "..", "databases", "cnes_lookup_cache.db")
+DEFAULT_TTL_DAYS = 30
+DEFAULT_NEGATIVE_TTL_DAYS = 7
+
+# Key used for the verdicts found by the CNES search, which do not depend on the establishment name.
+CNES_SEARCH = ""
+
+_cache = None
+_cache_settings = {"path": DEFAULT_CACHE_PATH, "ttl_days": DEFAULT_TTL_DAYS,
+                   "negative_ttl_days": DEFAULT_NEGATIVE_TTL_DAYS, "enabled": True}
+_cache_lock = threading.Lock()
+
+def verdict_services(verdict):
+    """
+    Return the services mask (SERVICE_159 and SERVICE_152 bits) of a verdict, with SERVICE_ONLINE set
+    when the establishment offers any of them, or 0 if it offers neither.
+    """
+    services = VERDICT_SERVICES.get(verdict, 0)
+    return services | SERVICE_ONLINE if services else 0
+
+def services_verdict(services):
+    """
+    Return the verdict of a listed establishment from the services mask found on the CNES website.
+    """
+    services &= SERVICE_159 | SERVICE_152
+    for verdict, mask in VERDICT_SERVICES.items():
+        if mask == services:
+            return verdict
+    return VERDICT_NO_SERVICE
+
+class LookupCache:
+    """
+    Persistent cache of the verdicts of the CNES website, stored in a SQLite file.
+
+    A verdict found by the CNES search is stored under the CNES alone. A verdict that needed the
+    name-based search (or that was not found at all) is stored under the CNES and the establishment name.
+    Negative verdicts (not listed) expire after negative_ttl_days; the others after ttl_days.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS, negative_ttl_days=DEFAULT_NEGATIVE_TTL_DAYS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.negative_ttl = negative_ttl_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                cnes TEXT NOT NULL,
+                establishment_name TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                competencia TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (cnes, establishment_name)
+            )
+        """)
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] < CACHE_VERSION:
+            # The verdicts with a single service of an older cache are checked again.
+            self._connection.execute("DELETE FROM lookups WHERE verdict IN (?, ?)", (VERDICT_159, VERDICT_152))
+            self._connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self._connection.commit()
+
+    def get(self, cnes, establishment_name):
+        """
+        Return the cached verdict of an establishment, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT verdict, checked_at FROM lookups WHERE cnes = ? AND establishment_name IN (?, ?) "
+                "ORDER BY establishment_name = ? DESC",
+                (cnes, CNES_SEARCH, establishment_name, CNES_SEARCH)).fetchall()
+            for verdict, checked_at in rows:
+                if now - checked_at <= self._ttl_of(verdict):
+                    self.hits += 1
+                    return verdict
+            self.misses += 1
+            return None
+
+    def put(self, cnes, establishment_name, verdict, by_name=True, competencia=None):
+        """
+        Store the verdict of an establishment.
+
+        Args:
+            cnes (str): CNES value.
+            establishment_name (str): Establishment name.
+            verdict (str): One of the VERDICT_* values.
+            by_name (bool): False if the establishment was found by the CNES search.
+            competencia (str): Competência (YYYYMM) the verdict refers to. Defaults to the configured competência
+                of the reference databases, whose gaps the CNES website fills.
+        """
+        key_name = establishment_name if by_name else CNES_SEARCH
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO lookups (cnes, establishment_name, verdict, competencia, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cnes, key_name, verdict, competencia or get_competencia(), time.time()))
+            self._connection.commit()
+
+    def entries(self, cnes=None):
+        """
+        Return the cached entries as (cnes, establishment_name, verdict, competencia, checked_at, expired) tuples.
+        """
+        query = "SELECT cnes, establishment_name, verdict, competencia, checked_at FROM lookups"
+        parameters = ()
+        if cnes is not None:
+            query += " WHERE cnes = ?"
+            parameters = (cnes,)
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY cnes, establishment_name", parameters).fetchall()
+        return [row + (now - row[4] > self._ttl_of(row[2]),) for row in rows]
+
+    def purge(self, expired_only=False, negative_only=False, cnes=None, before_competencia=None):
+        """
+        Delete cached entries.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        now = time.time()
+        conditions = []
+        parameters = []
+        if expired_only:
+            conditions.append("((verdict = ? AND checked_at < ?) OR (verdict <> ? AND checked_at < ?))")
+            parameters += [VERDICT_NOT_LISTED, now - self.negative_ttl, VERDICT_NOT_LISTED, now - self.ttl]
+        if negative_only:
+            conditions.append("verdict = ?")
+            parameters.append(VERDICT_NOT_LISTED)
+        if cnes is not None:
+            conditions.append("cnes = ?")
+            parameters.append(cnes)
+        if before_competencia is not None:
+            conditions.append("competencia < ?")
+            parameters.append(before_competencia)
+        query = "DELETE FROM lookups"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            deleted = self._connection.execute(query, parameters).rowcount
+            self._connection.commit()
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _ttl_of(self, verdict):
+        return self.negative_ttl if verdict == VERDICT_NOT_LISTED else self.ttl
+
+def configure_lookup_cache(path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS,
+                           negative_ttl_days=DEFAULT_NEGATIVE_TTL_DAYS, enabled=True):
+    """
+    Set the location and lifetime of the process-wide cache. Must be called before the first lookup.
+    """
+    _cache_settings.update(path=path, ttl_days=ttl_days, negative_ttl_days=negative_ttl_days, enabled=enabled)
+
+def get_lookup_cache():
+    """
+    Return the process-wide cache, opening it on first use, or None if it is disabled or unavailable.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and _cache_settings["enabled"]:
+            try:
+                _cache = LookupCache(_cache_settings["path"], _cache_settings["ttl_days"],
+                                     _cache_settings["negative_ttl_days"])
+            except sqlite3.Error as e:
+                logging.error(f"Error opening the lookup cache {_cache_settings['path']}: {e}")
+                _cache_settings["enabled"] = False
+        return _cache
+
+def close_lookup_cache():
+    """
+    Log the hit rate of the process-wide cache, if it was used, and close it.
+    """
+    global _cache
+    with _cache_lock:
+        cache, _cache = _cache, None
+    if cache is None:
+        return
+    logging.info(f"Lookup cache: {cache.hits} hits, {cache.misses} misses.")
+    cache.close()
+
+def main():
+    """
+    Command line interface to inspect and purge the cache.
+    """
+    parser = argparse.ArgumentParser(description="Inspect or purge the cache of CNES website verdicts.")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH, help="Path to the cache file.")
+    parser.add_argument("--ttl-days", type=float, default=DEFAULT_TTL_DAYS, help="Lifetime of the verdicts, in days.")
+    parser.add_argument("--negative-ttl-days", type=float, default=DEFAULT_NEGATIVE_TTL_DAYS,
+                        help="Lifetime of the 'not listed' verdicts, in days.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    inspect_parser = subparsers.add_parser("inspect", help="List the cached verdicts.")
+    inspect_parser.add_argument("--cnes", help="Show only this CNES.")
+    purge_parser = subparsers.add_parser("purge", help="Delete cached verdicts. Without filters, deletes everything.")
+    purge_parser.add_argument("--expired", action="store_true", help="Delete only the expired verdicts.")
+    purge_parser.add_argument("--negative", action="store_true", help="Delete only the 'not listed' verdicts.")
+    purge_parser.add_argument("--cnes", help="Delete only this CNES.")
+    purge_parser.add_argument("--before", help="Delete only the verdicts of competências before this one (YYYYMM).")
+    args = parser.parse_args()
+
+    cache = LookupCache(args.path, args.ttl_days, args.negative_ttl_days)
+    try:
+        if args.command == "inspect":
+            entries = cache.entries(args.cnes)
+            for cnes, establishment_name, verdict, competencia, checked_at, expired in entries:
+                checked = time.strftime("%Y-%m-%d %H:%M", time.localtime(checked_at))
+                print(f"{cnes};{establishment_name or '(CNES search)'};{verdict};{competencia};{checked}"
+                      f"{';expired' if expired else ''}")
+            print(f"{len(entries)} entries, {sum(1 for entry in entries if entry[5])} expired.")
+        else:
+            deleted = cache.purge(args.expired, args.negative, args.cnes, args.before)
+            print(f"{deleted} entries deleted.")
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
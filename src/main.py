@@ -1,8 +1,25 @@
 import os
 import time
 import logging
-from processing import process_csv
-from report_generator import report_file, report_terminal
+import cProfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from processing import process_csv, score_csv, score_offline
+from establishment_validator import LOOKUP_BACKENDS
+from async_verifier import verify_establishments, DEFAULT_CONCURRENCY, DEFAULT_RATE, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from cnes_http import close_http_client
+from establishment_history import DEFAULT_HISTORY_PATH
+from report_generator import report_file, report_terminal, get_report_dir, update_report
+from pipeline import run_pipeline, DEFAULT_QUEUE_SIZE, DEFAULT_RESOLVERS, DEFAULT_FLUSH_EVERY
+from instrumentation import file_scope, run_in_file_scope, merge_file_metrics, write_summary
+from establishment_index import get_establishment_index, set_establishment_index, DEFAULT_COMPETENCIA
+from lookup_cache import close_lookup_cache, DEFAULT_TTL_DAYS, DEFAULT_NEGATIVE_TTL_DAYS
+from manifest import Manifest, MANIFEST_NAME, reference_fingerprint
+from deferred_queue import DeferredQueue, DEFERRED_QUEUE_NAME
+from history_files import (is_history_file, filtered_path, configure_bundle, close_bundle,
+                           OUTPUT_COMPRESSIONS, DEFAULT_BUNDLE_COMPRESSION, DEFAULT_BUNDLE_FLUSH)
+from driver_pool import close_driver_pool, DEFAULT_POOL_SIZE, DEFAULT_MAX_USES
+from run_settings import RunSettings
 
 def setup_logging():
     """
@@ -10,37 +27,415 @@ def setup_logging():
     """
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def init_worker(settings, index):
+    """
+    Initializer of the worker processes. Workers started with spawn or forkserver do not inherit the
+    settings of the main process, so they are applied again, and the index already loaded by the main
+    process is reused instead of being read again.
+
+    Args:
+        settings (RunSettings): Settings of the run.
+        index (EstablishmentIndex): Establishment index of the main process.
+    """
+    setup_logging()
+    settings.apply()
+    set_establishment_index(index)
+
 def get_assets_path():
     """
     Get the absolute path to the assets folder.
     """
     return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "assets"))
 
-def process_files(assets_path, overall_result):
+def get_filtered_path():
     """
-    Process all CSV files in the specified assets folder.
-    Returns:
-        None
+    Get the absolute path to the default folder of the filtered files.
+    """
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "filtered"))
+
+def list_csv_files(assets_path):
+    """
+    List the CSV files in the specified assets folder, plain or compressed, in the order they are processed.
     """
     try:
         # Use os.scandir to iterate over entries in the assets_path directory
         with os.scandir(assets_path) as entries:
-            for entry in entries:
-                if entry.is_file() and entry.name.endswith('.csv'):
-                    try:
-                        valid_months = process_csv(entry.path, overall_result)
-                        report_terminal(entry.path, valid_months)
-                    except Exception as e:
-                        logging.error(f"Error processing file {entry.path}: {e}")
+            return [entry.path for entry in entries if entry.is_file() and is_history_file(entry.name)]
     except Exception as e:
         logging.error(f"Error accessing directory {assets_path}: {e}")
+        return []
+
+def get_output_path(file_path, output_dir):
+    """
+    Path of the filtered copy of a CSV file, or None to rewrite the file in place.
+    """
+    return filtered_path(file_path, output_dir)
+
+def process_files(assets_path, overall_result, output_dir=None, manifest=None):
+    """
+    Process all CSV files in the specified assets folder.
+
+    Args:
+        assets_path (str): Path to the assets folder.
+        overall_result (dict): Dictionary to store the results of all files.
+        output_dir (str): Folder of the filtered files. By default, the files are rewritten in place.
+        manifest (Manifest): Record of the files already processed, used to skip the unchanged ones.
+    Returns:
+        None
+    """
+    # Load the establishment index once so that every file reuses it.
+    get_establishment_index()
+    for file_path in list_csv_files(assets_path):
+        output_path = get_output_path(file_path, output_dir)
+        stored = manifest.lookup(file_path, output_path) if manifest is not None else None
+        if stored is not None:
+            valid_months, overall_result[file_path] = stored
+            report_terminal(file_path, valid_months)
+            continue
+        try:
+            unresolved = []
+            with file_scope(file_path):
+                valid_months = process_csv(file_path, overall_result, output_path, unresolved)
+            report_terminal(file_path, valid_months)
+            if manifest is not None and file_path in overall_result:
+                manifest.record(file_path, valid_months, overall_result[file_path], unresolved)
+        except Exception as e:
+            logging.error(f"Error processing file {file_path}: {e}")
 
+def process_files_parallel(assets_path, overall_result, workers, verify_options, output_dir=None, manifest=None,
+                           settings=None):
+    """
+    Process all CSV files in the specified assets folder in two rounds.
+    The files are first parsed and validated using only the databases, by a pool of worker processes
+    (or by a single thread if workers is 1). The establishments that are not in the databases are then
+    collected across all files and checked on the CNES website concurrently, and the affected files are
+    scored again with those verdicts. The results are merged into overall_result in the same order as
+    process_files, so the report is identical to a serial run.
+
+    Args:
+        assets_path (str): Path to the assets folder.
+        overall_result (dict): Dictionary to store the results of all files.
+        workers (int): Number of worker processes.
+        verify_options (dict): Options of async_verifier.verify_establishments.
+        output_dir (str): Folder of the filtered files. By default, the files are rewritten in place.
+        manifest (Manifest): Record of the files already processed, used to skip the unchanged ones.
+        settings (RunSettings): Settings of the run, applied in each worker process. Without them, the workers
+            only have the settings they inherit when they are forked.
+    """
+    # Load the establishment index before starting the workers, which receive it.
+    index = get_establishment_index()
+    file_paths = list_csv_files(assets_path)
+    outcomes = {}
+    pending_files = {}
+    output_paths = {file_path: get_output_path(file_path, output_dir) for file_path in file_paths}
+
+    # Reuse the results of the unchanged files.
+    stored_paths = set()
+    if manifest is not None:
+        for file_path in file_paths:
+            stored = manifest.lookup(file_path, output_paths[file_path])
+            if stored is not None:
+                outcomes[file_path] = (stored[0], stored[1], [])
+                stored_paths.add(file_path)
+
+    if workers > 1:
+        initializer = {"initializer": init_worker, "initargs": (settings, index)} if settings is not None else {}
+        executor = ProcessPoolExecutor(max_workers=workers, **initializer)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+    with executor:
+        # First round: files whose establishments are all in the databases are finished right away.
+        futures = {executor.submit(run_in_file_scope, score_csv, file_path, None, output_paths[file_path]): file_path
+                   for file_path in file_paths if file_path not in stored_paths}
+        for file_path, outcome in collect_outcomes(futures):
+            if outcome is not None and outcome[2]:
+                pending_files[file_path] = outcome[2]
+            else:
+                outcomes[file_path] = outcome
+
+        # Check each establishment that is not in the databases only once, whatever the number of files.
+        online_verdicts = verify_establishments(
+            (establishment for pending in pending_files.values() for establishment in pending), **verify_options)
+
+        # Second round: score the pending files with the verdicts of the CNES website.
+        futures = {}
+        for file_path, pending in pending_files.items():
+            file_verdicts = {ibge_cnes: online_verdicts.get(ibge_cnes) for ibge_cnes, _, _ in pending}
+            futures[executor.submit(run_in_file_scope, score_csv, file_path, file_verdicts,
+                                    output_paths[file_path])] = file_path
+        outcomes.update(collect_outcomes(futures))
+
+    # Merge the results in a deterministic order.
+    for file_path in file_paths:
+        outcome = outcomes.get(file_path)
+        if outcome is None:
+            continue
+        valid_months, result, _ = outcome
+        if result is not None:
+            overall_result[file_path] = result
+            if manifest is not None and file_path not in stored_paths:
+                unresolved = [establishment for establishment in pending_files.get(file_path, ())
+                              if online_verdicts.get(establishment[0]) is None]
+                manifest.record(file_path, valid_months, result, unresolved)
+        report_terminal(file_path, valid_months)
+
+def process_files_batch(assets_path, overall_result, verify_options, output_dir=None, manifest=None):
+    """
+    Process all CSV files in the specified assets folder as a single batch, with the vectorized engine
+    of batch_engine.py. The results are the same as process_files_parallel.
+
+    Args:
+        assets_path (str): Path to the assets folder.
+        overall_result (dict): Dictionary to store the results of all files.
+        verify_options (dict): Options of async_verifier.verify_establishments.
+        output_dir (str): Folder of the filtered files. By default, the files are rewritten in place.
+        manifest (Manifest): Record of the files already processed, used to skip the unchanged ones.
+    """
+    # NumPy is only needed by the batch engine, so it is imported only when the engine is used.
+    from batch_engine import score_batch
+
+    get_establishment_index()
+    file_paths = list_csv_files(assets_path)
+    output_paths = {file_path: get_output_path(file_path, output_dir) for file_path in file_paths}
+    stored = {}
+    if manifest is not None:
+        for file_path in file_paths:
+            outcome = manifest.lookup(file_path, output_paths[file_path])
+            if outcome is not None:
+                stored[file_path] = outcome
+
+    batch_result = {}
+    unresolved = {}
+    valid_months = score_batch([file_path for file_path in file_paths if file_path not in stored],
+                               batch_result, output_paths, verify_options, unresolved)
+
+    # Merge the results in the same order as process_files.
+    for file_path in file_paths:
+        if file_path in stored:
+            valid_months[file_path], batch_result[file_path] = stored[file_path]
+        elif manifest is not None and file_path in batch_result:
+            manifest.record(file_path, valid_months[file_path], batch_result[file_path], unresolved.get(file_path))
+        if file_path in batch_result:
+            overall_result[file_path] = batch_result[file_path]
+        if file_path in valid_months:
+            report_terminal(file_path, valid_months[file_path])
+
+def process_files_offline(assets_path, overall_result, deferred, output_dir=None, manifest=None):
+    """
+    Process all CSV files in the specified assets folder without contacting the CNES website.
+    The establishments that are neither in the databases nor in the lookup cache are recorded in the
+    deferred queue; the files that depend on them get a provisional result, counting them as invalid,
+    and are left untouched until the queue is resolved with resolve_deferred.
+
+    Args:
+        assets_path (str): Path to the assets folder.
+        overall_result (dict): Dictionary to store the results of all files.
+        deferred (DeferredQueue): Queue of the unresolved establishments.
+        output_dir (str): Folder of the filtered files. By default, the files are rewritten in place.
+        manifest (Manifest): Record of the files already processed, used to skip the unchanged ones.
+    """
+    get_establishment_index()
+    for file_path in list_csv_files(assets_path):
+        output_path = get_output_path(file_path, output_dir)
+        stored = manifest.lookup(file_path, output_path) if manifest is not None else None
+        if stored is not None:
+            valid_months, overall_result[file_path] = stored
+            deferred.discard(file_path)
+            report_terminal(file_path, valid_months)
+            continue
+        try:
+            with file_scope(file_path):
+                valid_months, result, pending = score_offline(file_path, output_path)
+            if result is not None:
+                overall_result[file_path] = result
+            if pending:
+                deferred.defer(file_path, output_path, pending)
+            else:
+                deferred.discard(file_path)
+                if manifest is not None and result is not None:
+                    manifest.record(file_path, valid_months, result)
+            report_terminal(file_path, valid_months)
+        except Exception as e:
+            logging.error(f"Error processing file {file_path}: {e}")
+    if deferred:
+        logging.info(f"{len(deferred)} files have a provisional result, waiting for {len(deferred.establishments())} "
+                     f"establishments to be checked on the CNES website (run again with --resolve-deferred).")
+
+def resolve_deferred(deferred, verify_options, manifest=None):
+    """
+    Check on the CNES website the establishments of the deferred queue, then score again only the files
+    that were waiting for them and update their lines of overall_result.csv. A file whose establishments
+    could not all be checked stays in the queue, untouched, until a later run.
+
+    Args:
+        deferred (DeferredQueue): Queue of the unresolved establishments.
+        verify_options (dict): Options of async_verifier.verify_establishments.
+        manifest (Manifest): Record of the files already processed, updated with the files scored again.
+
+    Returns:
+        dict: New result of each file scored again.
+    """
+    if not deferred:
+        logging.info("No deferred establishments to resolve.")
+        return {}
+    online_verdicts = verify_establishments(deferred.establishments(), **verify_options)
+    overall_result = {}
+    for file_path, entry in list(deferred.files.items()):
+        if not os.path.isfile(file_path):
+            logging.warning(f"Dropping {file_path} from the deferred queue: the file no longer exists.")
+            deferred.discard(file_path)
+            continue
+        try:
+            with file_scope(file_path):
+                valid_months, result, pending = score_offline(file_path, entry["output"], online_verdicts)
+            if result is not None:
+                overall_result[file_path] = result
+            if pending:
+                # Some checks failed, or the file changed since it was deferred and has new establishments to check.
+                # The file stays in the queue, untouched, with its provisional result.
+                deferred.defer(file_path, entry["output"], pending)
+            else:
+                deferred.discard(file_path)
+                if manifest is not None and result is not None:
+                    manifest.record(file_path, valid_months, result)
+            report_terminal(file_path, valid_months)
+        except Exception as e:
+            # The file stays in the queue, as it was, until a later run.
+            logging.error(f"Error processing file {file_path}: {e}")
+    update_report(overall_result)
+    if deferred:
+        logging.warning(f"{len(deferred)} files are still waiting for {len(deferred.establishments())} establishments "
+                        f"(run again with --resolve-deferred).")
+    return overall_result
+
+def collect_outcomes(futures):
+    """
+    Wait for the futures of score_csv, run through instrumentation.run_in_file_scope.
+
+    Args:
+        futures (dict): Future of each file path.
+
+    Returns:
+        list: (file_path, outcome) tuples. The outcome is None if the file raised an error.
+    """
+    outcomes = []
+    for future, file_path in futures.items():
+        try:
+            outcome, file_metrics = future.result()
+            merge_file_metrics(file_path, file_metrics)
+            outcomes.append((file_path, outcome))
+        except Exception as e:
+            logging.error(f"Error processing file {file_path}: {e}")
+            outcomes.append((file_path, None))
+    return outcomes
+
+def parse_arguments(argv=None):
+    """
+    Parse the command line arguments, from sys.argv by default.
+    """
+    parser = argparse.ArgumentParser(description="Check the eligibility of the professional histories in the assets folder.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes. With 1 (default), the files are processed serially.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Score all files at once with the vectorized engine (requires NumPy), "
+                             "for batches of many professionals.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Process the files as a pipeline of stages connected by bounded queues, writing each "
+                             "line of overall_result.csv as soon as its file is finished.")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Capacity of the queues between the stages of --pipeline.")
+    parser.add_argument("--resolvers", type=int, default=DEFAULT_RESOLVERS,
+                        help="Threads resolving establishments in --pipeline mode.")
+    parser.add_argument("--report-flush", type=int, default=DEFAULT_FLUSH_EVERY,
+                        help="Lines of overall_result.csv written before each flush to disk in --pipeline mode.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never contact the CNES website: the establishments that are neither in the databases nor "
+                             "in the lookup cache are written to the deferred queue, and the files that depend on them "
+                             "get a provisional result and are left untouched. The files are processed serially.")
+    parser.add_argument("--resolve-deferred", action="store_true",
+                        help="Check the establishments of the deferred queue on the CNES website and score again only "
+                             "the files waiting for them, updating their lines of overall_result.csv.")
+    parser.add_argument("--deferred-queue", default=None,
+                        help=f"Path of the deferred queue (default: {DEFERRED_QUEUE_NAME} next to overall_result.csv).")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Number of concurrent establishment checks on the CNES website (default "
+                             f"{DEFAULT_CONCURRENCY}). When set, or when --workers is above 1, the establishments "
+                             "of all files are checked together after a first round using only the databases.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="Maximum number of establishment checks started per second on the CNES website (0 for no limit).")
+    parser.add_argument("--lookup-timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Seconds allowed for each establishment check on the CNES website.")
+    parser.add_argument("--lookup-retries", type=int, default=DEFAULT_RETRIES,
+                        help="Number of retries, with exponential backoff, of a failed establishment check.")
+    parser.add_argument("--competencia", default=DEFAULT_COMPETENCIA,
+                        help="Competência (YYYYMM) of the reference databases built by databases/criacao_bases.py.")
+    parser.add_argument("--history", nargs="?", const=DEFAULT_HISTORY_PATH, default=None,
+                        help="Judge each line by the services of its establishment at the competência of the line, "
+                             "using the history store built by establishment_history.py "
+                             "(default: databases/estab_history.db).")
+    parser.add_argument("--output-dir", default=None,
+                        help="Folder where the filtered files are written, keeping the files in the assets folder "
+                             "untouched. By default, the files are rewritten in place.")
+    parser.add_argument("--compress", choices=OUTPUT_COMPRESSIONS, default=None,
+                        help="Compression of the filtered files (and of the members of --bundle). By default, each "
+                             "filtered file keeps the compression of its history (.csv, .csv.gz or .csv.zst); a history "
+                             "rewritten in place with another compression is replaced by the converted file. "
+                             "zstd requires the zstandard package.")
+    parser.add_argument("--bundle", default=None,
+                        help="Append the filtered histories to this tar archive, one compressed member per history, "
+                             "instead of writing separate files. The assets folder is left untouched.")
+    parser.add_argument("--bundle-flush", type=int, default=DEFAULT_BUNDLE_FLUSH,
+                        help="Filtered histories buffered before each append to --bundle.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip the files that did not change since the previous run, as well as the reference "
+                             "databases, reusing their results. Implies --output-dir (default: filtered).")
+    parser.add_argument("--browsers", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Maximum number of browser sessions kept open to check establishments on the CNES website.")
+    parser.add_argument("--browser-max-uses", type=int, default=DEFAULT_MAX_USES,
+                        help="Number of checks after which a browser session is replaced.")
+    parser.add_argument("--cbo-rules", default=None,
+                        help="JSON file with the rules that map DESCRICAO CBO values to roles (see cbo_classifier.py).")
+    parser.add_argument("--rulesets", default=None,
+                        help="JSON file with the eligibility rule sets to score every file against in the same run "
+                             "(see rulesets.py). The first one gives the filtered files; each other one adds its "
+                             "own columns to overall_result.csv. By default, the rules of the current edital.")
+    parser.add_argument("--lookup-backend", choices=LOOKUP_BACKENDS, default="selenium",
+                        help="How establishments are checked on the CNES website: with the browser (default) "
+                             "or with HTTP requests to the CNES services, falling back to the browser.")
+    parser.add_argument("--cache-ttl-days", type=float, default=DEFAULT_TTL_DAYS,
+                        help="Lifetime, in days, of the cached verdicts of the CNES website.")
+    parser.add_argument("--negative-cache-ttl-days", type=float, default=DEFAULT_NEGATIVE_TTL_DAYS,
+                        help="Lifetime, in days, of the cached 'not listed' verdicts.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always check the CNES website, ignoring the cache of verdicts.")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Collect timers and counters of each stage, per file and per run, and write them "
+                             "to run_metrics.json next to overall_result.csv.")
+    parser.add_argument("--profile", nargs="?", const="run_profile.prof", default=None,
+                        help="Run under cProfile and dump the statistics to this file, next to overall_result.csv "
+                             "(default: run_profile.prof). Worker processes are not profiled.")
+    args = parser.parse_args(argv)
+    if args.bundle and args.workers > 1:
+        parser.error("--bundle is written by a single process and cannot be used with --workers above 1.")
+    if args.bundle and args.incremental:
+        parser.error("--incremental needs the filtered files of --output-dir and cannot be used with --bundle.")
+    return args
 
 def main():
     """
     Main function to execute the program. It iterates over all CSV files in the assets folder.
     """
+    args = parse_arguments()
     setup_logging()
+    settings = RunSettings.from_args(args)
+    settings.apply()
+    settings.apply_lookup()
+    if args.bundle:
+        configure_bundle(os.path.abspath(args.bundle), args.compress or DEFAULT_BUNDLE_COMPRESSION, args.bundle_flush)
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
     
     # Execution time monitoring.
     start = time.time()
@@ -51,19 +446,77 @@ def main():
     # Global variable to store the results throughout the code.
     overall_result = {}
 
+    # Folder of the filtered files and record of the files already processed.
+    output_dir = args.output_dir
+    if args.incremental and not output_dir:
+        output_dir = get_filtered_path()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    manifest = None
+    if args.incremental:
+        manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME),
+                            reference_fingerprint(extra_files=settings.reference_files(),
+                                                  settings=settings.lookup_fingerprint()))
+
     # Process all CSV files.
-    process_files(assets_path, overall_result)
+    verify_options = {
+        "concurrency": args.concurrency or DEFAULT_CONCURRENCY,
+        "rate": args.rate,
+        "timeout": args.lookup_timeout,
+        "retries": max(0, args.lookup_retries)
+    }
+    deferred = None
+    if args.offline or args.resolve_deferred:
+        deferred = DeferredQueue(args.deferred_queue or os.path.join(get_report_dir(), DEFERRED_QUEUE_NAME))
+    # The pipeline writes overall_result.csv itself, line by line, and --resolve-deferred only updates it.
+    writes_report = not args.resolve_deferred and (args.offline or not args.pipeline)
+    try:
+        if args.resolve_deferred:
+            files_scored = len(resolve_deferred(deferred, verify_options, manifest))
+        elif args.offline:
+            process_files_offline(assets_path, overall_result, deferred, output_dir, manifest)
+        elif args.pipeline:
+            files_scored = run_pipeline(assets_path, output_dir, manifest, args.resolvers, max(1, args.queue_size),
+                                        args.report_flush)
+        elif args.batch:
+            process_files_batch(assets_path, overall_result, verify_options, output_dir, manifest)
+        elif args.workers > 1 or args.concurrency is not None:
+            process_files_parallel(assets_path, overall_result, args.workers, verify_options, output_dir, manifest,
+                                   settings)
+        else:
+            process_files(assets_path, overall_result, output_dir, manifest)
+    finally:
+        # The files already deferred keep their entries even if the run stops early.
+        if deferred is not None:
+            deferred.save()
+    if writes_report:
+        files_scored = len(overall_result)
+    if manifest is not None:
+        manifest.save(list_csv_files(assets_path))
     
     try:
         # Generate the report file.
-        report_file(overall_result)
+        if writes_report:
+            report_file(overall_result)
     except Exception as e:
         logging.error(f"Error generating report file: {e}")
     finally:
+        close_bundle()
+        # Close the browser sessions and show their metrics.
+        pool_metrics = close_driver_pool()
+        close_http_client()
+        close_lookup_cache()
         # Calculate and show execution time.
         end = time.time()
         execution_time = end - start
         logging.info(f"Execution time: {execution_time:.2f} seconds")
+        write_summary(os.path.join(get_report_dir(), "run_metrics.json"),
+                      {"execution_time": execution_time, "files_scored": files_scored, "browser_pool": pool_metrics})
+        if profiler is not None:
+            profiler.disable()
+            profile_path = os.path.join(get_report_dir(), args.profile)
+            profiler.dump_stats(profile_path)
+            logging.info(f"Profile written to {profile_path}.")
 
 if __name__ == "__main__":
     main()
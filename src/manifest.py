@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from establishment_index import DATABASES_DIR, database_paths, get_competencia
+from establishment_snapshot import snapshot_path
+from lookup_cache import CACHE_VERSION
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+def file_hash(file_path):
+    """
+    Return the SHA-256 of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, mode='rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def reference_fingerprint(databases_dir=DATABASES_DIR, extra_files=(), settings=None):
+    """
+    Identify the version of the reference data used to score the files.
+
+    Args:
+        databases_dir (str): Folder holding the reference databases.
+        extra_files (iterable): Other files that change the results, such as the CBO rules.
+        settings (dict): Options of the run that change the results, such as the lookup backend.
+
+    Returns:
+        dict: Size and modification time of each reference file (None if it is missing), the version of
+            the lookup cache and the settings.
+    """
+    fingerprint = {}
+    paths = list(database_paths(databases_dir=databases_dir))
+    paths.append(snapshot_path(get_competencia(), databases_dir))
+    for path in paths + [path for path in extra_files if path]:
+        try:
+            stat = os.stat(path)
+            fingerprint[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            fingerprint[os.path.basename(path)] = None
+    # The verdicts of the lookup cache are reused, so a new cache format invalidates the results too.
+    fingerprint["cache_version"] = CACHE_VERSION
+    fingerprint["settings"] = dict(settings or {})
+    return fingerprint
+
+class Manifest:
+    """
+    Record of the files already processed, used to skip the ones that did not change.
+
+    For each input file it keeps its size, modification time and content hash, the reference data
+    it was scored with, and its result. A file is skipped when all of them are unchanged and its
+    filtered output still exists. The pipeline looks files up and records them from different threads,
+    so the entries are only changed under a lock.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.files = {}
+        self.skipped = 0
+        self._lock = threading.Lock()
+        try:
+            with open(path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {path}: {e}")
+
+    def lookup(self, file_path, output_path):
+        """
+        Return the stored (valid_months, result) of a file, or None if it must be processed again.
+        """
+        with self._lock:
+            entry = self.files.get(os.path.basename(file_path))
+        if entry is None or entry.get("reference") != self.fingerprint or not os.path.isfile(output_path):
+            return None
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size != entry["size"]:
+                return None
+            if stat.st_mtime_ns != entry["mtime"]:
+                # The file was touched: compare its content.
+                if file_hash(file_path) != entry["sha256"]:
+                    return None
+                with self._lock:
+                    entry["mtime"] = stat.st_mtime_ns
+        except (OSError, KeyError):
+            return None
+        with self._lock:
+            self.skipped += 1
+        return entry["valid_months"], entry["result"]
+
+    def record(self, file_path, valid_months, result, unresolved=None):
+        """
+        Store the result of a file that was just processed, unless some of its establishments (unresolved)
+        could not be checked on the CNES website: they were counted as not valid, so the file must be
+        processed again by the next run.
+        """
+        name = os.path.basename(file_path)
+        if unresolved:
+            with self._lock:
+                self.files.pop(name, None)
+            logging.warning(f"{file_path} is not recorded in the manifest: {len(unresolved)} establishments could "
+                            f"not be checked on the CNES website.")
+            return
+        try:
+            stat = os.stat(file_path)
+            entry = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "sha256": file_hash(file_path),
+                "reference": self.fingerprint,
+                "valid_months": valid_months,
+                "result": result
+            }
+        except OSError as e:
+            logging.warning(f"Could not record {file_path} in the manifest: {e}")
+            return
+        with self._lock:
+            self.files[name] = entry
+
+    def save(self, file_paths):
+        """
+        Write the manifest, keeping only the files that are still in the assets folder.
+        """
+        names = {os.path.basename(file_path) for file_path in file_paths}
+        with self._lock:
+            data = {"version": MANIFEST_VERSION,
+                    "files": {name: dict(entry) for name, entry in self.files.items() if name in names}}
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, mode='w', encoding='utf-8') as file:
+                json.dump(data, file, indent=1)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.error(f"Error writing manifest {self.path}: {e}")
+        logging.info(f"Incremental run: {self.skipped} unchanged files skipped.")
@@ -0,0 +1,165 @@
+import os
+import queue
+import logging
+import threading
+from processing import read_history, evaluate_history, CSV_ERRORS, log_csv_error
+from establishment_validator import resolve_establishments
+from establishment_index import get_establishment_index
+from report_generator import ReportWriter, report_terminal
+from instrumentation import file_scope, timer
+from history_files import is_history_file, filtered_path
+
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_RESOLVERS = 2
+DEFAULT_FLUSH_EVERY = 50
+
+# Marks the end of the items of a queue.
+_DONE = object()
+
+def discover_files(assets_path):
+    """
+    Yield the histories of the assets folder (CSV files, plain or compressed) one at a time, without listing
+    the whole folder first.
+    """
+    try:
+        with os.scandir(assets_path) as entries:
+            for entry in entries:
+                if entry.is_file() and is_history_file(entry.name):
+                    yield entry.path
+    except OSError as e:
+        logging.error(f"Error accessing directory {assets_path}: {e}")
+
+class Stage:
+    """
+    A pipeline stage: `workers` threads take items from the input queue, apply `function` and put
+    its result, unless it is None, on the output queue. The queues are bounded, so a slow stage blocks
+    the ones before it instead of letting items pile up in memory.
+    """
+
+    def __init__(self, name, function, input_queue, output_queue, workers=1):
+        self.name = name
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, name=f"{name}-{position}", daemon=True)
+                        for position in range(workers)]
+
+    def start(self):
+        """
+        Start the threads of the stage.
+        """
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            item = self.input_queue.get()
+            if item is _DONE:
+                # Let the other workers of the stage see the end too; the last one closes the next queue.
+                self.input_queue.put(_DONE)
+                with self._lock:
+                    self._remaining -= 1
+                    last = self._remaining == 0
+                if last and self.output_queue is not None:
+                    self.output_queue.put(_DONE)
+                return
+            try:
+                result = self.function(item)
+            except Exception as e:
+                logging.error(f"Error in the {self.name} stage for {item[0] if isinstance(item, tuple) else item}: {e}")
+                continue
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result)
+
+def run_pipeline(assets_path, output_dir=None, manifest=None, resolvers=DEFAULT_RESOLVERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, flush_every=DEFAULT_FLUSH_EVERY):
+    """
+    Process all CSV files of the assets folder as a pipeline of stages connected by bounded queues:
+    discovery -> parse -> establishment resolution -> scoring -> report.
+    Each line of overall_result.csv is written as soon as its file is scored, in the order the files
+    finish, and at most about `queue_size` files per stage are held in memory.
+
+    Args:
+        assets_path (str): Path to the assets folder.
+        output_dir (str): Folder of the filtered files. By default, the files are rewritten in place.
+        manifest (Manifest): Record of the files already processed, used to skip the unchanged ones.
+        resolvers (int): Threads resolving establishments, which may wait for the CNES website.
+        queue_size (int): Capacity of each queue between two stages.
+        flush_every (int): Lines of overall_result.csv written before each flush to disk.
+
+    Returns:
+        int: Number of lines written to overall_result.csv.
+    """
+    get_establishment_index()
+    parse_queue = queue.Queue(maxsize=queue_size)
+    resolve_queue = queue.Queue(maxsize=queue_size)
+    score_queue = queue.Queue(maxsize=queue_size)
+    report_queue = queue.Queue(maxsize=queue_size)
+
+    def output_path_of(file_path):
+        return filtered_path(file_path, output_dir)
+
+    def parse(file_path):
+        with file_scope(file_path), timer("parse"):
+            fieldnames, records, establishments = read_history(file_path)
+        return file_path, fieldnames, records, establishments
+
+    def resolve(item):
+        file_path, fieldnames, records, establishments = item
+        unresolved = []
+        with file_scope(file_path), timer("resolve"):
+            valid_cnes = resolve_establishments(establishments, unresolved)
+        return file_path, fieldnames, records, valid_cnes, unresolved
+
+    def score(item):
+        file_path, fieldnames, records, valid_cnes, unresolved = item
+        overall_result = {}
+        try:
+            with file_scope(file_path):
+                valid_months = evaluate_history(file_path, fieldnames, records, valid_cnes, overall_result,
+                                                output_path_of(file_path))
+        except CSV_ERRORS as e:
+            log_csv_error(file_path, e)
+            valid_months = 0
+        return file_path, valid_months, overall_result.get(file_path), unresolved
+
+    stages = [Stage("parse", parse, parse_queue, resolve_queue),
+              Stage("resolve", resolve, resolve_queue, score_queue, workers=max(1, resolvers)),
+              Stage("score", score, score_queue, report_queue)]
+    for stage in stages:
+        stage.start()
+
+    # Discovery runs in its own thread; the unchanged files go straight to the report.
+    def discover():
+        try:
+            for file_path in discover_files(assets_path):
+                stored = manifest.lookup(file_path, output_path_of(file_path)) if manifest is not None else None
+                if stored is not None:
+                    report_queue.put((file_path, stored[0], stored[1], None))
+                else:
+                    parse_queue.put(file_path)
+        finally:
+            parse_queue.put(_DONE)
+    discovery = threading.Thread(target=discover, name="discover", daemon=True)
+    discovery.start()
+
+    # The report sink runs in this thread. Discovery puts the unchanged files on the report queue before
+    # it ends the parse queue, so the end of the scoring stage is always the last item.
+    writer = ReportWriter(flush_every=flush_every)
+    try:
+        while True:
+            item = report_queue.get()
+            if item is _DONE:
+                break
+            # unresolved is None for the files whose result comes from the manifest.
+            file_path, valid_months, result, unresolved = item
+            if result is not None:
+                writer.write(file_path, result)
+                if manifest is not None and unresolved is not None:
+                    manifest.record(file_path, valid_months, result, unresolved)
+            report_terminal(file_path, valid_months)
+    finally:
+        writer.close()
+    return writer.lines
@@ -1,115 +1,321 @@
+import io
 import csv
 import logging
-from utils import parse_date, check_cbo_description
-from establishment_validator import check_establishment
+from utils import parse_month
+from cbo_classifier import classify_cbo, CboRole
+from establishment_validator import resolve_establishments, classify_establishments, resolve_offline, add_online_services
+from establishment_history import get_establishment_history
+from establishment_index import APS_SERVICES
+from rulesets import get_rulesets, parse_filters
+from history_reader import read_history_file, iter_history
+from history_files import store_history
+from instrumentation import count, timer
 
-def process_csv(file_path, overall_result):
+# Errors of a single history (a missing file, an invalid header or value, a malformed CSV), which only
+# skip that history.
+CSV_ERRORS = (FileNotFoundError, ValueError, csv.Error)
+
+def log_csv_error(file_path, error):
+    """
+    Log an error raised while processing a CSV file, with the function that caught it and the line
+    of that function where it was raised.
+    """
+    traceback = error.__traceback__
+    logging.error(f"Error processing CSV file {file_path} in function {traceback.tb_frame.f_code.co_name} "
+                  f"at line {traceback.tb_lineno}: {error}")
+
+class HistoryRecord:
+    """
+    Compact representation of a line of a professional history that may count towards eligibility.
+    Lines with CHS AMB. below every band of the rule sets, an invalid CHS AMB. or an unrelated CBO are
+    discarded while parsing.
+    """
+    __slots__ = ("comp", "month", "chs_amb", "cnes", "key", "cbo", "aps", "row")
+
+    def __init__(self, comp, month, chs_amb, cnes, key, cbo, row):
+        self.comp = comp  # Raw COMP. value, kept for the error messages.
+        self.month = month  # Integer month key (year * 12 + month), or None if COMP. is unknown.
+        self.chs_amb = chs_amb
+        self.cnes = cnes
+        self.key = key  # IBGE+CNES, or None if the file has no IBGE column.
+        self.cbo = cbo  # CboRole of the DESCRICAO CBO value.
+        self.aps = False  # True if the establishment of the line is valid, set before the rules are applied.
+        self.row = row  # Fields of the original CSV line, kept for the rewriting process.
+
+class HistoryColumns:
+    """
+    Columns of the lines kept while parsing, filled by parse_history next to the HistoryRecord list so that
+    the batch engine builds its arrays without going over the records again.
+    """
+    __slots__ = ("months", "chs_amb", "roles", "cnes")
+
+    def __init__(self):
+        self.months = []  # -1 where COMP. is unknown.
+        self.chs_amb = []
+        self.roles = []
+        self.cnes = []
+
+def process_csv(file_path, overall_result, output_path=None, unresolved=None):
     """
     Function to analyze a specific CSV file and apply filters to the data.
-    
+
     Args:
         file_path (str): Path to the CSV file.
         overall_result (dict): Dictionary to store the results of all files.
-        
+        output_path (str): Path of the filtered CSV file. By default, the CSV file is rewritten in place.
+        unresolved (list): List extended with the establishments whose check on the CNES website failed, or None.
+
     Returns:
         valid_months (int): Number of valid months found in the CSV file, which will be used to determine the eligibility.
     """
     try:
-        # Open the CSV file for the first time to check the valid lines
-        with open(file_path, mode='r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file, delimiter=';')
-            # Extract the header directly from the original file and capture the name of each column to be used later in the rewriting process.
-            fieldnames = csv_reader.fieldnames
-            # Determine the valid establishments in order to optimize the following processes.
-            valid_cnes = check_establishment(csv_reader)
-            valid_lines = []
-            # Rewind the file to the beginning to read the lines again.
-            file.seek(0)
-            csv_reader = csv.DictReader(file, delimiter=';')
-            unique_values_above_40 = validate_lines_above_40(csv_reader, valid_lines, valid_cnes)
-            file.seek(0)
-            csv_reader = csv.DictReader(file, delimiter=';')
-            count_30_40, count_20_30 = validate_lines_20_30(csv_reader, valid_lines, valid_cnes, unique_values_above_40)
-            
-        # Valid lines are sorted by date in descending order to guarantee the correct rewriting processes.
-        valid_lines.sort(key=lambda line: parse_date(line["COMP."]), reverse=True)
-        
-        # Rewriting the CSV file with the valid lines.
-        with open(file_path, mode='w', encoding='utf-8', newline='') as output_file:
-            if fieldnames is None:
-                raise ValueError("The original CSV header was not identified.")
-            csv_writer = csv.DictWriter(output_file, fieldnames=fieldnames, delimiter=';')
-            csv_writer.writeheader()
-            csv_writer.writerows(valid_lines)
-            
-        # Calculate the total number of valid months and determine eligibility.
-        total_months_40 = len(unique_values_above_40)
-        total_months_30 = sum(count_30_40.values())
-        total_months_20 = sum(count_20_30.values())
-        valid_months = total_months_40 + (total_months_30 * 0.75) + (total_months_20 * 0.5)
-        overall_result[file_path] = {
-            "status": "Eligible" if valid_months >= 48 else "Not eligible",
-            "pending": max(0, 48 - valid_months),
-            "semesters_40": total_months_40 // 6,
-            "semesters_30": total_months_30 // 6,
-            "semesters_20": total_months_20 // 6
-        }
-    
-        return valid_months
-    except (FileNotFoundError, ValueError, csv.Error) as e:
-        logging.error(f"Error processing CSV file {file_path} in function process_csv at line {e.__traceback__.tb_lineno}: {e}")
+        # Read the CSV file only once, keeping the lines that may be valid and the establishments to check.
+        with timer("parse"):
+            fieldnames, records, establishments = read_history(file_path)
+        # Determine the valid establishments in bulk.
+        with timer("resolve"):
+            valid_cnes = resolve_establishments(establishments, unresolved)
+        return evaluate_history(file_path, fieldnames, records, valid_cnes, overall_result, output_path)
+    except CSV_ERRORS as e:
+        log_csv_error(file_path, e)
         return 0
-    
-def validate_lines_above_40(csv_reader, valid_lines, valid_cnes):
-    """
-    Check the unique lines with COMP. value above 40 and add them to valid_lines.
-    """
-    unique_values_above_40 = set()
-    for line in csv_reader:
-        if is_valid_line(line, valid_cnes, 40):
-            comp_value = line["COMP."]
-            if comp_value not in unique_values_above_40:
-                unique_values_above_40.add(comp_value)
-                valid_lines.append(line)
-    return unique_values_above_40
-
-def validate_lines_20_30(csv_reader, valid_lines, valid_cnes, unique_values_above_40):
-    """
-    Check the unique lines with COMP. value between 20 and 30 and between 30 and 40, considering frequency <= 2, and add them to valid_lines.
-    """
-    count_30_40 = {}
-    count_20_30 = {}
-    for line in csv_reader:
-        if is_valid_line(line, valid_cnes, 20):
-            comp_value = line["COMP."]
-            chs_amb_value = float(line["CHS AMB."])
-            if 30 <= chs_amb_value < 40 and comp_value not in unique_values_above_40:
-                if count_30_40.get(comp_value, 0) < 2:
-                    count_30_40[comp_value] = count_30_40.get(comp_value, 0) + 1
-                    valid_lines.append(line)
-            elif 20 <= chs_amb_value < 30 and comp_value not in unique_values_above_40:
-                if count_20_30.get(comp_value, 0) < 2:
-                    count_20_30[comp_value] = count_20_30.get(comp_value, 0) + 1
-                    valid_lines.append(line)
-    return count_30_40, count_20_30
-
-def is_valid_line(line, valid_cnes, chs_threshold):
-    """
-    Check if the line is valid based on the CHS AMB. value and the CBO Description.
-    If the CBO description contains "MEDICO" and "FAMILIA", the line is considered valid.
+
+def score_csv(file_path, online_verdicts=None, output_path=None):
+    """
+    Analyze a CSV file without contacting the CNES website, as done by the worker processes.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        online_verdicts (dict): Services mask found on the CNES website for each IBGE+CNES that is not in the databases.
+        output_path (str): Path of the filtered CSV file. By default, the CSV file is rewritten in place.
+
+    Returns:
+        valid_months (int): Number of valid months, or None if the file is pending.
+        result (dict): Entry of the file in overall_result, or None if it was not produced.
+        pending (list): Establishments without a verdict. When not empty, the file is left untouched
+            and must be scored again once those establishments are checked on the CNES website.
+    """
+    overall_result = {}
+    try:
+        with timer("parse"):
+            fieldnames, records, establishments = read_history(file_path)
+        with timer("resolve"):
+            valid_cnes, pending = classify_establishments(establishments)
+        if online_verdicts is None:
+            if pending:
+                return None, None, pending
+        else:
+            add_online_services(valid_cnes, pending, online_verdicts)
+        valid_months = evaluate_history(file_path, fieldnames, records, valid_cnes, overall_result, output_path)
+        return valid_months, overall_result.get(file_path), []
+    except CSV_ERRORS as e:
+        log_csv_error(file_path, e)
+        return 0, None, []
+
+def score_offline(file_path, output_path=None, online_verdicts=None):
+    """
+    Analyze a CSV file without contacting the CNES website, resolving the establishments that are not
+    in the databases by the given verdicts and by the lookup cache.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        output_path (str): Path of the filtered CSV file. By default, the CSV file is rewritten in place.
+        online_verdicts (dict): Services mask found on the CNES website for some IBGE+CNES.
+
+    Returns:
+        valid_months (int): Number of valid months.
+        result (dict): Entry of the file in overall_result, or None if it was not produced.
+        deferred (list): Establishments without a verdict. When not empty, the result is provisional, with
+            those establishments counted as invalid, and the file is left untouched so that it can be
+            scored again once they are checked on the CNES website.
     """
+    overall_result = {}
     try:
-        chs_amb_value = float(line["CHS AMB."])
-        cbo_description = line["DESCRICAO CBO"]
-        if chs_amb_value >= chs_threshold:
-            if check_cbo_description(cbo_description, ["MEDICO", "FAMILIA"]):
-                return True
-            elif check_cbo_description(cbo_description, ["MEDICO", "CLINICO"]) and line["CNES"] in valid_cnes:
-                return True
-            elif check_cbo_description(cbo_description, ["MEDICOS", "CLINICO"]) and line["CNES"] in valid_cnes:
-                return True
-            elif check_cbo_description(cbo_description, ["MEDICO", "GENERALISTA"]) and line["CNES"] in valid_cnes:
-                return True
-        return False
-    except ValueError:
-        return False
\ No newline at end of file
+        with timer("parse"):
+            fieldnames, records, establishments = read_history(file_path)
+        with timer("resolve"):
+            valid_cnes, deferred = resolve_offline(establishments, online_verdicts)
+        if deferred:
+            _, valid_months, result = score_records(records, valid_cnes)
+            return valid_months, result, deferred
+        valid_months = evaluate_history(file_path, fieldnames, records, valid_cnes, overall_result, output_path)
+        return valid_months, overall_result.get(file_path), []
+    except CSV_ERRORS as e:
+        log_csv_error(file_path, e)
+        return 0, None, []
+
+def evaluate_history(file_path, fieldnames, records, valid_cnes, overall_result, output_path=None):
+    """
+    Apply the eligibility rules to a parsed history, write the valid lines and store the result.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        fieldnames (list): Header of the CSV file.
+        records (list): HistoryRecord of each line that may be valid.
+        valid_cnes (dict): Services mask of each valid CNES.
+        overall_result (dict): Dictionary to store the results of all files.
+        output_path (str): Path of the filtered CSV file. By default, the CSV file is rewritten in place.
+
+    Returns:
+        valid_months (int): Number of valid months found in the CSV file.
+    """
+    valid_lines, valid_months, result = score_records(records, valid_cnes)
+    write_valid_lines(file_path, fieldnames, valid_lines, output_path)
+    overall_result[file_path] = result
+    return valid_months
+
+def score_records(records, valid_cnes):
+    """
+    Apply every rule set to the lines of a parsed history, without writing anything.
+    The valid lines and the valid months are those of the primary rule set; the results of the other
+    rule sets are stored under result["rulesets"].
+
+    Args:
+        records (list): HistoryRecord of each line that may be valid.
+        valid_cnes (dict): Services mask (SERVICE_159 and SERVICE_152 bits, and SERVICE_ONLINE for those found
+            on the CNES website) of each CNES valid for the service 159 or 152.
+
+    Returns:
+        valid_lines (list): HistoryRecord of the valid lines, sorted by date in descending order.
+        valid_months (float): Weighted number of valid months.
+        result (dict): Entry of the file in overall_result.
+    """
+    rulesets = get_rulesets()
+    valid_lines = []
+    with timer("score"):
+        for position, ruleset in enumerate(rulesets):
+            accepted_cnes = {cnes for cnes, services in valid_cnes.items() if ruleset.accepts_services(services)}
+            mark_establishments(records, accepted_cnes, ruleset.services)
+            counts = ruleset.count(records, valid_lines if position == 0 else None)
+            if position == 0:
+                valid_months, result = ruleset.result(counts)
+            else:
+                result.setdefault("rulesets", {})[ruleset.name] = ruleset.result(counts)[1]
+
+        # Valid lines are sorted by date in descending order to guarantee the correct rewriting processes.
+        valid_lines.sort(key=month_key, reverse=True)
+    return valid_lines, valid_months, result
+
+def write_valid_lines(file_path, fieldnames, valid_lines, output_path=None):
+    """
+    Rewrite the CSV file with the header and the valid lines, already sorted.
+    The content is built in memory and then stored at once by history_files.store_history: written
+    atomically, compressed according to the suffix of the file, or added to the bundle.
+    """
+    with timer("write"):
+        if fieldnames is None:
+            raise ValueError("The original CSV header was not identified.")
+        output_file = io.StringIO(newline='')
+        csv_writer = csv.writer(output_file, delimiter=';')
+        csv_writer.writerow(fieldnames)
+        csv_writer.writerows(record.row for record in valid_lines)
+        store_history(file_path, output_path, output_file.getvalue())
+    count("rows_written", len(valid_lines))
+
+def read_history(file_path, columns=None):
+    """
+    Parse a professional history in a single pass.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        columns (HistoryColumns): Columns extended with the lines kept, or None.
+
+    Returns:
+        fieldnames (list): Header of the CSV file, or None if the file is empty.
+        records (list): HistoryRecord of each line that may be valid, in file order.
+        establishments (list): Unique (ibge_cnes, cnes, establishment_name) tuples that need to be checked.
+
+    Raises:
+        HistoryHeaderError: If a required column is missing from the header.
+    """
+    return parse_history(*read_history_file(file_path), columns)
+
+def parse_text(text, source="history"):
+    """
+    Parse the content of a professional history, for example the body of a request. See read_history.
+    """
+    return parse_history(*iter_history(io.StringIO(text, newline=None), source))
+
+def parse_history(fieldnames, rows, columns=None):
+    """
+    Keep the lines of a history that may be valid and collect their establishments.
+
+    Args:
+        fieldnames (list): Header of the history, or None if it is empty.
+        rows (iterator): (fields, row) of each line, as given by history_reader.iter_history.
+        columns (HistoryColumns): Columns extended with the lines kept, or None.
+
+    Returns:
+        The same values as read_history.
+    """
+    records = []
+    establishments = {}
+    if fieldnames is None:
+        return None, records, []
+    min_hours, establishment_roles = parse_filters(get_rulesets())
+    # A history repeats a few COMP., CHS AMB. and DESCRICAO CBO values, so each distinct value is converted once.
+    amounts = {}
+    roles = {}
+    months = {}
+    parsed = 0
+    for parsed, ((comp_value, cnes_value, ibge_value, chs_amb_text, cbo_description, establishment_name), row) \
+            in enumerate(rows, 1):
+        chs_amb_value = amounts.get(chs_amb_text)
+        if chs_amb_value is None:
+            try:
+                chs_amb_value = float(chs_amb_text)
+            except ValueError:
+                # Invalid values are discarded, as the values below every band.
+                chs_amb_value = -1.0
+            amounts[chs_amb_text] = chs_amb_value
+        if chs_amb_value < min_hours or chs_amb_value < 0:
+            continue
+        cbo = roles.get(cbo_description)
+        if cbo is None:
+            cbo = roles[cbo_description] = classify_cbo(cbo_description)
+        if cbo == CboRole.OTHER:
+            continue
+        if comp_value in months:
+            month = months[comp_value]
+        else:
+            month = months[comp_value] = parse_month(comp_value)
+        concat_ibge_cnes = ibge_value + cnes_value if ibge_value is not None else None
+        records.append(HistoryRecord(comp_value, month, chs_amb_value, cnes_value, concat_ibge_cnes, cbo, row))
+        if columns is not None:
+            columns.months.append(-1 if month is None else month)
+            columns.chs_amb.append(chs_amb_value)
+            columns.roles.append(cbo)
+            columns.cnes.append(cnes_value)
+
+        # Establishments are only collected here; they are resolved later, all at once.
+        if cbo in establishment_roles and concat_ibge_cnes is not None and establishment_name is not None:
+            if concat_ibge_cnes not in establishments:
+                establishments[concat_ibge_cnes] = (concat_ibge_cnes, cnes_value, establishment_name)
+    count("rows_parsed", parsed)
+    count("rows_kept", len(records))
+    return fieldnames, records, list(establishments.values())
+
+def month_key(record):
+    """
+    Sort key of a valid line. Unknown COMP. formats are reported as an error.
+    """
+    if record.month is None:
+        raise ValueError(f"Unknown date format: {record.comp}")
+    return record.month
+
+def mark_establishments(records, valid_cnes, services=APS_SERVICES):
+    """
+    Set record.aps for each line. When the establishment history is enabled, each line is judged by the
+    services of its establishment at the competência of the line; otherwise by the current databases.
+
+    Args:
+        records (list): HistoryRecord of the lines.
+        valid_cnes (set): CNES valid today for the services.
+        services (int): Services mask of the services accepted by the rule set.
+    """
+    history = get_establishment_history()
+    if history is not None:
+        history.mark(records, valid_cnes, services)
+        return
+    for record in records:
+        record.aps = record.cnes in valid_cnes
@@ -1,41 +1,169 @@
 import csv
 import os
 import logging
+from rulesets import get_rulesets
+from history_files import history_name
 
 def report_terminal(file_path, valid_months):  
     # Displaying the number of months that meet the condition
     logging.info(f"File: {file_path}")
     logging.info(f"Total number of valid months: {valid_months}")
-    if valid_months >= 48:
+    threshold = get_rulesets()[0].threshold
+    if valid_months >= threshold:
         logging.info("Eligible!")
     else:
-        pending_months = 48 - valid_months
+        pending_months = threshold - valid_months
         logging.info(f"Number of pending months: {pending_months}")
         logging.info("Not eligible!")
     logging.info("-" * 40)
 
+def get_report_dir():
+    """
+    Get the folder of the report files (the parent directory of src).
+    """
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Columns of overall_result.csv with the default rule set.
+REPORT_FIELDNAMES = ["File", "Status", "Pending", "Semesters 40", "Semesters 30", "Semesters 20"]
+
+def ruleset_columns(ruleset, suffix=""):
+    """
+    Return (column, result key) pairs of the block of a rule set in overall_result.csv.
+    """
+    columns = [(f"Status{suffix}", "status"), (f"Pending{suffix}", "pending")]
+    columns.extend((f"Semesters {band.name}{suffix}", f"semesters_{band.name}") for band in ruleset.bands)
+    return columns
+
+def report_columns():
+    """
+    Return the blocks of overall_result.csv: the primary rule set, then one block per other rule set,
+    whose columns end with the name of the rule set.
+    """
+    rulesets = get_rulesets()
+    blocks = [(None, ruleset_columns(rulesets[0]))]
+    blocks.extend((ruleset.name, ruleset_columns(ruleset, f" {ruleset.name}")) for ruleset in rulesets[1:])
+    return blocks
+
+def report_fieldnames():
+    """
+    Return the columns of overall_result.csv. With the default rule set, they are REPORT_FIELDNAMES.
+    """
+    return ["File"] + [column for _, columns in report_columns() for column, _ in columns]
+
+def report_path():
+    """
+    Get the path of overall_result.csv.
+    """
+    return os.path.join(get_report_dir(), "overall_result.csv")
+
+def report_row(file_path, value):
+    """
+    Build the line of overall_result.csv of a file.
+    """
+    # Extract the file name and remove the '.csv' extension, and the compression suffix of a compressed history
+    row = {"File": history_name(file_path)}
+    for name, columns in report_columns():
+        block = value if name is None else value.get("rulesets", {}).get(name, {})
+        for column, key in columns:
+            row[column] = block.get(key, "")
+    return row
+
 def report_file(overall_result):
     """
-    Generate a CSV report in the parent directory.
+    Generate a CSV report in the parent directory. The report is written to a temporary file that
+    replaces the previous one only when it is complete.
     Args:
       overall_result (dict): Dictionary with the results of the analysis for each file.
     """
+    path = report_path()
+    temporary_path = path + ".tmp"
     try:
-        parent_dir = os.path.join(os.path.dirname(__file__), '..')
-        file_path = os.path.join(parent_dir, "overall_result.csv")
-        with open(file_path, mode="w", newline="") as file:
-            fieldnames = ["File", "Status", "Pending", "Semesters 40", "Semesters 30", "Semesters 20"]
-            writer = csv.DictWriter(file, fieldnames=fieldnames, delimiter=';')
+        with open(temporary_path, mode="w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=report_fieldnames(), delimiter=';')
             writer.writeheader()
             for file_path, value in overall_result.items():
-                # Extract the file name and remove the '.csv' extension
-                file_name = os.path.splitext(os.path.basename(file_path))[0]
-                writer.writerow({"File": file_name,
-                                "Status": value["status"],
-                                "Pending": value["pending"],
-                                "Semesters 40": value["semesters_40"],
-                                "Semesters 30": value["semesters_30"],
-                                "Semesters 20": value["semesters_20"]})
+                writer.writerow(report_row(file_path, value))
+        os.replace(temporary_path, path)
         logging.info(f"Report generated successfully.")
     except IOError as e:
-        logging.error(f"Error writing report file: {e}")
\ No newline at end of file
+        logging.error(f"Error writing report file: {e}")
+
+def update_report(overall_result):
+    """
+    Replace, in the existing overall_result.csv, the lines of the given files, appending the files that
+    are not in it yet. The other lines are kept as they are. The report is replaced atomically.
+
+    Args:
+      overall_result (dict): Dictionary with the new results of some files.
+    """
+    path = report_path()
+    rows = []
+    try:
+        with open(path, mode="r", newline="") as file:
+            rows = list(csv.DictReader(file, delimiter=';'))
+    except FileNotFoundError:
+        pass
+    except (OSError, csv.Error) as e:
+        logging.error(f"Error reading report file: {e}")
+        return
+    positions = {row.get("File"): position for position, row in enumerate(rows)}
+    for file_path, value in overall_result.items():
+        row = report_row(file_path, value)
+        position = positions.get(row["File"])
+        if position is None:
+            positions[row["File"]] = len(rows)
+            rows.append(row)
+        else:
+            rows[position] = row
+    temporary_path = path + ".tmp"
+    try:
+        with open(temporary_path, mode="w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=report_fieldnames(), delimiter=';', extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(temporary_path, path)
+        logging.info(f"Report updated with {len(overall_result)} files.")
+    except IOError as e:
+        logging.error(f"Error writing report file: {e}")
+
+class ReportWriter:
+    """
+    Writes overall_result.csv one line at a time, as each file is finished.
+    The lines are flushed to disk in batches, so a crash only loses the last batch.
+    """
+
+    def __init__(self, path=None, flush_every=50):
+        self.path = path or report_path()
+        self.flush_every = max(1, flush_every)
+        self.lines = 0
+        self._unflushed = 0
+        self._file = open(self.path, mode="w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=report_fieldnames(), delimiter=';')
+        self._writer.writeheader()
+        self._file.flush()
+
+    def write(self, file_path, value):
+        """
+        Append the line of a file.
+        """
+        self._writer.writerow(report_row(file_path, value))
+        self.lines += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending lines to disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+
+    def close(self):
+        """
+        Flush the pending lines and close the report.
+        """
+        self.flush()
+        self._file.close()
+        logging.info(f"Report generated successfully with {self.lines} lines.")
\ No newline at end of file
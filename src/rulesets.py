@@ -0,0 +1,251 @@
+import json
+import logging
+import threading
+from cbo_classifier import CboRole
+from establishment_index import SERVICE_159, SERVICE_152, SERVICE_ONLINE
+
+# Rules of the current edital: a month with 40h or more counts as a full month, and blocks the other
+# workloads of that month; up to two lines per month count for each of 30h and 20h, with smaller weights.
+DEFAULT_RULESET = {
+    "name": "default",
+    "threshold": 48,
+    "bands": [
+        {"name": "40", "min_hours": 40, "weight": 1.0, "monthly_cap": 1, "exclusive": True},
+        {"name": "30", "min_hours": 30, "weight": 0.75, "monthly_cap": 2},
+        {"name": "20", "min_hours": 20, "weight": 0.5, "monthly_cap": 2}
+    ],
+    # "any": valid in any establishment; "establishment": valid only in the establishments with an accepted service.
+    "roles": {"FAMILY_DOCTOR": "any", "CLINICIAN": "establishment", "GENERALIST": "establishment"},
+    "services": [159, 152],
+    # Services accepted for an establishment found only on the CNES website. The website check has always
+    # accepted the 159 alone; a rule set accepting the 152 there too must list it.
+    "online_services": [159]
+}
+
+# Service codes that the reference databases and the CNES website can tell apart.
+SERVICE_CODES = {159: SERVICE_159, 152: SERVICE_152}
+ROLE_SCOPES = ("any", "establishment")
+
+_rulesets = None
+_rulesets_custom = False
+_rulesets_lock = threading.Lock()
+
+class Band:
+    """
+    A workload band of a rule set: the lines with CHS AMB. from min_hours up to the min_hours of the band above.
+    """
+    __slots__ = ("name", "min_hours", "weight", "monthly_cap", "exclusive")
+
+    def __init__(self, name, min_hours, weight, monthly_cap, exclusive):
+        self.name = name
+        self.min_hours = min_hours
+        self.weight = weight
+        self.monthly_cap = monthly_cap  # Lines counted per month. Always 1 for an exclusive band.
+        self.exclusive = exclusive  # A month counted in this band is not counted in the bands below.
+
+class RuleSet:
+    """
+    Eligibility rules of an edital, built from a definition with the format of DEFAULT_RULESET.
+
+    Raises:
+        ValueError: If the definition is not valid.
+    """
+
+    def __init__(self, definition):
+        if not isinstance(definition, dict) or not definition.get("name"):
+            raise ValueError(f"Invalid rule set, a name is required: {definition}")
+        self.name = str(definition["name"])
+        try:
+            self.threshold = float(definition.get("threshold", DEFAULT_RULESET["threshold"]))
+            bands = [Band(str(band.get("name", band["min_hours"])), float(band["min_hours"]),
+                          float(band.get("weight", 1.0)),
+                          1 if band.get("exclusive") else int(band.get("monthly_cap", 1)),
+                          bool(band.get("exclusive", False)))
+                     for band in definition.get("bands", DEFAULT_RULESET["bands"])]
+        except (TypeError, KeyError, ValueError, AttributeError) as e:
+            raise ValueError(f"Invalid band in the rule set {self.name}: {e}")
+        if not bands or any(band.monthly_cap < 1 or band.min_hours < 0 for band in bands):
+            raise ValueError(f"The rule set {self.name} needs bands with min_hours >= 0 and monthly_cap >= 1.")
+        if len({band.name for band in bands}) != len(bands) or len({band.min_hours for band in bands}) != len(bands):
+            raise ValueError(f"The bands of the rule set {self.name} must have distinct names and min_hours.")
+        if self.threshold == int(self.threshold):
+            self.threshold = int(self.threshold)
+        # Highest workload first, so that the first band whose min_hours is reached is the band of a line.
+        self.bands = sorted(bands, key=lambda band: band.min_hours, reverse=True)
+        self.min_hours = self.bands[-1].min_hours
+
+        roles = definition.get("roles", DEFAULT_RULESET["roles"])
+        if not isinstance(roles, dict) or any(role not in CboRole.__members__ or role == "OTHER" or scope not in ROLE_SCOPES
+                                              for role, scope in roles.items()):
+            raise ValueError(f"Invalid roles in the rule set {self.name}: {roles}")
+        self.any_roles = frozenset(CboRole[role] for role, scope in roles.items() if scope == "any")
+        self.establishment_roles = frozenset(CboRole[role] for role, scope in roles.items() if scope == "establishment")
+
+        services = definition.get("services", DEFAULT_RULESET["services"])
+        if not isinstance(services, list) or not services or any(service not in SERVICE_CODES for service in services):
+            raise ValueError(f"Invalid services in the rule set {self.name}: {services} "
+                             f"(accepted: {', '.join(map(str, SERVICE_CODES))}).")
+        self.services = 0
+        for service in services:
+            self.services |= SERVICE_CODES[service]
+
+        # By default, the services of the rule set that the website check accepts by default.
+        online_services = definition.get("online_services",
+                                         [service for service in services if service in DEFAULT_RULESET["online_services"]])
+        if not isinstance(online_services, list) or any(service not in SERVICE_CODES for service in online_services):
+            raise ValueError(f"Invalid online services in the rule set {self.name}: {online_services} "
+                             f"(accepted: {', '.join(map(str, SERVICE_CODES))}).")
+        self.online_services = 0
+        for service in online_services:
+            self.online_services |= SERVICE_CODES[service]
+
+    def accepts_services(self, services):
+        """
+        Check if an establishment with a services mask is valid for the rule set, with the online services
+        when the mask was found on the CNES website.
+        """
+        return bool(services & (self.online_services if services & SERVICE_ONLINE else self.services))
+
+    def accepts(self, record):
+        """
+        Check if the role of the line is accepted, in its establishment when the role requires it.
+        record.aps must already be set for this rule set.
+        """
+        if record.cbo in self.any_roles:
+            return True
+        return record.cbo in self.establishment_roles and record.aps
+
+    def band_of(self, chs_amb):
+        """
+        Return the position of the band of a CHS AMB. value, or None if it is below every band.
+        """
+        for position, band in enumerate(self.bands):
+            if chs_amb >= band.min_hours:
+                return position
+        return None
+
+    def count(self, records, valid_lines=None):
+        """
+        Count the lines of each band, in file order, and optionally collect the counted lines.
+
+        Args:
+            records (list): HistoryRecord of a history, with record.aps set for this rule set.
+            valid_lines (list): List extended with the counted lines, or None.
+
+        Returns:
+            list: Number of lines counted in each band, in the order of self.bands.
+        """
+        counts = [0] * len(self.bands)
+        accepted = [(record, self.band_of(record.chs_amb)) for record in records if self.accepts(record)]
+        blocked = set()
+
+        # Each exclusive band counts its unique months, which the bands below do not count.
+        for position, band in enumerate(self.bands):
+            if not band.exclusive:
+                continue
+            months = set()
+            for record, band_position in accepted:
+                month = record.month
+                if band_position == position and month not in blocked and month not in months:
+                    months.add(month)
+                    if valid_lines is not None:
+                        valid_lines.append(record)
+            counts[position] = len(months)
+            blocked |= months
+
+        # The other bands are counted together, up to their monthly cap.
+        per_month = [{} for _ in self.bands]
+        for record, band_position in accepted:
+            if band_position is None or self.bands[band_position].exclusive:
+                continue
+            month = record.month
+            if month in blocked:
+                continue
+            month_counts = per_month[band_position]
+            month_count = month_counts.get(month, 0)
+            if month_count < self.bands[band_position].monthly_cap:
+                month_counts[month] = month_count + 1
+                counts[band_position] += 1
+                if valid_lines is not None:
+                    valid_lines.append(record)
+        return counts
+
+    def result(self, counts):
+        """
+        Apply the threshold to the number of lines of each band.
+
+        Args:
+            counts (list): Number of lines counted in each band, in the order of self.bands.
+
+        Returns:
+            valid_months (float): Weighted number of valid months.
+            result (dict): Status, pending months and semesters of each band.
+        """
+        valid_months = 0
+        for band, band_count in zip(self.bands, counts):
+            valid_months += band_count * band.weight
+        result = {
+            "status": "Eligible" if valid_months >= self.threshold else "Not eligible",
+            "pending": max(0, self.threshold - valid_months)
+        }
+        for band, band_count in zip(self.bands, counts):
+            result[f"semesters_{band.name}"] = band_count // 6
+        return valid_months, result
+
+def load_rulesets(path):
+    """
+    Load rule sets from a JSON file, with the format of DEFAULT_RULESET, either as a list or as {"rulesets": [...]}.
+    The first rule set is the primary one: it gives the filtered files and the main columns of the report.
+
+    Raises:
+        ValueError: If the file is not valid.
+    """
+    with open(path, mode='r', encoding='utf-8') as file:
+        data = json.load(file)
+    definitions = data.get("rulesets") if isinstance(data, dict) else data
+    if not isinstance(definitions, list) or not definitions:
+        raise ValueError(f"The rule sets file {path} must contain a list of rule sets.")
+    rulesets = [RuleSet(definition) for definition in definitions]
+    if len({ruleset.name for ruleset in rulesets}) != len(rulesets):
+        raise ValueError(f"The rule sets of {path} must have distinct names.")
+    return rulesets
+
+def configure_rulesets(path=None):
+    """
+    Replace the process-wide rule sets, using a JSON file or the default rule set.
+    """
+    global _rulesets, _rulesets_custom
+    rulesets = load_rulesets(path) if path else [RuleSet(DEFAULT_RULESET)]
+    with _rulesets_lock:
+        _rulesets = rulesets
+        _rulesets_custom = bool(path)
+    if path:
+        logging.info(f"Rule sets loaded from {path}: {', '.join(ruleset.name for ruleset in rulesets)}.")
+
+def get_rulesets():
+    """
+    Return the process-wide rule sets, the primary one first.
+    """
+    global _rulesets
+    rulesets = _rulesets
+    if rulesets is None:
+        with _rulesets_lock:
+            if _rulesets is None:
+                _rulesets = [RuleSet(DEFAULT_RULESET)]
+            rulesets = _rulesets
+    return rulesets
+
+def custom_rulesets():
+    """
+    Return True if the rule sets were loaded from a file instead of being the default rule set.
+    """
+    return _rulesets_custom
+
+def parse_filters(rulesets):
+    """
+    Return what parsing must keep for the rule sets: the lowest CHS AMB. of any band,
+    and the roles whose establishment must be resolved.
+    """
+    min_hours = min(ruleset.min_hours for ruleset in rulesets)
+    establishment_roles = frozenset().union(*(ruleset.establishment_roles for ruleset in rulesets))
+    return min_hours, establishment_roles
@@ -0,0 +1,85 @@
+from establishment_index import configure_competencia, DEFAULT_COMPETENCIA
+from cbo_classifier import configure_cbo_classifier
+from rulesets import configure_rulesets
+from establishment_history import configure_establishment_history
+from history_files import configure_output_compression
+from instrumentation import enable_instrumentation
+from establishment_validator import configure_lookup_backend
+from driver_pool import configure_driver_pool, DEFAULT_POOL_SIZE, DEFAULT_MAX_USES
+from lookup_cache import configure_lookup_cache, DEFAULT_TTL_DAYS, DEFAULT_NEGATIVE_TTL_DAYS
+
+class RunSettings:
+    """
+    Settings of a run, built once from the command line.
+
+    The scoring settings change how a file is scored and written; apply installs them in the modules that
+    use them. The worker processes receive the same object and apply it again, because the workers started
+    with spawn or forkserver do not inherit the settings of the main process. The lookup settings are only
+    used by the process that checks the CNES website.
+    """
+    __slots__ = ("competencia", "cbo_rules", "rulesets", "compress", "history", "metrics",
+                 "lookup_backend", "browsers", "browser_max_uses", "cache", "cache_ttl_days", "negative_cache_ttl_days",
+                 "offline")
+
+    def __init__(self, competencia=DEFAULT_COMPETENCIA, cbo_rules=None, rulesets=None, compress=None, history=None,
+                 metrics=False, lookup_backend="selenium", browsers=DEFAULT_POOL_SIZE, browser_max_uses=DEFAULT_MAX_USES,
+                 cache=True, cache_ttl_days=DEFAULT_TTL_DAYS, negative_cache_ttl_days=DEFAULT_NEGATIVE_TTL_DAYS,
+                 offline=False):
+        # Scoring settings.
+        self.competencia = competencia
+        self.cbo_rules = cbo_rules  # Path of the CBO rules, or None for the default rules.
+        self.rulesets = rulesets  # Path of the rule sets, or None for the default rule set.
+        self.compress = compress  # Compression of the filtered files, or None to keep their format.
+        self.history = history  # Path of the establishment history store, or None.
+        self.metrics = metrics
+        # Lookup settings.
+        self.lookup_backend = lookup_backend
+        self.browsers = browsers
+        self.browser_max_uses = browser_max_uses
+        self.cache = cache
+        self.cache_ttl_days = cache_ttl_days
+        self.negative_cache_ttl_days = negative_cache_ttl_days
+        self.offline = offline
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build the settings from the arguments of main.parse_arguments.
+        """
+        return cls(args.competencia, args.cbo_rules, args.rulesets, args.compress, args.history, args.metrics,
+                   args.lookup_backend, args.browsers, args.browser_max_uses, not args.no_cache, args.cache_ttl_days,
+                   args.negative_cache_ttl_days, args.offline)
+
+    def apply(self):
+        """
+        Install the scoring settings in the current process.
+        """
+        configure_competencia(self.competencia)
+        configure_cbo_classifier(self.cbo_rules)
+        configure_rulesets(self.rulesets)
+        configure_output_compression(self.compress)
+        configure_establishment_history(self.history)
+        if self.metrics:
+            enable_instrumentation()
+
+    def apply_lookup(self):
+        """
+        Install the lookup settings in the current process.
+        """
+        configure_lookup_backend(self.lookup_backend)
+        configure_driver_pool(self.browsers, self.browser_max_uses)
+        configure_lookup_cache(ttl_days=self.cache_ttl_days, negative_ttl_days=self.negative_cache_ttl_days,
+                               enabled=self.cache)
+
+    def reference_files(self):
+        """
+        Return the files given on the command line that change the results, None for the unused ones.
+        """
+        return [self.cbo_rules, self.rulesets, self.history]
+
+    def lookup_fingerprint(self):
+        """
+        Return the lookup settings that change the verdicts, as recorded in the manifest.
+        """
+        return {"lookup_backend": self.lookup_backend, "offline": self.offline, "cache": self.cache,
+                "cache_ttl_days": self.cache_ttl_days, "negative_cache_ttl_days": self.negative_cache_ttl_days}
@@ -0,0 +1,370 @@
+import os
+import re
+import json
+import time
+import signal
+import sqlite3
+import logging
+import argparse
+import threading
+import socketserver
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from processing import read_history, parse_text, score_records
+from history_reader import decode_history
+from establishment_validator import (classify_establishments, cached_verdict, verify_establishment_online,
+                                     configure_lookup_backend, LOOKUP_BACKENDS)
+from establishment_index import (read_establishment_index, set_establishment_index, get_establishment_index,
+                                 configure_competencia, get_competencia, DEFAULT_COMPETENCIA)
+from establishment_history import EstablishmentHistory, set_establishment_history, DEFAULT_HISTORY_PATH
+from cbo_classifier import CboClassifier, load_cbo_rules, set_cbo_classifier, DEFAULT_RULES
+from rulesets import configure_rulesets
+from lookup_cache import configure_lookup_cache, close_lookup_cache, verdict_services
+from driver_pool import configure_driver_pool, close_driver_pool, DEFAULT_POOL_SIZE
+from cnes_http import close_http_client
+from main import get_assets_path, setup_logging
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# Competências accepted by /reload, which become part of the paths of the databases.
+COMPETENCIA_PATTERN = re.compile(r"\d{6}", re.ASCII)
+
+class ServiceError(Exception):
+    """
+    Raised when a request cannot be answered, with the HTTP status of the response.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ReferenceLock:
+    """
+    Lets any number of requests use the reference data at the same time, while a reload waits for the
+    requests already running and holds the new ones only for the moment it swaps the data.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class EligibilityService:
+    """
+    Scores single professional histories against reference data loaded once and kept in memory.
+
+    The establishment index, the CBO classifier and the establishment history are replaced together by
+    reload; a request sees either the old or the new data, never a mix of both.
+    """
+
+    def __init__(self, root, cbo_rules=None, history_path=None):
+        self.root = os.path.realpath(root)
+        self.cbo_rules = cbo_rules
+        self.history_path = history_path
+        self.lock = ReferenceLock()
+        self.generation = 0
+        self.requests = 0
+        self.started = time.time()
+        self._reload_lock = threading.Lock()
+        self._requests_lock = threading.Lock()
+
+    def reload(self, competencia=None):
+        """
+        Load the reference data again, for example after the databases of a new competência were built,
+        and swap it in once it is complete. If the loading fails, the current data is kept.
+
+        Args:
+            competencia (str): Competência (YYYYMM) of the databases. Defaults to the current one.
+
+        Returns:
+            dict: Competência and number of establishments of the data in use.
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            competencia = competencia or get_competencia()
+            index = read_establishment_index(competencia=competencia)
+            if len(index) == 0:
+                raise ServiceError(500, f"No establishments found in the databases of the competência {competencia}.")
+            try:
+                classifier = CboClassifier(load_cbo_rules(self.cbo_rules) if self.cbo_rules else DEFAULT_RULES)
+                history = EstablishmentHistory.load(self.history_path) if self.history_path else None
+            except (OSError, ValueError, sqlite3.Error) as e:
+                raise ServiceError(500, f"Error loading the reference data: {e}")
+            with self.lock.writing():
+                configure_competencia(competencia)
+                set_establishment_index(index)
+                set_cbo_classifier(classifier)
+                set_establishment_history(history)
+                self.generation += 1
+            elapsed = time.perf_counter() - start
+            logging.info(f"Reference data of the competência {competencia} loaded in {elapsed:.2f} seconds.")
+            return {"competencia": competencia, "establishments": len(index), "elapsed_ms": round(elapsed * 1000, 3)}
+
+    def resolve_path(self, path):
+        """
+        Return the absolute path of a history, which must be inside the root folder of the service.
+        """
+        file_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, file_path]) != self.root:
+            raise ServiceError(403, f"{path} is outside {self.root}.")
+        if not os.path.isfile(file_path):
+            raise ServiceError(404, f"{path} not found.")
+        return file_path
+
+    def score(self, content=None, file_path=None, online=True):
+        """
+        Score a professional history, given as CSV text or as the path of a file, without writing anything.
+
+        The establishments missing from the databases are checked on the CNES website outside the lock, so
+        a slow check never holds a reload. With online=False, only the lookup cache is consulted and the
+        establishments without a verdict are returned in "unresolved" and counted as not valid.
+
+        Returns:
+            dict: The fields of the overall_result entry, plus valid_months, unresolved and competencia.
+        """
+        start = time.perf_counter()
+        verdicts = {}
+        while True:
+            with self.lock.reading():
+                if file_path is not None:
+                    fieldnames, records, establishments = read_history(file_path)
+                else:
+                    fieldnames, records, establishments = parse_text(content)
+                if fieldnames is None:
+                    raise ServiceError(400, "The history is empty.")
+                valid_cnes, pending = classify_establishments(establishments)
+                missing = []
+                for establishment in pending:
+                    _, cnes, establishment_name = establishment
+                    if cnes in verdicts:
+                        continue
+                    if online:
+                        missing.append(establishment)
+                        continue
+                    verdict = cached_verdict(cnes, establishment_name)
+                    verdicts[cnes] = verdict_services(verdict) if verdict is not None else None
+                if not missing:
+                    for _, cnes, _ in pending:
+                        if verdicts.get(cnes):
+                            valid_cnes[cnes] = valid_cnes.get(cnes, 0) | verdicts[cnes]
+                    _, valid_months, result = score_records(records, valid_cnes)
+                    competencia = get_competencia()
+                    break
+            # Check the missing establishments without the lock, then score again with their verdicts.
+            for _, cnes, establishment_name in missing:
+                if cnes not in verdicts:
+                    verdicts[cnes] = verify_establishment_online(cnes, establishment_name)
+        with self._requests_lock:
+            self.requests += 1
+        return dict(result, valid_months=valid_months, competencia=competencia,
+                    unresolved=sorted({cnes for _, cnes, _ in pending if verdicts.get(cnes) is None}),
+                    elapsed_ms=round((time.perf_counter() - start) * 1000, 3))
+
+    def health(self):
+        """
+        Return the state of the service.
+        """
+        return {"competencia": get_competencia(), "establishments": len(get_establishment_index()),
+                "requests": self.requests, "reloads": self.generation - 1,
+                "uptime_seconds": round(time.time() - self.started, 1)}
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of the service:
+        GET /health: state of the service.
+        POST /score: score the CSV history in the body, or {"path": ...} relative to the root folder.
+            The query parameter online=0 (or "online": false) never contacts the CNES website.
+        POST /reload: reload the reference data, optionally {"competencia": "YYYYMM"}.
+    """
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self.respond(200, self.service.health())
+        else:
+            self.respond(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/score":
+                self.respond(200, self.handle_score(parse_qs(url.query)))
+            elif url.path == "/reload":
+                competencia = self.read_json().get("competencia")
+                if competencia is not None and not (isinstance(competencia, str)
+                                                    and COMPETENCIA_PATTERN.fullmatch(competencia)):
+                    raise ServiceError(400, f"Invalid competência {competencia!r}, expected YYYYMM.")
+                self.respond(200, self.service.reload(competencia))
+            else:
+                self.respond(404, {"error": f"Unknown path {url.path}"})
+        except ServiceError as e:
+            self.respond(e.status, {"error": str(e)})
+        except ValueError as e:
+            # A missing column, an unknown COMP. format or an invalid JSON body.
+            self.respond(400, {"error": f"Invalid history: {e}"})
+        except Exception as e:
+            logging.error(f"Error answering {url.path}: {e}")
+            self.respond(500, {"error": str(e)})
+
+    def handle_score(self, query):
+        online = query.get("online", ["1"])[0] not in ("0", "false")
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            body = self.read_json()
+            if "path" not in body:
+                raise ServiceError(400, "The JSON body must have a path.")
+            online = body.get("online", online)
+            if not isinstance(online, bool):
+                raise ServiceError(400, f"Invalid online value {online!r}, expected true or false.")
+            file_path = self.service.resolve_path(body["path"])
+            return dict(self.service.score(file_path=file_path, online=online), file=body["path"])
+        content = decode_history(self.read_body())
+        return dict(self.service.score(content=content, online=online), file=query.get("name", [None])[0])
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ServiceError(413, f"The body is larger than {MAX_BODY_BYTES} bytes.")
+        return self.rfile.read(length)
+
+    def read_json(self):
+        body = self.read_body()
+        data = json.loads(body) if body else {}
+        if not isinstance(data, dict):
+            raise ServiceError(400, "The JSON body must be an object.")
+        return data
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket, one thread per connection.
+    """
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Create the HTTP server of the service, on a TCP port or on a Unix socket.
+    """
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    """
+    Run the eligibility service until it is interrupted. SIGHUP reloads the reference data.
+    """
+    parser = argparse.ArgumentParser(description="Serve the eligibility rules over HTTP, with the reference data kept in memory.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on.")
+    parser.add_argument("--socket", default=None, help="Listen on this Unix socket instead of a TCP port.")
+    parser.add_argument("--root", default=None,
+                        help="Folder of the histories that can be scored by path (default: assets).")
+    parser.add_argument("--competencia", default=DEFAULT_COMPETENCIA,
+                        help="Competência (YYYYMM) of the reference databases built by databases/criacao_bases.py.")
+    parser.add_argument("--history", nargs="?", const=DEFAULT_HISTORY_PATH, default=None,
+                        help="Judge each line by the services of its establishment at the competência of the line "
+                             "(default: databases/estab_history.db).")
+    parser.add_argument("--cbo-rules", default=None,
+                        help="JSON file with the rules that map DESCRICAO CBO values to roles (see cbo_classifier.py).")
+    parser.add_argument("--rulesets", default=None,
+                        help="JSON file with the eligibility rule sets to score every history against (see rulesets.py).")
+    parser.add_argument("--lookup-backend", choices=LOOKUP_BACKENDS, default="selenium",
+                        help="How establishments are checked on the CNES website.")
+    parser.add_argument("--browsers", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Maximum number of browser sessions kept open to check establishments on the CNES website.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always check the CNES website, ignoring the cache of verdicts.")
+    args = parser.parse_args()
+    setup_logging()
+    configure_competencia(args.competencia)
+    configure_rulesets(args.rulesets)
+    configure_lookup_backend(args.lookup_backend)
+    configure_driver_pool(args.browsers)
+    configure_lookup_cache(enabled=not args.no_cache)
+
+    service = EligibilityService(args.root or get_assets_path(), args.cbo_rules, args.history)
+    try:
+        service.reload()
+    except ServiceError as e:
+        logging.error(e)
+        return
+    server = create_server(service, args.host, args.port, args.socket)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=reload_quietly, args=(service,),
+                                                                            daemon=True).start())
+    logging.info(f"Eligibility service listening on {args.socket or f'http://{args.host}:{args.port}'}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        close_driver_pool()
+        close_http_client()
+        close_lookup_cache()
+
+def reload_quietly(service):
+    """
+    Reload the reference data, logging the errors instead of raising them.
+    """
+    try:
+        service.reload()
+    except Exception as e:
+        logging.error(f"Error reloading the reference data: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,46 @@
 from datetime import datetime
 
+# Month abbreviations of the format "mon/YY".
+MONTH_ABBREVIATIONS = {
+    "jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+    "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12
+}
+
+# Month keys already computed for each COMP. value (None for unknown formats).
+_month_keys = {}
+
+def parse_month(date):
+    """
+    Converts dates from different formats to an integer month key (year * 12 + month).
+    Accepts the same formats as parse_date. Each distinct string is parsed only once.
+
+    Args:
+        date (str): String indicating the date.
+
+    Returns:
+        int: Month key, or None if the date format is unknown.
+    """
+    try:
+        return _month_keys[date]
+    except KeyError:
+        key = _month_keys[date] = _parse_month_key(date)
+        return key
+
+def _parse_month_key(date):
+    month, separator, year = date.partition("/")
+    if not separator or not year.isascii() or not year.isdigit():
+        return None
+    if month.isascii() and month.isdigit():
+        # Format "MM/YYYY"
+        if len(month) <= 2 and 1 <= int(month) <= 12 and len(year) == 4:
+            return int(year) * 12 + int(month)
+        return None
+    # Format "mon/YY": add "20" to the abbreviated year
+    month_number = MONTH_ABBREVIATIONS.get(month.lower())
+    if month_number is None or len(year) != 2:
+        return None
+    return (2000 + int(year)) * 12 + month_number
+
 def parse_date(date):
     """
     Converts dates from different formats to a common format.
@@ -16,31 +57,11 @@ def parse_date(date):
     Raises:
         ValueError: Se the date format is unknown.
     """
-    try:
-        # First, try the format "MM/YYYY"
-        return datetime.strptime(date, "%m/%Y")
-    except ValueError:
-        pass  # If it fails, try the next format
-    
-    try:
-        # Next, try the format "mon/YY"
-        months = {
-            "jan": "01", "fev": "02", "mar": "03", "abr": "04", "mai": "05", "jun": "06",
-            "jul": "07", "ago": "08", "set": "09", "out": "10", "nov": "11", "dez": "12"
-        }
-        # Extract month and year from the format "mon/YY"
-        try:
-            month_abbr, year = date.split("/")
-        except ValueError:
-            raise ValueError(f"Unknown date format: {date}")
-        month_abbr_lower = month_abbr.lower()
-        if month_abbr_lower not in months:
-            raise ValueError(f"Unknown date format: {date}")
-        month = months[month_abbr_lower]  # Convert the abbreviated month to number
-        full_year = "20" + year  # Add "20" to the abbreviated year
-        return datetime.strptime(f"{month}/{full_year}", "%m/%Y")
-    except (ValueError, KeyError):
+    key = parse_month(date)
+    if key is None:
         raise ValueError(f"Unknown date format: {date}")
+    year, month = divmod(key - 1, 12)
+    return datetime(year, month + 1, 1)
 
 def check_cbo_description(cbo_description, terms):
     """Function to check if the "CBO DESCRIPTION" contains the desired terms"""
@@ -0,0 +1,154 @@
+import os
+import sys
+import sqlite3
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from establishment_index import (configure_competencia, set_establishment_index, read_establishment_index,
+                                 DEFAULT_COMPETENCIA)
+from cbo_classifier import configure_cbo_classifier
+from rulesets import configure_rulesets
+from establishment_history import set_establishment_history
+from history_files import configure_output_compression, configure_bundle
+from lookup_cache import configure_lookup_cache, close_lookup_cache
+import report_generator
+
+COMPETENCIA = DEFAULT_COMPETENCIA
+HEADER = "COMP.;CNES;IBGE;ESTABELECIMENTO;CHS AMB.;DESCRICAO CBO;CHS OUTRAS"
+
+# Services of the establishments of the tiny databases, by IBGE+CNES.
+SERVICES = {
+    "3550302000259": (159,),
+    "3304552000110": (152,),
+    "5300102000101": (159, 152),
+    "5300102000027": (100,)
+}
+# Establishment that is in no database, so it must be checked on the CNES website.
+UNLISTED = ("999999", "7777777")
+
+def write_databases(databases_dir, competencia=COMPETENCIA, services=SERVICES):
+    """
+    Write the two reference databases of a competência, as built by databases/criacao_bases.py.
+    """
+    os.makedirs(databases_dir, exist_ok=True)
+    with sqlite3.connect(os.path.join(databases_dir, f"estabelecimentos_{competencia}.db")) as connection:
+        connection.execute("CREATE TABLE tabela_dados (CO_UNIDADE TEXT NOT NULL, CO_SERVICO INTEGER NOT NULL)")
+        connection.executemany("INSERT INTO tabela_dados VALUES (?, ?)",
+                               [(key, code) for key, codes in services.items() for code in codes])
+    with sqlite3.connect(os.path.join(databases_dir, f"estab_{competencia}_159_152.db")) as connection:
+        connection.execute("CREATE TABLE serv159152 (valor TEXT PRIMARY KEY)")
+        connection.executemany("INSERT INTO serv159152 VALUES (?)",
+                               [(key,) for key, codes in services.items() if {159, 152} & set(codes)])
+    return databases_dir
+
+def history_lines(start_year, months, ibge, cnes, chs_amb, cbo):
+    """
+    Lines of a history for consecutive months, starting in January of start_year.
+    """
+    return [f"{month % 12 + 1:02d}/{start_year + month // 12};{cnes};{ibge};UBS {cnes};{chs_amb};{cbo};0"
+            for month in range(months)]
+
+def write_history(path, lines):
+    with open(path, mode="w", encoding="utf-8", newline="") as file:
+        file.write("\r\n".join([HEADER] + lines) + "\r\n")
+    return path
+
+# Histories covering the rules: a family doctor, clinicians in 159, 152 and 159+152 establishments,
+# a generalist in an establishment without those services and one in an establishment missing from the databases.
+HISTORIES = {
+    "prof001.csv": history_lines(2014, 60, "355030", "1111111", 40, "MEDICO DA ESTRATEGIA DE SAUDE DA FAMILIA"),
+    "prof002.csv": history_lines(2014, 30, "355030", "2000259", 40, "MEDICO CLINICO")
+                   + history_lines(2017, 30, "330455", "2000110", 30, "MEDICO CLINICO")
+                   + history_lines(2017, 30, "530010", "2000027", 20, "MEDICO GENERALISTA"),
+    "prof003.csv": history_lines(2015, 40, "530010", "2000101", 20, "MEDICOS CLINICOS")
+                   + history_lines(2015, 40, "530010", "2000101", 24, "MEDICO GENERALISTA")
+                   + history_lines(2015, 12, "530010", "2000027", 40, "ENFERMEIRO"),
+    "prof004.csv": history_lines(2016, 50, UNLISTED[0], UNLISTED[1], 40, "MEDICO CLINICO")
+                   + history_lines(2016, 20, "355030", "2000259", 30, "MEDICO GENERALISTA")
+}
+
+@pytest.fixture(autouse=True)
+def reset_settings(tmp_path, monkeypatch):
+    """
+    Keep the process-wide settings of a test from leaking into the next one, and the report and the
+    lookup cache out of the repository.
+    """
+    report_dir = tmp_path / "report"
+    report_dir.mkdir()
+    monkeypatch.setattr(report_generator, "get_report_dir", lambda: str(report_dir))
+    configure_lookup_cache(path=str(tmp_path / "cnes_lookup_cache.db"))
+    yield
+    close_lookup_cache()
+    configure_lookup_cache()
+    configure_competencia(DEFAULT_COMPETENCIA)
+    set_establishment_index(None)
+    configure_cbo_classifier()
+    configure_rulesets()
+    set_establishment_history(None)
+    configure_output_compression(None)
+    configure_bundle(None)
+
+@pytest.fixture
+def databases(tmp_path):
+    """
+    Folder with the tiny reference databases, loaded as the process-wide establishment index.
+    """
+    databases_dir = write_databases(str(tmp_path / "databases"))
+    set_establishment_index(read_establishment_index(databases_dir, COMPETENCIA))
+    return databases_dir
+
+@pytest.fixture
+def assets(tmp_path):
+    """
+    Assets folder with the histories of HISTORIES.
+    """
+    assets_dir = tmp_path / "assets"
+    assets_dir.mkdir()
+    for name, lines in HISTORIES.items():
+        write_history(str(assets_dir / name), lines)
+    return str(assets_dir)
+
+@pytest.fixture
+def online_verdicts(monkeypatch):
+    """
+    Replace the CNES website by a table of verdicts, by CNES. The checks made are listed in "calls".
+    """
+    import establishment_validator
+    from lookup_cache import VERDICT_NOT_LISTED
+    verdicts = {"calls": []}
+
+    def lookup(cnes, establishment_name):
+        verdicts["calls"].append(cnes)
+        verdict = verdicts.get(cnes, VERDICT_NOT_LISTED)
+        if isinstance(verdict, Exception):
+            raise verdict
+        return verdict, False
+    monkeypatch.setattr(establishment_validator, "lookup_establishment_online", lookup)
+    return verdicts
+
+def run_main(monkeypatch, assets_dir, *argv):
+    """
+    Run main.main() over an assets folder and return the content of overall_result.csv, or None if it was not written.
+    """
+    import main
+    monkeypatch.setattr(main, "get_assets_path", lambda: assets_dir)
+    monkeypatch.setattr(main, "get_report_dir", report_generator.get_report_dir)
+    monkeypatch.setattr(sys, "argv", ["main.py", "--no-cache"] + list(argv))
+    main.main()
+    report = report_generator.report_path()
+    if not os.path.exists(report):
+        return None
+    with open(report, mode="r", encoding="utf-8") as file:
+        return file.read()
+
+def folder_contents(folder):
+    """
+    Return the content of each file of a folder, by name.
+    """
+    contents = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), mode="rb") as file:
+            contents[name] = file.read()
+    return contents
@@ -0,0 +1,45 @@
+import time
+import threading
+import pytest
+import async_verifier
+from async_verifier import verify_establishments
+from lookup_cache import VERDICT_159
+from establishment_index import SERVICE_159, SERVICE_ONLINE
+
+ESTABLISHMENTS = [(f"355030{cnes}", cnes, f"UBS {cnes}") for cnes in ("2000001", "2000002", "2000003", "2000004")]
+
+@pytest.fixture
+def checks(monkeypatch):
+    """
+    Replace the checks on the CNES website by blocking calls that take "seconds", recording how many run at once.
+    """
+    state = {"seconds": 0.0, "running": 0, "peak": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def fetch_verdict(cnes, establishment_name):
+        with lock:
+            state["calls"] += 1
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        try:
+            time.sleep(state["seconds"])
+            return VERDICT_159
+        finally:
+            with lock:
+                state["running"] -= 1
+    monkeypatch.setattr(async_verifier, "fetch_verdict", fetch_verdict)
+    return state
+
+def test_verdicts(checks):
+    verdicts = verify_establishments(ESTABLISHMENTS + ESTABLISHMENTS[:2], concurrency=2, rate=0)
+    assert verdicts == {key: SERVICE_159 | SERVICE_ONLINE for key, _, _ in ESTABLISHMENTS}
+    assert checks["calls"] == 4
+    assert checks["peak"] <= 2
+
+def test_timed_out_checks_keep_their_slot(checks):
+    # Every attempt times out, and its thread keeps running after the timeout.
+    checks["seconds"] = 0.3
+    verdicts = verify_establishments(ESTABLISHMENTS, concurrency=2, rate=0, timeout=0.05, retries=1, backoff=0)
+    assert verdicts == {key: None for key, _, _ in ESTABLISHMENTS}
+    assert checks["calls"] == 8
+    assert checks["peak"] == 2
@@ -0,0 +1,36 @@
+import json
+import pytest
+from cbo_classifier import CboClassifier, CboRole, classify_cbo, configure_cbo_classifier, load_cbo_rules
+
+@pytest.mark.parametrize("description, role", [
+    ("MEDICO DA ESTRATEGIA DE SAUDE DA FAMILIA", CboRole.FAMILY_DOCTOR),
+    ("Médico da Estratégia de Saúde da Família", CboRole.FAMILY_DOCTOR),
+    ("médico clínico", CboRole.CLINICIAN),
+    ("MÉDICOS CLÍNICOS", CboRole.CLINICIAN),
+    ("Médico Generalista", CboRole.GENERALIST),
+    ("ENFERMEIRO", CboRole.OTHER)
+])
+def test_default_rules(description, role):
+    assert CboClassifier().classify(description) == role
+
+def test_each_description_is_classified_once():
+    classifier = CboClassifier()
+    assert classifier.classify("Médico Clínico") == CboRole.CLINICIAN
+    classifier.rules = []
+    assert classifier.classify("Médico Clínico") == CboRole.CLINICIAN
+    assert classifier.classify("MEDICO CLINICO") == CboRole.OTHER
+
+def test_configured_rules(tmp_path):
+    path = tmp_path / "cbo_rules.json"
+    path.write_text(json.dumps({"rules": [{"role": "GENERALIST", "terms": ["Médico"]}]}), encoding="utf-8")
+    configure_cbo_classifier(str(path))
+    assert classify_cbo("MEDICO DA ESTRATEGIA DE SAUDE DA FAMILIA") == CboRole.GENERALIST
+    assert classify_cbo("ENFERMEIRO") == CboRole.OTHER
+
+@pytest.mark.parametrize("rules", [{"role": "CLINICIAN"}, [{"role": "SURGEON", "terms": ["CIRURGIAO"]}],
+                                   [{"role": "CLINICIAN", "terms": []}]])
+def test_invalid_rules(tmp_path, rules):
+    path = tmp_path / "cbo_rules.json"
+    path.write_text(json.dumps(rules), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_cbo_rules(str(path))
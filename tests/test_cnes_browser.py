@@ -0,0 +1,43 @@
+import os
+import pathlib
+import pytest
+
+pytest.importorskip("selenium")
+
+import driver_pool
+import cnes_browser
+from lookup_cache import VERDICT_159, VERDICT_152, VERDICT_159_152, VERDICT_NO_SERVICE, VERDICT_NOT_LISTED
+
+STUB_PAGE = pathlib.Path(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cnes_consulta.html")
+
+@pytest.fixture
+def stub_site(monkeypatch):
+    """
+    Browse the stub consulta page with a single headless Chrome session, skipping when Chrome cannot start.
+    """
+    try:
+        driver = driver_pool.create_chrome_driver()
+    except Exception as e:
+        pytest.skip(f"Chrome is not available: {e}")
+    monkeypatch.setattr(cnes_browser, "CNES_SEARCH_URL", STUB_PAGE.as_uri())
+    pool = driver_pool.DriverPool(size=1, factory=lambda: driver)
+    monkeypatch.setattr(driver_pool, "_pool", pool)
+    yield
+    pool.close()
+
+@pytest.mark.parametrize("cnes, verdict", [
+    ("2000259", VERDICT_159),
+    ("2000110", VERDICT_152),
+    ("2000101", VERDICT_159_152),
+    ("2000027", VERDICT_NO_SERVICE)
+])
+def test_services(stub_site, cnes, verdict):
+    valid_cnes = []
+    assert cnes_browser.check_establishment_browser(cnes, "UBS SEM CADASTRO", valid_cnes) == (verdict, False)
+    assert valid_cnes == ([cnes] if verdict != VERDICT_NO_SERVICE else [])
+
+def test_search_by_name(stub_site):
+    assert cnes_browser.check_establishment_browser("7777777", "UBS CENTRAL", []) == (VERDICT_152, True)
+
+def test_not_listed(stub_site):
+    assert cnes_browser.check_establishment_browser("7777777", "UBS SEM CADASTRO", []) == (VERDICT_NOT_LISTED, True)
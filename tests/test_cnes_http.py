@@ -0,0 +1,125 @@
+import json
+import threading
+import http.server
+import pytest
+
+pytest.importorskip("urllib3")
+
+import cnes_http
+import establishment_validator
+from cnes_http import CnesHttpClient, CnesHttpError
+from lookup_cache import VERDICT_159, VERDICT_152, VERDICT_159_152, VERDICT_NO_SERVICE, VERDICT_NOT_LISTED
+
+SERVICES_TABLE = """<table ng-table="tableParamsServicosEspecializados"><tbody>
+<tr><td data-title-text="C&oacute;digo"> 152 </td><td data-title-text="Descri&ccedil;&atilde;o">SERVICO 152</td></tr>
+<tr><td data-title-text="C&oacute;digo"><span>120</span></td><td data-title-text="Descri&ccedil;&atilde;o">SERVICO 120</td></tr>
+</tbody></table>"""
+
+# Responses of the CNES services, by path: status, content type and body.
+RESPONSES = {
+    "/estabelecimentos?cnes=2000259": (200, "application/json", [{"id": "3550302000259", "noFantasia": "UBS 2000259"}]),
+    "/estabelecimentos-servicos/3550302000259": (200, "application/json", [{"codigo": "159"}, {"codigo": "100"}]),
+    "/estabelecimentos?cnes=2000110": (200, "application/json", {"content": [{"coUnidade": "3304552000110"}]}),
+    "/estabelecimentos-servicos/3304552000110": (200, "text/html; charset=utf-8", SERVICES_TABLE),
+    "/estabelecimentos?cnes=2000101": (200, "application/json", [{"co_unidade": "5300102000101"}]),
+    "/estabelecimentos-servicos/5300102000101": (200, "application/json", {"data": [{"coServico": 152}, {"coServico": 159}]}),
+    "/estabelecimentos?cnes=2000027": (200, "application/json", [{"id": "5300102000027"}]),
+    "/estabelecimentos-servicos/5300102000027": (200, "application/json", [{"codigo": "100"}]),
+    "/estabelecimentos?cnes=7777777": (200, "application/json", []),
+    "/estabelecimentos?nome=UBS+CENTRAL": (200, "application/json", [{}, {"id": "9999997777777"}]),
+    "/estabelecimentos-servicos/9999997777777": (200, "application/json", [{"codigo": "159"}]),
+    "/estabelecimentos?nome=UBS+SEM+CADASTRO": (200, "application/json", []),
+    "/estabelecimentos?cnes=5000000": (503, "text/plain", "Service Unavailable"),
+    "/estabelecimentos?cnes=6000000": (200, "text/html", "<html>Sessão expirada</html>")
+}
+
+class RecordedHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        status, content_type, body = RESPONSES.get(self.path, (404, "text/plain", "Not Found"))
+        data = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def cnes_server(monkeypatch):
+    """
+    Local server answering with the recorded responses of RESPONSES, with the client pointed to it.
+    The paths requested are listed in server.requests.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RecordedHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(cnes_http, "SEARCH_BY_CNES_URL", url + "/estabelecimentos?cnes={search}")
+    monkeypatch.setattr(cnes_http, "SEARCH_BY_NAME_URL", url + "/estabelecimentos?nome={search}")
+    monkeypatch.setattr(cnes_http, "SERVICES_URL", url + "/estabelecimentos-servicos/{id}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(cnes_server):
+    client = CnesHttpClient(pool_size=2, timeout=5.0, retries=0)
+    yield client
+    client.close()
+
+@pytest.mark.parametrize("cnes, verdict", [
+    ("2000259", VERDICT_159),
+    ("2000110", VERDICT_152),
+    ("2000101", VERDICT_159_152),
+    ("2000027", VERDICT_NO_SERVICE)
+])
+def test_services(client, cnes, verdict):
+    assert client.check_establishment(cnes, "UBS SEM CADASTRO") == (verdict, False)
+
+def test_html_service_codes(client):
+    assert client.service_codes("3304552000110") == ["152", "120"]
+
+def test_search_by_name(client, cnes_server):
+    assert client.check_establishment("7777777", "UBS CENTRAL") == (VERDICT_159, True)
+    assert cnes_server.requests == ["/estabelecimentos?cnes=7777777", "/estabelecimentos?nome=UBS+CENTRAL",
+                                    "/estabelecimentos-servicos/9999997777777"]
+
+def test_not_listed(client):
+    assert client.check_establishment("7777777", "UBS SEM CADASTRO") == (VERDICT_NOT_LISTED, True)
+
+@pytest.mark.parametrize("cnes", ["5000000", "6000000", "8000000"])
+def test_errors_are_raised(client, cnes):
+    with pytest.raises(Exception):
+        client.check_establishment(cnes, "UBS SEM CADASTRO")
+
+def test_unexpected_content(client):
+    with pytest.raises(CnesHttpError):
+        client.check_establishment("6000000", "UBS SEM CADASTRO")
+
+@pytest.fixture
+def browser(monkeypatch, client):
+    """
+    Use the HTTP backend with the test client, and replace the browser by a stub that lists its checks.
+    """
+    checks = []
+
+    def check_establishment_online(cnes, establishment_name, valid_cnes):
+        checks.append(cnes)
+        return VERDICT_152, False
+    monkeypatch.setattr(establishment_validator, "_lookup_backend", "http")
+    monkeypatch.setattr(establishment_validator, "get_http_client", lambda: client)
+    monkeypatch.setattr(establishment_validator, "check_establishment_online", check_establishment_online)
+    return checks
+
+def test_http_backend(browser):
+    assert establishment_validator.lookup_establishment_online("2000101", "UBS 2000101") == (VERDICT_159_152, False)
+    assert browser == []
+
+@pytest.mark.parametrize("cnes", ["5000000", "6000000", "8000000"])
+def test_browser_fallback(browser, cnes):
+    assert establishment_validator.lookup_establishment_online(cnes, "UBS SEM CADASTRO") == (VERDICT_152, False)
+    assert browser == [cnes]
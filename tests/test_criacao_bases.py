@@ -0,0 +1,48 @@
+import os
+import sys
+import sqlite3
+import pytest
+from establishment_index import read_establishment_index, SERVICE_159, SERVICE_152, SERVICE_OTHER
+from conftest import SERVICES
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "databases"))
+from criacao_bases import construir_bases
+
+def write_services_csv(path, rows):
+    with open(path, mode="w", encoding="ISO-8859-1", newline="") as file:
+        file.write("CO_UNIDADE;CO_SERVICO;CO_CLASSIFICACAO\r\n")
+        file.write("".join(f"{unit};{service};001\r\n" for unit, service in rows))
+
+def test_build_matches_the_services_csv(tmp_path):
+    rows = [(key, code) for key, codes in SERVICES.items() for code in codes]
+    # Repeated pairs, lines without a numeric service and a short line are dropped.
+    rows += [("3550302000259", 159), ("3550302000259", 100), ("4106902000500", ""), ("4106902000500", "X")]
+    csv_path = str(tmp_path / "rlEstabServClass202411.csv")
+    write_services_csv(csv_path, rows)
+    with open(csv_path, mode="a", encoding="ISO-8859-1") as file:
+        file.write("4106902000600\r\n")
+    construir_bases("202411", csv_path, str(tmp_path))
+
+    with sqlite3.connect(str(tmp_path / "estabelecimentos_202411.db")) as connection:
+        pairs = sorted(connection.execute("SELECT CO_UNIDADE, CO_SERVICO FROM tabela_dados"))
+    assert pairs == sorted({(key, code) for key, codes in SERVICES.items() for code in codes}
+                           | {("3550302000259", 100)})
+    with sqlite3.connect(str(tmp_path / "estab_202411_159_152.db")) as connection:
+        assert sorted(row[0] for row in connection.execute("SELECT valor FROM serv159152")) == [
+            "3304552000110", "3550302000259", "5300102000101"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    index = read_establishment_index(str(tmp_path), "202411", use_snapshot=False)
+    assert index.services("3550302000259") == SERVICE_159
+    assert index.services("3304552000110") == SERVICE_152
+    assert index.services("5300102000101") == SERVICE_159 | SERVICE_152
+    assert index.services("5300102000027") == SERVICE_OTHER
+    assert index.services("4106902000500") is None
+
+def test_missing_columns(tmp_path):
+    csv_path = str(tmp_path / "rlEstabServClass202411.csv")
+    with open(csv_path, mode="w", encoding="ISO-8859-1") as file:
+        file.write("CO_UNIDADE;CO_CLASSIFICACAO\n3550302000259;001\n")
+    with pytest.raises(ValueError, match="CO_SERVICO"):
+        construir_bases("202411", csv_path, str(tmp_path))
+    assert not os.path.exists(tmp_path / "estabelecimentos_202411.db")
@@ -0,0 +1,69 @@
+import os
+import pytest
+from conftest import run_main, folder_contents, UNLISTED
+from deferred_queue import DeferredQueue, DEFERRED_QUEUE_NAME
+from lookup_cache import VERDICT_159
+import report_generator
+
+def queue_path():
+    return os.path.join(report_generator.get_report_dir(), DEFERRED_QUEUE_NAME)
+
+def test_failed_checks_stay_deferred(monkeypatch, databases, assets, online_verdicts):
+    run_main(monkeypatch, assets, "--offline")
+    queue = DeferredQueue(queue_path())
+    assert list(map(os.path.basename, queue.files)) == ["prof004.csv"]
+    assert queue.establishments() == [("".join(UNLISTED), UNLISTED[1], f"UBS {UNLISTED[1]}")]
+    waiting = folder_contents(assets)["prof004.csv"]
+
+    # Every attempt fails: the file keeps its provisional result and stays in the queue, untouched.
+    online_verdicts[UNLISTED[1]] = OSError("CNES website unavailable")
+    report = run_main(monkeypatch, assets, "--resolve-deferred", "--lookup-retries", "0")
+    assert "prof004;Not eligible;33.0;0;3;0" in report.splitlines()
+    assert len(DeferredQueue(queue_path())) == 1
+    assert folder_contents(assets)["prof004.csv"] == waiting
+
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    report = run_main(monkeypatch, assets, "--resolve-deferred")
+    assert "prof004;Eligible;0;8;0;0" in report.splitlines()
+    assert not os.path.exists(queue_path())
+    assert folder_contents(assets)["prof004.csv"] != waiting
+
+def test_queue_round_trip(tmp_path):
+    path = str(tmp_path / DEFERRED_QUEUE_NAME)
+    queue = DeferredQueue(path)
+    queue.defer("a.csv", None, [("1", "1", "UBS 1"), ("2", "2", "UBS 2")])
+    queue.defer("b.csv", "out/b.csv", [("2", "2", "UBS 2")])
+    queue.save()
+    queue = DeferredQueue(path)
+    assert queue.files["b.csv"]["output"] == "out/b.csv"
+    assert queue.establishments() == [("1", "1", "UBS 1"), ("2", "2", "UBS 2")]
+    queue.discard("a.csv")
+    queue.discard("b.csv")
+    queue.save()
+    assert not os.path.exists(path)
+
+def test_offline_errors_skip_only_their_file(monkeypatch, databases, assets, online_verdicts):
+    import main
+    score_offline = main.score_offline
+
+    def failing_score_offline(file_path, *args):
+        if file_path.endswith("prof001.csv"):
+            raise PermissionError(f"Permission denied: '{file_path}'")
+        return score_offline(file_path, *args)
+
+    monkeypatch.setattr(main, "score_offline", failing_score_offline)
+    report = run_main(monkeypatch, assets, "--offline")
+    assert sorted(line.split(";")[0] for line in report.splitlines()[1:]) == ["prof002", "prof003", "prof004"]
+    assert list(map(os.path.basename, DeferredQueue(queue_path()).files)) == ["prof004.csv"]
+
+def test_deferred_queue_is_saved_when_the_run_stops(monkeypatch, databases, assets, online_verdicts):
+    defer = DeferredQueue.defer
+
+    def interrupted_defer(self, *args):
+        defer(self, *args)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(DeferredQueue, "defer", interrupted_defer)
+    with pytest.raises(KeyboardInterrupt):
+        run_main(monkeypatch, assets, "--offline")
+    assert list(map(os.path.basename, DeferredQueue(queue_path()).files)) == ["prof004.csv"]
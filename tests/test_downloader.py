@@ -0,0 +1,119 @@
+import os
+import threading
+import http.server
+import pytest
+
+pytest.importorskip("urllib3")
+
+import downloader
+import report_generator
+from downloader import download_histories, JOURNAL_NAME
+from conftest import HEADER, HISTORIES, UNLISTED, folder_contents
+from lookup_cache import VERDICT_159
+
+# History served for each CPF of the download list.
+DOWNLOADS = {"00000000001": "prof002.csv", "00000000002": "prof004.csv"}
+
+class HistoryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        name = DOWNLOADS.get(self.path.strip("/"))
+        data = "\r\n".join([HEADER] + HISTORIES[name]).encode("utf-8") if name else b""
+        self.send_response(200 if name else 404)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def history_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HistoryHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def download(history_server, databases, online_verdicts, tmp_path):
+    """
+    Download the histories of DOWNLOADS into a fresh assets folder, returning the counts of download_histories.
+    """
+    download_list = tmp_path / "hist_to_download.csv"
+    download_list.write_text("".join(f"{cpf};PROFESSIONAL {cpf}\n" for cpf in DOWNLOADS))
+    url_template = f"http://127.0.0.1:{history_server.server_address[1]}/{{cpf}}"
+    assets_dir = str(tmp_path / "downloads")
+
+    def run(**options):
+        return download_histories(str(download_list), assets_dir, url_template, concurrency=2, retries=0, **options)
+    run.assets_dir = assets_dir
+    return run
+
+def report_lines():
+    with open(report_generator.report_path(), mode="r", encoding="utf-8") as file:
+        return sorted(file.read().splitlines()[1:])
+
+def histories(assets_dir):
+    contents = folder_contents(assets_dir)
+    contents.pop(JOURNAL_NAME)
+    return contents
+
+EXPECTED = ["00000000001;Eligible;0;5;5;0", "00000000002;Eligible;0;8;0;0"]
+
+def test_histories_are_processed_once(download, history_server, online_verdicts):
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    assert download(process=True) == {"downloaded": 2, "skipped": 0, "failed": 0, "processed": 0}
+    assert report_lines() == EXPECTED
+    filtered = histories(download.assets_dir)
+
+    # The histories were rewritten in place: the next run neither downloads nor filters them again.
+    history_server.requests.clear()
+    online_verdicts["calls"].clear()
+    assert download(process=True) == {"downloaded": 0, "skipped": 2, "failed": 0, "processed": 2}
+    assert (history_server.requests, online_verdicts["calls"]) == ([], [])
+    assert histories(download.assets_dir) == filtered
+
+    download(process=True, reprocess=True)
+    assert report_lines() == EXPECTED
+
+def test_downloads_kept_with_an_output_folder(download, online_verdicts, tmp_path):
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    output_dir = str(tmp_path / "filtered")
+    os.makedirs(output_dir)
+    download(process=True, output_dir=output_dir)
+    downloaded = histories(download.assets_dir)
+    assert download(process=True, output_dir=output_dir)["processed"] == 0
+    assert report_lines() == EXPECTED
+    assert histories(download.assets_dir) == downloaded
+
+def test_failed_checks_download_again(download, history_server, online_verdicts):
+    online_verdicts[UNLISTED[1]] = RuntimeError("CNES is unavailable")
+    download(process=True)
+    assert report_lines() == ["00000000001;Eligible;0;5;5;0", "00000000002;Not eligible;33.0;0;3;0"]
+
+    history_server.requests.clear()
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    assert download(process=True) == {"downloaded": 1, "skipped": 1, "failed": 0, "processed": 1}
+    assert history_server.requests == ["/00000000002"]
+    assert report_lines() == EXPECTED[1:]
+
+def test_processing_errors_download_again(monkeypatch, download, history_server, online_verdicts):
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    process_csv = downloader.process_csv
+
+    def failing_process_csv(file_path, *args):
+        if file_path.endswith("00000000002.csv"):
+            raise PermissionError(f"Permission denied: {file_path}")
+        return process_csv(file_path, *args)
+    monkeypatch.setattr(downloader, "process_csv", failing_process_csv)
+    assert download(process=True) == {"downloaded": 2, "skipped": 0, "failed": 1, "processed": 0}
+    assert report_lines() == EXPECTED[:1]
+
+    monkeypatch.setattr(downloader, "process_csv", process_csv)
+    history_server.requests.clear()
+    assert download(process=True) == {"downloaded": 1, "skipped": 1, "failed": 0, "processed": 1}
+    assert history_server.requests == ["/00000000002"]
+    assert report_lines() == EXPECTED[1:]
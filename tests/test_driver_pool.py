@@ -0,0 +1,81 @@
+import pytest
+from driver_pool import DriverPool
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.quits = 0
+
+    def quit(self):
+        self.quits += 1
+
+@pytest.fixture
+def drivers():
+    """
+    Factory of fake browser sessions, numbered in creation order. The sessions created are listed in "created".
+    """
+    created = []
+
+    def factory():
+        driver = FakeDriver(len(created))
+        created.append(driver)
+        return driver
+    factory.created = created
+    return factory
+
+def use(pool):
+    with pool.session() as driver:
+        return driver
+
+def test_sessions_are_reused(drivers):
+    pool = DriverPool(size=2, max_uses=10, factory=drivers)
+    assert [use(pool).number for _ in range(5)] == [0] * 5
+    assert drivers.created[0].quits == 0
+    assert pool.metrics()["sessions_created"] == 1
+    assert pool.metrics()["acquisitions"] == 5
+
+def test_sessions_are_recycled_after_max_uses(drivers):
+    pool = DriverPool(size=1, max_uses=2, factory=drivers)
+    assert [use(pool).number for _ in range(5)] == [0, 0, 1, 1, 2]
+    assert [driver.quits for driver in drivers.created] == [1, 1, 0]
+    assert pool.metrics()["recycles"] == 2
+
+def test_sessions_are_recycled_after_an_error(drivers):
+    pool = DriverPool(size=1, max_uses=10, factory=drivers)
+    assert use(pool).number == 0
+    with pytest.raises(RuntimeError):
+        with pool.session():
+            raise RuntimeError("page did not load")
+    assert drivers.created[0].quits == 1
+    assert use(pool).number == 1
+    assert pool.metrics()["recycles"] == 1
+
+def test_concurrent_sessions_get_their_own_driver(drivers):
+    pool = DriverPool(size=2, max_uses=10, factory=drivers)
+    with pool.session() as first, pool.session() as second:
+        assert first is not second
+    assert use(pool) in (first, second)
+    assert pool.metrics()["sessions_created"] == 2
+
+def test_failed_startup_releases_the_slot(drivers):
+    failures = []
+
+    def factory():
+        if not failures:
+            failures.append(True)
+            raise OSError("chromedriver not found")
+        return drivers()
+    pool = DriverPool(size=1, max_uses=10, factory=factory)
+    with pytest.raises(OSError):
+        use(pool)
+    assert use(pool).number == 0
+
+def test_close_quits_the_idle_sessions(drivers):
+    pool = DriverPool(size=2, max_uses=10, factory=drivers)
+    with pool.session():
+        with pool.session() as in_use:
+            pass
+        pool.close()
+        assert in_use.quits == 1
+    assert [driver.quits for driver in drivers.created] == [1, 1]
+    assert pool.metrics()["recycles"] == 0
@@ -0,0 +1,55 @@
+import sqlite3
+import establishment_history
+import establishment_snapshot
+from establishment_history import EstablishmentHistory, competencia_month
+from establishment_index import VALID, INVALID, NOT_FOUND, SERVICE_159, SERVICE_152, SERVICE_OTHER
+from conftest import write_databases, SERVICES
+
+# At 202410, 5300102000027 offered the service 159 and 3304552000110 was not listed yet.
+EARLIER = dict(SERVICES, **{"5300102000027": (159,)})
+del EARLIER["3304552000110"]
+
+def add(store, databases_dir, competencia):
+    establishment_history.main(["--store", store, "add", competencia, "--databases-dir", databases_dir])
+
+def test_history_stores_the_changes_only(tmp_path):
+    databases_dir = str(tmp_path / "databases")
+    write_databases(databases_dir, "202410", EARLIER)
+    write_databases(databases_dir, "202411")
+    # A snapshot of the competência must not keep the databases from being read.
+    establishment_snapshot.main(["--competencia", "202411", "--databases-dir", databases_dir])
+    store = str(tmp_path / "estab_history.db")
+    add(store, databases_dir, "202410")
+    add(store, databases_dir, "202411")
+
+    with sqlite3.connect(store) as connection:
+        changes = dict(connection.execute("SELECT competencia, changes FROM competencias"))
+    assert changes == {"202410": len(EARLIER), "202411": 2}
+
+    history = EstablishmentHistory.load(store)
+    october, november = competencia_month("202410"), competencia_month("202411")
+    assert history.services("5300102000027", october) == SERVICE_159
+    assert history.services("5300102000027", november) == SERVICE_OTHER
+    assert history.services("3304552000110", october) is None
+    assert history.services("3304552000110", november) == SERVICE_152
+    # Months before the first competência use the first one.
+    assert history.classify("5300102000027", october - 24) == VALID
+    assert history.classify("5300102000027", november) == INVALID
+    assert history.classify("3304552000110", october) == NOT_FOUND
+    assert history.classify("3304552000110", november, accepted=SERVICE_159) == INVALID
+
+def test_csv_and_databases_give_the_same_masks(tmp_path):
+    # 3550302000259 also offers the service 100, which only the CSV lists next to the 159.
+    databases_dir = write_databases(str(tmp_path / "databases"), "202411")
+    write_databases(databases_dir, "202501")
+    csv_path = tmp_path / "rlEstabServClass202411.csv"
+    rows = [f"{key};{code}" for key, codes in SERVICES.items() for code in codes] + ["3550302000259;100"]
+    csv_path.write_text("\n".join(["CO_UNIDADE;CO_SERVICO"] + rows) + "\n", encoding="ISO-8859-1")
+    store = str(tmp_path / "estab_history.db")
+    add(store, databases_dir, "202411")
+    establishment_history.main(["--store", store, "add", "202412", "--csv", str(csv_path)])
+    add(store, databases_dir, "202501")
+
+    with sqlite3.connect(store) as connection:
+        changes = dict(connection.execute("SELECT competencia, changes FROM competencias"))
+    assert changes == {"202411": len(SERVICES), "202412": 0, "202501": 0}
@@ -0,0 +1,30 @@
+import os
+import sqlite3
+from establishment_index import (read_establishment_index, VALID, INVALID, NOT_FOUND, SERVICE_159, SERVICE_152,
+                                 SERVICE_OTHER)
+from establishment_validator import classify_establishments
+from conftest import COMPETENCIA, UNLISTED
+
+KEYS = ["3550302000259", "3304552000110", "5300102000101", "5300102000027", "".join(UNLISTED)]
+
+def test_index_classifies_the_databases(databases):
+    index = read_establishment_index(databases, COMPETENCIA, use_snapshot=False)
+    assert index.classify_many(KEYS) == dict(zip(KEYS, [VALID, VALID, VALID, INVALID, NOT_FOUND]))
+    assert [index.services(key) for key in KEYS] == [SERVICE_159, SERVICE_152, SERVICE_159 | SERVICE_152,
+                                                     SERVICE_OTHER, None]
+    assert len(index) == 4
+
+def test_establishments_of_the_first_database_only_offer_the_152(databases):
+    # Listed with the services 159 or 152, but without the 159 in the services table.
+    with sqlite3.connect(os.path.join(databases, f"estab_{COMPETENCIA}_159_152.db")) as connection:
+        connection.execute("INSERT INTO serv159152 VALUES ('4106902000500')")
+    index = read_establishment_index(databases, COMPETENCIA, use_snapshot=False)
+    assert index.classify("4106902000500") == VALID
+    assert index.services("4106902000500") == SERVICE_152
+
+def test_classify_establishments(databases):
+    establishments = [("3550302000259", "2000259", "UBS 2000259"), ("5300102000027", "2000027", "UBS 2000027"),
+                      ("5300102000101", "2000101", "UBS 2000101"), ("".join(UNLISTED), UNLISTED[1], "UBS")]
+    valid_cnes, pending = classify_establishments(establishments)
+    assert valid_cnes == {"2000259": SERVICE_159, "2000101": SERVICE_159 | SERVICE_152}
+    assert pending == [("".join(UNLISTED), UNLISTED[1], "UBS")]
@@ -0,0 +1,40 @@
+import shutil
+import establishment_snapshot
+from establishment_index import read_establishment_index, SERVICE_159, SERVICE_152, SERVICE_OTHER
+from establishment_snapshot import SnapshotIndex, snapshot_path
+from conftest import COMPETENCIA, UNLISTED, write_databases
+
+def build_snapshot(databases):
+    establishment_snapshot.main(["--competencia", COMPETENCIA, "--databases-dir", databases])
+    return snapshot_path(COMPETENCIA, databases)
+
+def read_bytes(path):
+    with open(path, mode="rb") as file:
+        return file.read()
+
+def test_snapshot_matches_the_databases(databases):
+    index = read_establishment_index(databases, COMPETENCIA, use_snapshot=False)
+    snapshot = SnapshotIndex(build_snapshot(databases))
+    keys = ["3550302000259", "3304552000110", "5300102000101", "5300102000027", "".join(UNLISTED)]
+    assert snapshot.classify_many(keys) == index.classify_many(keys)
+    assert snapshot.services("3550302000259") == SERVICE_159
+    assert snapshot.services("3304552000110") == SERVICE_152
+    assert snapshot.services("5300102000101") == SERVICE_159 | SERVICE_152
+    assert snapshot.services("5300102000027") == SERVICE_OTHER
+    assert snapshot.services("".join(UNLISTED)) is None
+
+def test_rebuild_over_an_existing_snapshot(databases):
+    path = build_snapshot(databases)
+    first = read_bytes(path)
+    # The fresh snapshot is now what the index loads, but the rebuild must still read the databases.
+    assert isinstance(read_establishment_index(databases, COMPETENCIA), SnapshotIndex)
+    assert build_snapshot(databases) == path
+    assert read_bytes(path) == first
+
+def test_snapshot_of_another_competencia_is_not_used(databases):
+    # The snapshot of COMPETENCIA, copied under the name of the next competência after its databases.
+    write_databases(databases, "202412", {"3550302000259": (152,)})
+    shutil.copyfile(build_snapshot(databases), snapshot_path("202412", databases))
+    index = read_establishment_index(databases, "202412")
+    assert not isinstance(index, SnapshotIndex)
+    assert index.services("3550302000259") == SERVICE_152
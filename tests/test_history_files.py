@@ -0,0 +1,77 @@
+import os
+import gzip
+import shutil
+import tarfile
+import pytest
+from conftest import run_main, folder_contents
+from history_files import HistoryBundle, decompress
+
+def bundle_members(path):
+    """
+    Return the decompressed content of each member of a bundle, by name, in archive order.
+    """
+    with tarfile.open(path, mode="r:") as archive:
+        return [(member.name, decompress(archive.extractfile(member).read(), "gzip")) for member in archive]
+
+def test_bundle_recovers_after_a_crash(tmp_path):
+    path = str(tmp_path / "filtered.tar")
+    bundle = HistoryBundle(path, flush_every=2)
+    for number in range(1, 4):
+        bundle.add(f"assets/prof00{number}.csv", f"history {number}\r\n".encode("utf-8") * 200)
+    bundle.close()
+    with tarfile.open(path, mode="r:") as archive:
+        last = archive.getmembers()[-1]
+
+    # A crash while appending the last member leaves it cut, after the members of the previous batch.
+    with open(path, mode="r+b") as file:
+        file.truncate(last.offset_data + last.size // 2)
+
+    bundle = HistoryBundle(path, flush_every=2)
+    bundle.add("assets/prof004.csv.gz", b"history 4\r\n")
+    bundle.close()
+    assert bundle_members(path) == [
+        ("prof001.csv.gz", b"history 1\r\n" * 200),
+        ("prof002.csv.gz", b"history 2\r\n" * 200),
+        ("prof004.csv.gz", b"history 4\r\n")
+    ]
+
+def test_bundle_ignores_a_damaged_end(tmp_path):
+    path = str(tmp_path / "filtered.tar")
+    bundle = HistoryBundle(path)
+    bundle.add("prof001.csv", b"history 1\r\n")
+    bundle.close()
+    with open(path, mode="ab") as file:
+        file.write(b"\x7f" * 700)
+
+    bundle = HistoryBundle(path)
+    bundle.add("prof002.csv", b"history 2\r\n")
+    bundle.close()
+    assert bundle_members(path) == [("prof001.csv.gz", b"history 1\r\n"), ("prof002.csv.gz", b"history 2\r\n")]
+
+def sorted_lines(report):
+    return sorted(report.splitlines())
+
+@pytest.fixture
+def plain_run(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    assets_dir = shutil.copytree(assets, str(tmp_path / "plain"))
+    return run_main(monkeypatch, assets_dir), folder_contents(assets_dir)
+
+def test_compressed_histories(monkeypatch, assets, tmp_path, plain_run):
+    assets_dir = str(tmp_path / "compressed")
+    os.makedirs(assets_dir)
+    for name, content in folder_contents(assets).items():
+        with open(os.path.join(assets_dir, name + ".gz"), mode="wb") as file:
+            file.write(gzip.compress(content))
+    report, filtered = plain_run
+    assert sorted_lines(run_main(monkeypatch, assets_dir)) == sorted_lines(report)
+    assert {name[:-len(".gz")]: gzip.decompress(content)
+            for name, content in folder_contents(assets_dir).items()} == filtered
+
+def test_bundle_run(monkeypatch, assets, tmp_path, plain_run):
+    assets_dir = shutil.copytree(assets, str(tmp_path / "bundled"))
+    bundle = str(tmp_path / "filtered.tar")
+    report, filtered = plain_run
+    assert sorted_lines(run_main(monkeypatch, assets_dir, "--bundle", bundle, "--bundle-flush", "3")) == sorted_lines(report)
+    # The histories are left untouched and their filtered content goes to the bundle.
+    assert folder_contents(assets_dir) == folder_contents(assets)
+    assert {name[:-len(".gz")]: content for name, content in bundle_members(bundle)} == filtered
@@ -0,0 +1,45 @@
+import codecs
+import pytest
+import history_reader
+from history_reader import read_history_file, HistoryHeaderError
+from conftest import HEADER
+
+LINES = ["01/2020;1111111;355030;UBS São José;40;MÉDICO CLÍNICO;0", "02/2020;1111111;355030;UBS São José;30;MÉDICO CLÍNICO;0"]
+
+def read(path):
+    fieldnames, rows = read_history_file(str(path))
+    return fieldnames, list(rows)
+
+@pytest.mark.parametrize("encoding, bom", [("utf-8", b""), ("utf-8", codecs.BOM_UTF8), ("utf-16-le", codecs.BOM_UTF16_LE),
+                                           ("iso-8859-1", b"")])
+def test_encodings(tmp_path, encoding, bom):
+    path = tmp_path / "history.csv"
+    path.write_bytes(bom + "\r\n".join([HEADER] + LINES).encode(encoding))
+    fieldnames, rows = read(path)
+    assert fieldnames == HEADER.split(";")
+    assert [fields for fields, _ in rows] == [("01/2020", "1111111", "355030", "40", "MÉDICO CLÍNICO", "UBS São José"),
+                                              ("02/2020", "1111111", "355030", "30", "MÉDICO CLÍNICO", "UBS São José")]
+
+def test_quotes_after_the_first_chunk(tmp_path, monkeypatch):
+    # With chunks of a few lines, the quoted field is found after some chunks were split directly.
+    monkeypatch.setattr(history_reader, "CHUNK_SIZE", 64)
+    plain = [f"{month:02d}/2020;1111111;355030;UBS;40;MEDICO;0" for month in range(1, 13)]
+    path = tmp_path / "history.csv"
+    path.write_text("\r".join([HEADER] + plain + ['01/2021;1111111;355030;"UBS; 2\r\nandar";40;MEDICO;0', "02/2021;1"]),
+                    encoding="utf-8")
+    _, rows = read(path)
+    assert [line for _, line in rows[:12]] == [line.split(";") for line in plain]
+    assert rows[12][1] == ["01/2021", "1111111", "355030", "UBS; 2\nandar", "40", "MEDICO", "0"]
+    # Short lines are padded to the width of the header.
+    assert rows[13] == (("02/2021", "1", "", "", "", ""), ["02/2021", "1", "", "", "", "", ""])
+
+def test_missing_columns(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("COMP.;CNES;ESTABELECIMENTO\r\n01/2020;1111111;UBS\r\n", encoding="utf-8")
+    with pytest.raises(HistoryHeaderError, match="CHS AMB., DESCRICAO CBO"):
+        read_history_file(str(path))
+
+def test_empty_history(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_bytes(b"\r\n\r\n")
+    assert read(path) == (None, [])
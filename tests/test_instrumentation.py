@@ -0,0 +1,24 @@
+import pytest
+import instrumentation
+from instrumentation import enable_instrumentation, summary
+from establishment_validator import cached_verdict
+from lookup_cache import configure_lookup_cache, close_lookup_cache, get_lookup_cache, VERDICT_159
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_run", None)
+    monkeypatch.setattr(instrumentation, "_files", {})
+    enable_instrumentation()
+    return lambda: summary()["run"]["counters"]
+
+def test_cache_counters(metrics):
+    get_lookup_cache().put("1", "UBS 1", VERDICT_159, by_name=False)
+    assert cached_verdict("1", "UBS 1") == VERDICT_159
+    assert cached_verdict("2", "UBS 2") is None
+    assert metrics() == {"lookup_cache_hits": 1, "lookup_cache_misses": 1}
+
+def test_disabled_cache_counts_no_misses(metrics):
+    close_lookup_cache()
+    configure_lookup_cache(enabled=False)
+    assert cached_verdict("2", "UBS 2") is None
+    assert "lookup_cache_misses" not in metrics()
@@ -0,0 +1,38 @@
+import sqlite3
+from lookup_cache import (LookupCache, VERDICT_159, VERDICT_152, VERDICT_159_152, VERDICT_NO_SERVICE,
+                          VERDICT_NOT_LISTED, verdict_services, services_verdict)
+from establishment_index import SERVICE_159, SERVICE_152, SERVICE_OTHER, SERVICE_ONLINE, configure_competencia
+
+def test_verdicts_keep_every_service():
+    for verdict in (VERDICT_159, VERDICT_152, VERDICT_159_152, VERDICT_NO_SERVICE):
+        assert services_verdict(verdict_services(verdict)) == verdict
+    assert verdict_services(VERDICT_159_152) == SERVICE_159 | SERVICE_152 | SERVICE_ONLINE
+    assert verdict_services(VERDICT_NO_SERVICE) == 0
+    assert verdict_services(VERDICT_NOT_LISTED) == 0
+    assert services_verdict(SERVICE_152 | SERVICE_OTHER) == VERDICT_152
+
+def test_single_service_verdicts_of_an_older_cache_are_dropped(tmp_path):
+    path = str(tmp_path / "cache.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE lookups (cnes TEXT NOT NULL, establishment_name TEXT NOT NULL, "
+                           "verdict TEXT NOT NULL, competencia TEXT NOT NULL, checked_at REAL NOT NULL, "
+                           "PRIMARY KEY (cnes, establishment_name))")
+        connection.executemany("INSERT INTO lookups VALUES (?, '', ?, '202411', 1e12)",
+                               [("1", VERDICT_159), ("2", VERDICT_152), ("3", VERDICT_NO_SERVICE)])
+    cache = LookupCache(path)
+    assert [entry[:3] for entry in cache.entries()] == [("3", "", VERDICT_NO_SERVICE)]
+    cache.put("1", "UBS 1", VERDICT_159, by_name=False)
+    cache.close()
+    # The cache is only migrated once.
+    cache = LookupCache(path)
+    assert cache.get("1", "UBS 1") == VERDICT_159
+    cache.close()
+
+def test_verdicts_are_stamped_with_the_configured_competencia(tmp_path):
+    configure_competencia("202303")
+    cache = LookupCache(str(tmp_path / "cache.db"))
+    cache.put("1", "UBS 1", VERDICT_159)
+    cache.put("2", "UBS 2", VERDICT_152, competencia="202401")
+    assert [entry[3] for entry in cache.entries()] == ["202303", "202401"]
+    assert cache.purge(before_competencia="202401") == 1
+    cache.close()
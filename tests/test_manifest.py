@@ -0,0 +1,68 @@
+import os
+import json
+import pytest
+from conftest import run_main, UNLISTED
+from lookup_cache import VERDICT_159
+from manifest import MANIFEST_NAME
+
+def recorded(output_dir):
+    with open(os.path.join(output_dir, MANIFEST_NAME), encoding="utf-8") as file:
+        return sorted(json.load(file)["files"])
+
+@pytest.mark.parametrize("argv", [(), ("--workers", "2"), ("--concurrency", "2"), ("--pipeline",), ("--batch",)])
+def test_files_with_failed_checks_are_not_recorded(monkeypatch, databases, assets, tmp_path, online_verdicts, argv):
+    if "--batch" in argv:
+        pytest.importorskip("numpy")
+    output_dir = str(tmp_path / "filtered")
+    options = ["--incremental", "--output-dir", output_dir, "--lookup-retries", "0"] + list(argv)
+    online_verdicts[UNLISTED[1]] = OSError("CNES website unavailable")
+    run_main(monkeypatch, assets, *options)
+    assert recorded(output_dir) == ["prof001.csv", "prof002.csv", "prof003.csv"]
+
+    # The next run checks the establishment again and processes only prof004.
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    online_verdicts["calls"].clear()
+    report = run_main(monkeypatch, assets, *options)
+    assert online_verdicts["calls"] == [UNLISTED[1]]
+    assert "prof004;Eligible;0;8;0;0" in report.splitlines()
+    assert recorded(output_dir) == ["prof001.csv", "prof002.csv", "prof003.csv", "prof004.csv"]
+
+def test_changes_invalidate_the_manifest(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    output_dir = str(tmp_path / "filtered")
+    options = ["--incremental", "--output-dir", output_dir]
+    first = run_main(monkeypatch, assets, *options)
+    online_verdicts["calls"].clear()
+    assert run_main(monkeypatch, assets, *options) == first
+    assert online_verdicts["calls"] == []
+
+    # A changed history, or a filtered file that was removed, is processed again.
+    with open(os.path.join(assets, "prof001.csv"), mode="a", encoding="utf-8") as file:
+        file.write("01/2020;1111111;355030;UBS 1111111;10;MEDICO DA ESTRATEGIA DE SAUDE DA FAMILIA;0\r\n")
+    os.remove(os.path.join(output_dir, "prof004.csv"))
+    assert run_main(monkeypatch, assets, *options) == first
+    assert online_verdicts["calls"] == [UNLISTED[1]]
+
+    # So is every history when the CBO rules change.
+    rules = tmp_path / "cbo_rules.json"
+    rules.write_text(json.dumps([{"role": "FAMILY_DOCTOR", "terms": ["MEDICO"]}]))
+    online_verdicts["calls"].clear()
+    report = run_main(monkeypatch, assets, *options, "--cbo-rules", str(rules))
+    assert report != first
+    assert online_verdicts["calls"] == []
+
+def test_settings_invalidate_the_manifest(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    output_dir = str(tmp_path / "filtered")
+    options = ["--incremental", "--output-dir", output_dir]
+    run_main(monkeypatch, assets, *options)
+
+    # A new lookup backend, or a new format of the lookup cache, may give other verdicts.
+    online_verdicts["calls"].clear()
+    run_main(monkeypatch, assets, *options, "--lookup-backend", "http")
+    assert online_verdicts["calls"] == [UNLISTED[1]]
+    online_verdicts["calls"].clear()
+    monkeypatch.setattr("manifest.CACHE_VERSION", 2)
+    run_main(monkeypatch, assets, *options, "--lookup-backend", "http")
+    assert online_verdicts["calls"] == [UNLISTED[1]]
+    online_verdicts["calls"].clear()
+    run_main(monkeypatch, assets, *options, "--lookup-backend", "http")
+    assert online_verdicts["calls"] == []
@@ -0,0 +1,95 @@
+import json
+import shutil
+import functools
+import multiprocessing
+import concurrent.futures
+import pytest
+from conftest import run_main, folder_contents, UNLISTED
+from lookup_cache import VERDICT_159
+
+def copy_assets(assets, tmp_path, name):
+    return shutil.copytree(assets, str(tmp_path / name))
+
+def run_mode(monkeypatch, assets, tmp_path, name, *argv):
+    """
+    Run main.main() over a fresh copy of the histories, returning the lines of the report, in the order
+    they were written, and the rewritten histories. The copies list their files in the same order.
+    """
+    assets_dir = copy_assets(assets, tmp_path, name)
+    report = run_main(monkeypatch, assets_dir, *argv)
+    return report.splitlines(), folder_contents(assets_dir)
+
+def sorted_run(run):
+    """
+    A run with the lines of its report sorted, for the modes that write them as the files finish.
+    """
+    lines, histories = run
+    return [lines[0]] + sorted(lines[1:]), histories
+
+@pytest.fixture
+def serial(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    return run_mode(monkeypatch, assets, tmp_path, "serial")
+
+def test_serial_report(serial):
+    lines, histories = sorted_run(serial)
+    assert lines == [
+        "File;Status;Pending;Semesters 40;Semesters 30;Semesters 20",
+        "prof001;Eligible;0;10;0;0",
+        "prof002;Eligible;0;5;5;0",
+        "prof003;Not eligible;8.0;0;0;13",
+        "prof004;Eligible;0;8;0;0"
+    ]
+    # The lines of the generalist in the establishment without the services 159 and 152 were dropped.
+    assert b"2000027" not in histories["prof002.csv"]
+
+@pytest.mark.parametrize("argv", [("--workers", "2"), ("--concurrency", "2")])
+def test_modes_match_serial(monkeypatch, assets, tmp_path, online_verdicts, serial, argv):
+    # The results are merged in file order, so even the order of the report is the same.
+    assert run_mode(monkeypatch, assets, tmp_path, "mode", *argv) == serial
+
+def test_pipeline_matches_serial(monkeypatch, assets, tmp_path, online_verdicts, serial):
+    # The pipeline writes each line when its file is done.
+    assert sorted_run(run_mode(monkeypatch, assets, tmp_path, "pipeline", "--pipeline")) == sorted_run(serial)
+
+def test_batch_matches_serial(monkeypatch, assets, tmp_path, online_verdicts, serial):
+    pytest.importorskip("numpy")
+    assert run_mode(monkeypatch, assets, tmp_path, "batch", "--batch") == serial
+
+def test_offline_then_resolve_matches_serial(monkeypatch, assets, tmp_path, online_verdicts, serial):
+    assets_dir = copy_assets(assets, tmp_path, "offline")
+    original = folder_contents(assets_dir)
+    online_verdicts["calls"].clear()
+    provisional = run_main(monkeypatch, assets_dir, "--offline")
+    assert online_verdicts["calls"] == []
+    # prof004 waits for its establishment, counted as invalid meanwhile, and is left untouched.
+    assert "prof004;Not eligible;33.0;0;3;0" in provisional.splitlines()
+    assert folder_contents(assets_dir)["prof004.csv"] == original["prof004.csv"]
+
+    report = run_main(monkeypatch, assets_dir, "--resolve-deferred")
+    assert online_verdicts["calls"] == [UNLISTED[1]]
+    assert (report.splitlines(), folder_contents(assets_dir)) == serial
+
+def test_spawned_workers_use_the_settings(monkeypatch, assets, tmp_path, online_verdicts, serial):
+    # With these rules every doctor is a family doctor, whose lines are valid in any establishment.
+    rules = tmp_path / "cbo_rules.json"
+    rules.write_text(json.dumps([{"role": "FAMILY_DOCTOR", "terms": ["MEDICO"]}]))
+    expected = run_mode(monkeypatch, assets, tmp_path, "rules", "--cbo-rules", str(rules))
+    assert expected != serial
+
+    spawn = functools.partial(concurrent.futures.ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn"))
+    monkeypatch.setattr("main.ProcessPoolExecutor", spawn)
+    assert run_mode(monkeypatch, assets, tmp_path, "spawn", "--workers", "2", "--cbo-rules", str(rules)) == expected
+
+@pytest.mark.parametrize("argv", [(), ("--batch",)])
+def test_unwritable_file_skips_only_that_file(monkeypatch, assets, tmp_path, online_verdicts, serial, argv):
+    if argv:
+        pytest.importorskip("numpy")
+    # The filtered copy of prof002 cannot be written over a folder.
+    output_dir = tmp_path / f"filtered{len(argv)}"
+    (output_dir / "prof002.csv").mkdir(parents=True)
+    report = run_main(monkeypatch, copy_assets(assets, tmp_path, f"unwritable{len(argv)}"),
+                      "--output-dir", str(output_dir), *argv)
+    assert report.splitlines() == [line for line in serial[0] if not line.startswith("prof002")]
+    assert sorted(path.name for path in output_dir.iterdir() if path.is_file()) == ["prof001.csv", "prof003.csv",
+                                                                                   "prof004.csv"]
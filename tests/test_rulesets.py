@@ -0,0 +1,81 @@
+import json
+import shutil
+import pytest
+from conftest import run_main, folder_contents, UNLISTED
+from lookup_cache import VERDICT_159, VERDICT_152, VERDICT_159_152
+from rulesets import RuleSet, DEFAULT_RULESET
+from establishment_index import SERVICE_159, SERVICE_152, SERVICE_ONLINE
+
+RULESETS = [
+    {"name": "default"},
+    {"name": "only159", "services": [159]},
+    {"name": "only152", "services": [152], "online_services": [152]}
+]
+
+def write_rulesets(tmp_path, rulesets):
+    path = tmp_path / "rulesets.json"
+    path.write_text(json.dumps(rulesets))
+    return str(path)
+
+def test_rulesets_use_every_service_of_the_establishments(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    online_verdicts[UNLISTED[1]] = VERDICT_159_152
+    header, *lines = run_main(monkeypatch, assets, "--rulesets", write_rulesets(tmp_path, RULESETS)).splitlines()
+    assert header.split(";")[6:] == ["Status only159", "Pending only159", "Semesters 40 only159",
+                                     "Semesters 30 only159", "Semesters 20 only159", "Status only152",
+                                     "Pending only152", "Semesters 40 only152", "Semesters 30 only152",
+                                     "Semesters 20 only152"]
+    rows = {line.split(";")[0]: line.split(";")[1:] for line in lines}
+    # prof002 worked 30 months at 40h in a 159 establishment and 30 months at 30h in a 152 one.
+    assert rows["prof002"] == ["Eligible", "0", "5", "5", "0",
+                               "Not eligible", "18.0", "5", "0", "0",
+                               "Not eligible", "25.5", "0", "5", "0"]
+    # prof003 only worked in an establishment with both services, prof004 in one found on the CNES website.
+    assert rows["prof003"][5:] == rows["prof003"][:5] * 2
+    assert rows["prof004"] == ["Eligible", "0", "8", "0", "0"] * 3
+
+def test_online_services():
+    default = RuleSet(DEFAULT_RULESET)
+    assert default.accepts_services(SERVICE_152)
+    assert default.accepts_services(SERVICE_159 | SERVICE_ONLINE)
+    assert default.accepts_services(SERVICE_159 | SERVICE_152 | SERVICE_ONLINE)
+    assert not default.accepts_services(SERVICE_152 | SERVICE_ONLINE)
+    assert not RuleSet({"name": "only152", "services": [152]}).accepts_services(SERVICE_152 | SERVICE_ONLINE)
+    with pytest.raises(ValueError):
+        RuleSet({"name": "wrong", "online_services": [100]})
+
+@pytest.mark.parametrize("argv", [(), ("--workers", "2"), ("--concurrency", "2"), ("--pipeline",)])
+def test_establishments_with_152_on_the_website(monkeypatch, databases, assets, tmp_path, online_verdicts, argv):
+    # As the website check always did, the default rules only accept the 159 for an establishment found there.
+    online_verdicts[UNLISTED[1]] = VERDICT_152
+    copy = shutil.copytree(assets, str(tmp_path / "default"))
+    assert "prof004;Not eligible;33.0;0;3;0" in run_main(monkeypatch, copy, *argv).splitlines()
+
+    rulesets = write_rulesets(tmp_path, [{"name": "default", "online_services": [159, 152]}])
+    copy = shutil.copytree(assets, str(tmp_path / "opt_in"))
+    assert "prof004;Eligible;0;8;0;0" in run_main(monkeypatch, copy, "--rulesets", rulesets, *argv).splitlines()
+
+def test_establishments_with_152_on_the_website_in_batch(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    pytest.importorskip("numpy")
+    online_verdicts[UNLISTED[1]] = VERDICT_152
+    copy = shutil.copytree(assets, str(tmp_path / "152"))
+    assert "prof004;Not eligible;33.0;0;3;0" in run_main(monkeypatch, copy, "--batch").splitlines()
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    copy = shutil.copytree(assets, str(tmp_path / "159"))
+    assert "prof004;Eligible;0;8;0;0" in run_main(monkeypatch, copy, "--batch").splitlines()
+
+def test_batch_applies_the_bands_of_the_rule_set(monkeypatch, databases, assets, tmp_path, online_verdicts):
+    pytest.importorskip("numpy")
+    online_verdicts[UNLISTED[1]] = VERDICT_159
+    rulesets = write_rulesets(tmp_path, [{
+        "name": "custom", "threshold": 24,
+        "bands": [{"name": "35", "min_hours": 35, "exclusive": True},
+                  {"name": "10", "min_hours": 10, "weight": 0.25, "monthly_cap": 3}],
+        "roles": {"FAMILY_DOCTOR": "any", "CLINICIAN": "establishment"}
+    }])
+    runs = []
+    for name, argv in (("serial", ()), ("batch", ("--batch",))):
+        copy = shutil.copytree(assets, str(tmp_path / name))
+        runs.append((sorted(run_main(monkeypatch, copy, "--rulesets", rulesets, *argv).splitlines()),
+                     folder_contents(copy)))
+    assert runs[0][0][0] == "File;Status;Pending;Semesters 35;Semesters 10"
+    assert runs[1] == runs[0]
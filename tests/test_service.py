@@ -0,0 +1,54 @@
+import json
+import threading
+import http.client
+import pytest
+from service import EligibilityService, create_server
+from conftest import HEADER, HISTORIES, write_history
+
+@pytest.fixture
+def server(databases, tmp_path):
+    service = EligibilityService(str(tmp_path))
+    reloads = []
+    service.reload = lambda competencia=None: reloads.append(competencia) or {"competencia": competencia}
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, reloads
+    server.shutdown()
+    server.server_close()
+
+def post(server, path, body, content_type="application/json"):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def test_score(server):
+    content = "\r\n".join([HEADER] + HISTORIES["prof002.csv"])
+    status, result = post(server[0], "/score?online=0", content.encode("utf-8"), "text/csv")
+    assert status == 200
+    assert (result["status"], result["semesters_40"], result["semesters_30"]) == ("Eligible", 5, 5)
+
+@pytest.mark.parametrize("online", [False, "false", 0, None])
+def test_score_accepts_only_a_boolean_online(server, tmp_path, online):
+    write_history(tmp_path / "prof002.csv", HISTORIES["prof002.csv"])
+    status, result = post(server[0], "/score", json.dumps({"path": "prof002.csv", "online": online}))
+    if online is False:
+        assert (status, result["status"]) == (200, "Eligible")
+    else:
+        assert status == 400
+
+@pytest.mark.parametrize("competencia", ["../../tmp/x", "20241", "2024110", "2024-1", "٢٠٢٤١١", 202411, None])
+def test_reload_rejects_invalid_competencias(server, competencia):
+    status, result = post(server[0], "/reload", json.dumps({"competencia": competencia}))
+    if competencia is None:
+        assert (status, server[1]) == (200, [None])
+    else:
+        assert status == 400
+        assert server[1] == []
+
+def test_reload(server):
+    assert post(server[0], "/reload", json.dumps({"competencia": "202501"})) == (200, {"competencia": "202501"})
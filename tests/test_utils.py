@@ -0,0 +1,27 @@
+from datetime import datetime
+import pytest
+from utils import parse_month, parse_date
+
+@pytest.mark.parametrize("date, key", [
+    ("09/2024", 2024 * 12 + 9),
+    ("9/2024", 2024 * 12 + 9),
+    ("12/2014", 2014 * 12 + 12),
+    ("set/24", 2024 * 12 + 9),
+    ("Dez/14", 2014 * 12 + 12),
+    ("jan/00", 2000 * 12 + 1)
+])
+def test_known_formats(date, key):
+    assert parse_month(date) == key
+    # The second call is answered from the memoized keys.
+    assert parse_month(date) == key
+
+@pytest.mark.parametrize("date", ["13/2024", "00/2024", "09/24", "set/2024", "sep/24", "2024-09", "09-2024", "",
+                                  "09/٢٠٢٤", "٠٩/2024", "/2024"])
+def test_unknown_formats(date):
+    assert parse_month(date) is None
+    with pytest.raises(ValueError, match="Unknown date format"):
+        parse_date(date)
+
+def test_months_keep_their_order():
+    assert parse_month("dez/23") < parse_month("01/2024") < parse_month("fev/24")
+    assert parse_date("set/24") == parse_date("09/2024") == datetime(2024, 9, 1)